@@ -1,24 +1,207 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import asyncio
+import weakref
+import argparse
+import functools
+import threading
 import chromadb
+import numpy as np
 from chromadb.config import Settings
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.section_chunker import split_sections, LOW_VALUE_SECTIONS
+from utils.dedup import NearDuplicateIndex
+from utils.embedding_cache import CachedEmbeddingFunction
+from utils.embedding_executor import EmbeddingExecutor
+from utils.embedding_registry import registry as embedding_registry, pin_metadata, check_pin, pin_collection, mismatch_hint, EmbeddingMismatchError, MODEL_KEY, DIMENSION_KEY
+from utils.quantized_store import QuantizedVectorStore, Projection, UnsupportedFilterError, sample_embeddings
+from utils.hnsw_sweep import collection_space
+from utils.snapshot import export_collection, import_snapshot, open_snapshot
+from utils.write_buffer import WriteBehindBuffer
+from utils.bm25_index import BM25Index
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Collection metadata of topic shards, see ChromaManager.create_shard
+SHARD_OF_KEY = "shard_of"
+SHARD_TOPIC_KEY = "shard_topic"
+
+
+class SharedSlot:
+    """Holder for one piece of derived collection state, value is read and written under lock"""
+
+    __slots__ = ("lock", "value")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.value = None
+
+
+class ClientRegistry:
+    """Process-wide registry of Chroma clients and collection handles.
+
+    One PersistentClient is shared per persist directory (resolved with
+    realpath) and collection handles are cached per client, collection name and
+    embedding function. Handles are dropped when a collection is created with
+    new metadata, deleted or fails, so the next lookup fetches a fresh one.
+
+    State derived from a collection (near-duplicate, quantized and BM25 indexes) lives in
+    shared slots keyed by persist directory, collection name and kind, so every
+    manager of the process builds it once and sees the others' updates.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._collections = {}
+        self._shared = {}
+        self.counters = {
+            "clients_created": 0,
+            "client_reuses": 0,
+            "collection_hits": 0,
+            "collection_misses": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def _path_key(persist_directory):
+        return os.path.realpath(persist_directory)
+
+    def get_client(self, persist_directory):
+        key = self._path_key(persist_directory)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = chromadb.PersistentClient(path=persist_directory)
+                self._clients[key] = client
+                self.counters["clients_created"] += 1
+            else:
+                self.counters["client_reuses"] += 1
+            return client
+
+    def get_collection(self, persist_directory, collection_name, embedding_function, create=False, metadata=None):
+        path_key = self._path_key(persist_directory)
+        key = (path_key, collection_name, id(embedding_function))
+        with self._lock:
+            cached = self._collections.get(key)
+            if cached is not None and metadata is None:
+                self.counters["collection_hits"] += 1
+                return cached[1]
+
+            self.counters["collection_misses"] += 1
+            client = self.get_client(persist_directory)
+            try:
+                if create or metadata is not None:
+                    collection = client.get_or_create_collection(name=collection_name, embedding_function=embedding_function, metadata=metadata)
+                else:
+                    collection = client.get_collection(name=collection_name, embedding_function=embedding_function)
+            except ValueError as e:
+                # Chroma compares the embedding function recorded in the collection before our pin is checked
+                if "embedding function conflict" not in str(e).lower():
+                    raise
+                raise EmbeddingMismatchError(f"Collection '{collection_name}' was created with another embedding function ({e}): {mismatch_hint()}") from e
+            if metadata is not None:
+                self._invalidate(path_key, collection_name)
+            # The embedding function is kept alive with the handle so its id cannot be reused
+            self._collections[key] = (embedding_function, collection)
+            return collection
+
+    def _invalidate(self, path_key, collection_name=None):
+        stale = [key for key in self._collections if key[0] == path_key and (collection_name is None or key[1] == collection_name)]
+        for key in stale:
+            del self._collections[key]
+        if stale:
+            self.counters["invalidations"] += len(stale)
+
+    def invalidate(self, persist_directory, collection_name=None):
+        with self._lock:
+            self._invalidate(self._path_key(persist_directory), collection_name)
+
+    def shared(self, persist_directory, collection_name, kind):
+        """SharedSlot for the derived state kind (a tuple, e.g. ("dedup", 0.85)) of a collection"""
+        key = (self._path_key(persist_directory), collection_name, kind)
+        with self._lock:
+            slot = self._shared.get(key)
+            if slot is None:
+                slot = self._shared[key] = SharedSlot()
+            return slot
+
+    def shared_slots(self, persist_directory, collection_name, kind_prefix=()):
+        """Existing slots of a collection whose kind starts with kind_prefix"""
+        path_key = self._path_key(persist_directory)
+        with self._lock:
+            return [slot for (slot_path, slot_collection, kind), slot in self._shared.items()
+                    if slot_path == path_key and slot_collection == collection_name and kind[:len(kind_prefix)] == kind_prefix]
+
+    def drop_shared(self, persist_directory, collection_name, kind_prefix=()):
+        # Values are cleared instead of removing the slots, a caller holding a slot cannot resurrect a dropped value elsewhere
+        for slot in self.shared_slots(persist_directory, collection_name, kind_prefix):
+            with slot.lock:
+                slot.value = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "open_clients": len(self._clients),
+                "cached_collections": len(self._collections),
+                "shared_states": sum(1 for slot in self._shared.values() if slot.value is not None),
+            }
+
+
+registry = ClientRegistry()
+
 
 class ChromaManager:
-    def __init__(self, persist_directory="./chroma_db"):
+    def __init__(self, persist_directory="./chroma_db", embedding_function=None, dedup_threshold=0.85, embedding_cache=None, embedding_concurrency=1, embedding_batch_size=32):
         self.persist_directory = persist_directory
         self.client = None
+        # One embedding function per process unless a caller brings its own, see utils.embedding_registry
+        self.embedding_function = embedding_function or embedding_registry.get()
+        self.embedding_model = embedding_registry.model_for(self.embedding_function)
+        self.embedding_cache = embedding_cache
+        if embedding_cache is not None:
+            self.embedding_function = CachedEmbeddingFunction(self.embedding_function, embedding_cache)
+        # Chunks are embedded here instead of implicitly inside collection.add so batching and concurrency are controlled
+        self.embedding_executor = EmbeddingExecutor(self.embedding_function, max_concurrency=embedding_concurrency, batch_size=embedding_batch_size)
+        self.dedup_threshold = dedup_threshold
+        self._shard_pools = {}
+        self._shard_lock = threading.Lock()
         
     def connect(self):
         try:
-            self.client = chromadb.PersistentClient(path=self.persist_directory)
+            self.client = registry.get_client(self.persist_directory)
             return True
         except Exception as e:
             raise
     
+    def get_collection(self, collection_name, create=False, metadata=None):
+        return registry.get_collection(self.persist_directory, collection_name, self.embedding_function, create=create, metadata=metadata)
+
+    def delete_collection(self, collection_name):
+        try:
+            self.client.delete_collection(name=collection_name)
+            logger.info(f"Deleted collection '{collection_name}'")
+        finally:
+            registry.invalidate(self.persist_directory, collection_name)
+            registry.drop_shared(self.persist_directory, collection_name, ("dedup",))
+            registry.drop_shared(self.persist_directory, collection_name, ("centroid",))
+            # Kept but stale, a dropped entry would reload the copy on disk when the new collection has the same size
+            self._mark_quantized_stale(collection_name)
+            self.drop_bm25_index(collection_name)
+
+    @staticmethod
+    def registry_stats():
+        return registry.stats()
+
     def list_collections(self):
         try:
             collections = self.client.list_collections()
@@ -29,16 +212,37 @@ class ChromaManager:
             logger.error(f"Failed to list collections: {e}")
             return []
 
-    def create_publications_collection(self, collection_name="scientific_publications", distance_metric="l2", drop_if_exists=False):
+    def create_publications_collection(self, collection_name="scientific_publications", distance_metric="l2", drop_if_exists=False, hnsw_m=None, construction_ef=None, search_ef=None, batch_size=None, sync_threshold=None, extra_metadata=None):
+        # The HNSW build parameters only take effect when the collection is created, use drop_if_exists to rebuild
         try:
-            collection = self.client.get_or_create_collection(
-                name=collection_name,
-                metadata={
-                    "hnsw:space": distance_metric,
-                    "description": f"Collection for scientific publications"
-                }
+            if drop_if_exists and collection_name in self.list_collections():
+                self.delete_collection(collection_name)
+            
+            metadata = {
+                "hnsw:space": distance_metric,
+                "description": f"Collection for scientific publications"
+            }
+            hnsw_params = {
+                "hnsw:M": hnsw_m,
+                "hnsw:construction_ef": construction_ef,
+                "hnsw:search_ef": search_ef,
+                "hnsw:batch_size": batch_size,
+                "hnsw:sync_threshold": sync_threshold,
+            }
+            metadata.update({key: value for key, value in hnsw_params.items() if value is not None})
+            metadata.update(extra_metadata or {})
+            
+            collection = registry.get_collection(
+                self.persist_directory,
+                collection_name,
+                self.embedding_function,
+                metadata=pin_metadata(metadata, self.embedding_model)
             )
             
+            pinned_model = (collection.metadata or {}).get(MODEL_KEY)
+            if pinned_model is not None and pinned_model != self.embedding_model:
+                raise EmbeddingMismatchError(f"Collection '{collection_name}' holds '{pinned_model}' embeddings but this process embeds with '{self.embedding_model}': {mismatch_hint(pinned_model)}")
+            
             logger.info(f"Created/Retrieved collection '{collection_name}' with {distance_metric} distance metric")
             logger.info(f"Metadata fields: paper_id, title, authors, year, journal, abstract")
             
@@ -48,9 +252,27 @@ class ChromaManager:
             logger.error(f"Failed to create collection: {e}")
             raise
     
+    def update_search_params(self, collection_name, search_ef=None, batch_size=None, sync_threshold=None):
+        """Change the HNSW parameters that can be tuned on an existing collection.
+
+        The new values are stored in the collection configuration, an index that
+        is already loaded keeps the old ones until the process is restarted.
+        """
+        params = {"ef_search": search_ef, "batch_size": batch_size, "sync_threshold": sync_threshold}
+        params = {key: value for key, value in params.items() if value is not None}
+        if not params:
+            return
+        
+        try:
+            collection = self.get_collection(collection_name)
+            collection.modify(configuration={"hnsw": params})
+            logger.info(f"Updated HNSW parameters of '{collection_name}': {params}")
+        finally:
+            registry.invalidate(self.persist_directory, collection_name)
+
     def get_collection_info(self, collection_name):
         try:
-            collection = self.client.get_collection(name=collection_name)
+            collection = self.get_collection(collection_name)
             count = collection.count()
             
             info = {
@@ -67,8 +289,108 @@ class ChromaManager:
             
         except Exception as e:
             logger.error(f"Failed to get collection info: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
             return {}
 
+    def _scan_collection(self, collection_name, include, batch_size=1000):
+        collection = self.get_collection(collection_name)
+        offset = 0
+        while True:
+            batch = collection.get(include=include, limit=batch_size, offset=offset)
+            if not batch['ids']:
+                return
+            yield batch
+            offset += len(batch['ids'])
+
+    def collection_stats(self, collection_name):
+        """Chunk count, papers, stored bytes and average chunks per paper of a collection.
+        Bytes are the UTF-8 documents, the JSON metadata and float32 embeddings, not the index overhead."""
+        try:
+            collection = self.get_collection(collection_name)
+            chunks_per_paper = {}
+            chunks = 0
+            unowned = 0
+            document_bytes = 0
+            metadata_bytes = 0
+            for batch in self._scan_collection(collection_name, include=["documents", "metadatas"]):
+                for document, metadata in zip(batch['documents'], batch['metadatas']):
+                    chunks += 1
+                    document_bytes += len((document or "").encode("utf-8"))
+                    metadata_bytes += len(json.dumps(metadata or {}, ensure_ascii=False).encode("utf-8"))
+                    base_id = (metadata or {}).get('base_id')
+                    if base_id:
+                        chunks_per_paper[base_id] = chunks_per_paper.get(base_id, 0) + 1
+                    else:
+                        unowned += 1
+            
+            dimension = (collection.metadata or {}).get(DIMENSION_KEY)
+            if dimension is None and chunks:
+                dimension = len(collection.peek(limit=1)['embeddings'][0])
+            embedding_bytes = chunks * (dimension or 0) * 4
+            
+            return {
+                "name": collection_name,
+                "chunks": chunks,
+                "papers": len(chunks_per_paper),
+                "chunks_without_paper": unowned,
+                "avg_chunks_per_paper": sum(chunks_per_paper.values()) / len(chunks_per_paper) if chunks_per_paper else 0.0,
+                "max_chunks_per_paper": max(chunks_per_paper.values(), default=0),
+                "document_bytes": document_bytes,
+                "metadata_bytes": metadata_bytes,
+                "embedding_bytes": embedding_bytes,
+                "bytes": document_bytes + metadata_bytes + embedding_bytes,
+                "embedding_model": (collection.metadata or {}).get(MODEL_KEY),
+                "dimension": dimension,
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to compute stats of '{collection_name}': {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            return {}
+
+    def find_orphan_chunks(self, collection_name, referenced_base_ids, candidate_base_ids=None):
+        """Ids of chunks whose paper is not in referenced_base_ids. With candidate_base_ids only
+        papers in that set count as orphans, so papers the caller knows nothing about are kept.
+        Chunks without base_id are never reported, neither are chunks that also stand in for a
+        referenced paper through duplicate_sources."""
+        referenced_base_ids = set(referenced_base_ids)
+        orphans = []
+        for batch in self._scan_collection(collection_name, include=["metadatas"]):
+            for chunk_id, metadata in zip(batch['ids'], batch['metadatas']):
+                metadata = metadata or {}
+                base_id = metadata.get('base_id')
+                if not base_id or base_id in referenced_base_ids:
+                    continue
+                if candidate_base_ids is not None and base_id not in candidate_base_ids:
+                    continue
+                duplicate_sources = set(filter(None, (metadata.get('duplicate_sources') or '').split(',')))
+                if duplicate_sources & referenced_base_ids:
+                    continue
+                orphans.append(chunk_id)
+        return orphans
+
+    def delete_orphan_chunks(self, collection_name, referenced_base_ids, candidate_base_ids=None, batch_size=500, dry_run=False):
+        """Delete the chunks reported by find_orphan_chunks in batches, returns a summary"""
+        orphans = self.find_orphan_chunks(collection_name, referenced_base_ids, candidate_base_ids)
+        papers = set()
+        if orphans:
+            collection = self.get_collection(collection_name)
+            for offset in range(0, len(orphans), batch_size):
+                batch = orphans[offset:offset + batch_size]
+                papers.update((metadata or {}).get('base_id') for metadata in collection.get(ids=batch, include=["metadatas"])['metadatas'])
+                if not dry_run:
+                    self.delete_documents(collection_name, batch)
+        
+        logger.info(f"{'Found' if dry_run else 'Deleted'} {len(orphans)} orphan chunks of {len(papers)} papers in '{collection_name}'")
+        
+        return {
+            "collection": collection_name,
+            "orphan_chunks": len(orphans),
+            "orphan_papers": len(papers),
+            "deleted_chunks": 0 if dry_run else len(orphans),
+            "dry_run": dry_run,
+        }
+
     def chunk_text(self, text, chunk_size=1000, chunk_overlap=200, separators=None):
         if separators is None:
             separators = ["\n\n", "\n", " ", ""]
@@ -85,6 +407,24 @@ class ChromaManager:
         
         return chunks
 
+    def chunk_sections(self, text, chunk_size=1000, chunk_overlap=200, skip_sections=LOW_VALUE_SECTIONS):
+        section_chunks = []
+        skipped = []
+        
+        for section, section_text in split_sections(text):
+            if section in skip_sections:
+                skipped.append(section)
+                continue
+            for chunk in self.chunk_text(section_text, chunk_size, chunk_overlap):
+                section_chunks.append((section, chunk))
+        
+        if not section_chunks:
+            section_chunks = [("body", chunk) for chunk in self.chunk_text(text, chunk_size, chunk_overlap)]
+        
+        logger.info(f"Split text into {len(section_chunks)} section chunks (skipped sections: {skipped or 'none'})")
+        
+        return section_chunks
+
     def chunk_documents(self, documents, chunk_size=1000, chunk_overlap=200):
         all_chunks = []
         
@@ -100,56 +440,367 @@ class ChromaManager:
     def add_documents(self, collection_name, documents, metadatas, ids, embeddings=None):
         try:
             # Get or create collection if it doesn't exist
-            collection = self.client.get_or_create_collection(name=collection_name)
-            
-            if embeddings:
-                collection.add(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids,
-                    embeddings=embeddings
-                )
-            else:
-                collection.add(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+            collection = self.get_collection(collection_name, create=True)
+            
+            if not embeddings:
+                embeddings = self.embed_texts(documents)
+            self._check_embedding_pin(collection_name, collection, embeddings)
+            collection.add(
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings
+            )
             
             logger.info(f"Added {len(documents)} documents to '{collection_name}'")
+            self._mark_quantized_stale(collection_name)
+            self._update_bm25(collection_name, ids, documents, metadatas, replace=False)
             
         except Exception as e:
             logger.error(f"Failed to add documents: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
             raise
 
-    def add_chunked_documents(self, collection_name, documents, metadatas, base_ids, chunk_size=1000, chunk_overlap=200):
+    def upsert_documents(self, collection_name, documents, metadatas, ids, embeddings=None):
+        try:
+            collection = self.get_collection(collection_name, create=True)
+            
+            if embeddings is None:
+                embeddings = self.embed_texts(documents)
+            self._check_embedding_pin(collection_name, collection, embeddings)
+            collection.upsert(
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=embeddings
+            )
+            
+            logger.info(f"Upserted {len(documents)} documents to '{collection_name}'")
+            self._mark_quantized_stale(collection_name)
+            self._update_bm25(collection_name, ids, documents, metadatas)
+            
+        except Exception as e:
+            logger.error(f"Failed to upsert documents: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            raise
+
+    def replace_documents(self, collection_name, documents, metadatas, ids, replaced_ids, embeddings=None):
+        """Delete replaced_ids, the previous chunks of the papers being rewritten, then upsert the
+        new chunks. Chroma's upsert merges metadata, so keys the new chunks no longer set (section,
+        duplicate_sources, ...) would otherwise survive on reused ids."""
+        replaced_ids = sorted(set(replaced_ids))
+        if replaced_ids:
+            previous = self.get_collection(collection_name, create=True).get(ids=replaced_ids, include=["metadatas"])['metadatas']
+            unlinked = set()
+            for metadata in previous:
+                unlinked.update(filter(None, ((metadata or {}).get('duplicate_sources') or '').split(',')))
+            if unlinked:
+                # Their near-duplicate chunks were only stored as these links, re-ingest them to restore the text
+                logger.warning(f"Rewriting chunks that also stood in for {len(unlinked)} other papers, their duplicate links are cleared: {', '.join(sorted(unlinked))}")
+            self.delete_documents(collection_name, replaced_ids, keep_registered=ids)
+        if documents:
+            self.upsert_documents(collection_name, documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+
+    def write_buffer(self, collection_name, batch_size=None, max_delay=2.0, max_pending=10000, mode="upsert"):
+        """WriteBehindBuffer that queues inserts into collection_name and writes them in batches
+        from a background thread. Call flush() or close() before relying on the data."""
+        return WriteBehindBuffer(self, collection_name, batch_size=batch_size, max_delay=max_delay, max_pending=max_pending, mode=mode)
+
+    def _check_embedding_pin(self, collection_name, collection, embeddings):
+        if len(embeddings) == 0:
+            return
+        dimension = len(embeddings[0])
+        if check_pin(collection, self.embedding_model, dimension):
+            pin_collection(collection, self.embedding_model, dimension)
+            registry.invalidate(self.persist_directory, collection_name)
+
+    def embed_texts(self, texts):
+        return self.embedding_executor.embed(texts)
+
+    def delete_documents(self, collection_name, ids, keep_registered=()):
+        """Delete chunks by id. Ids in keep_registered stay in the near-duplicate index,
+        they are about to be rewritten and were already registered with their new text."""
+        try:
+            if not ids:
+                return
+            collection = self.get_collection(collection_name)
+            collection.delete(ids=list(ids))
+            keep_registered = set(keep_registered)
+            self.release_near_duplicates(collection_name, [chunk_id for chunk_id in ids if chunk_id not in keep_registered])
+            logger.info(f"Deleted {len(ids)} documents from '{collection_name}'")
+            self._mark_quantized_stale(collection_name)
+            self._update_bm25(collection_name, ids)
+            
+        except Exception as e:
+            logger.error(f"Failed to delete documents: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            raise
+
+    def compute_content_hash(self, document, chunk_size=1000, chunk_overlap=200, chunking_strategy="recursive"):
+        # The chunking parameters are part of the hash, a re-chunked paper has to be re-embedded
+        return hashlib.sha256(f"{chunking_strategy}:{chunk_size}:{chunk_overlap}:{document}".encode("utf-8")).hexdigest()
+
+    def get_stored_chunks(self, collection_name, base_ids):
+        collection = self.get_collection(collection_name, create=True)
+        stored = {}
+        if not base_ids:
+            return stored
+        
+        existing = collection.get(where={"base_id": {"$in": list(base_ids)}}, include=["metadatas"])
+        for chunk_id, metadata in zip(existing['ids'], existing['metadatas']):
+            entry = stored.setdefault(metadata.get('base_id'), {"ids": set(), "hashes": set(), "total_chunks": None})
+            entry["ids"].add(chunk_id)
+            entry["hashes"].add(metadata.get('content_hash'))
+            entry["total_chunks"] = metadata.get('total_chunks')
+        
+        return stored
+
+    @staticmethod
+    def is_unchanged(stored_entry, content_hash):
+        return (
+            stored_entry is not None
+            and stored_entry["hashes"] == {content_hash}
+            and stored_entry["total_chunks"] == len(stored_entry["ids"])
+        )
+
+    def build_chunks(self, document, metadata, base_id, chunk_size=1000, chunk_overlap=200, content_hash=None, chunking_strategy="recursive"):
+        if chunking_strategy == "sections":
+            sections, chunks = [], []
+            for section, chunk in self.chunk_sections(document, chunk_size, chunk_overlap):
+                sections.append(section)
+                chunks.append(chunk)
+        elif chunking_strategy == "recursive":
+            chunks = self.chunk_text(document, chunk_size, chunk_overlap)
+            sections = None
+        else:
+            raise ValueError(f"Invalid chunking strategy: {chunking_strategy}. Use 'recursive' or 'sections'.")
+        
+        chunk_metadatas = []
+        chunk_ids = []
+        
+        for chunk_idx, chunk in enumerate(chunks):
+            chunk_metadata = metadata.copy()
+            chunk_metadata['chunk_index'] = chunk_idx
+            chunk_metadata['total_chunks'] = len(chunks)
+            chunk_metadata['base_id'] = base_id
+            if sections:
+                chunk_metadata['section'] = sections[chunk_idx]
+            if content_hash:
+                chunk_metadata['content_hash'] = content_hash
+            chunk_metadatas.append(chunk_metadata)
+            
+            chunk_ids.append(f"{base_id}_chunk_{chunk_idx}")
+        
+        return chunks, chunk_metadatas, chunk_ids
+
+    def _dedup_slot(self, collection_name):
+        return registry.shared(self.persist_directory, collection_name, ("dedup", self.dedup_threshold))
+
+    def _get_dedup_index(self, collection_name, batch_size=1000):
+        slot = self._dedup_slot(collection_name)
+        with slot.lock:
+            if slot.value is not None:
+                return slot.value
+            
+            # Seed the index once per process with the chunks that are already stored, every manager on this directory shares it
+            index = NearDuplicateIndex(threshold=self.dedup_threshold)
+            collection = self.get_collection(collection_name, create=True)
+            offset = 0
+            while True:
+                batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+                if not batch['ids']:
+                    break
+                for chunk_id, document, metadata in zip(batch['ids'], batch['documents'], batch['metadatas']):
+                    index.add(chunk_id, index.hasher.signature(document or ""), owner=(metadata or {}).get('base_id'))
+                offset += len(batch['ids'])
+            
+            logger.info(f"Seeded near-duplicate index for '{collection_name}' with {len(index)} chunks")
+            slot.value = index
+            return index
+
+    def drop_near_duplicates(self, collection_name, base_id, chunks, metadatas):
+        """Drop chunks that are near-identical to a stored chunk or to an earlier chunk of
+        the same paper. Kept chunks are renumbered and registered in the index.
+        Returns (chunks, metadatas, ids, duplicates) where duplicates holds a
+        (target id, chunk, metadata, signature) tuple for every chunk dropped in favour of
+        another paper's chunk. Pass them to resolve_near_duplicates right before writing."""
+        index = self._get_dedup_index(collection_name)
+        # The paper's previous chunks are about to be replaced and must not count as duplicates
+        index.remove_owner(base_id)
+        
+        own_chunks = NearDuplicateIndex(threshold=index.threshold)
+        kept = []
+        duplicates = []
+        dropped_own = 0
+        
+        for chunk, metadata in zip(chunks, metadatas):
+            signature = index.hasher.signature(chunk)
+            match = index.query(signature)
+            if match:
+                duplicates.append((match[0], chunk, metadata, signature))
+                continue
+            if own_chunks.query(signature):
+                dropped_own += 1
+                continue
+            own_chunks.add(str(len(kept)), signature)
+            kept.append((chunk, metadata, signature))
+        
+        kept_chunks, kept_metadatas, kept_ids = [], [], []
+        for chunk_idx, (chunk, metadata, signature) in enumerate(kept):
+            metadata['chunk_index'] = chunk_idx
+            metadata['total_chunks'] = len(kept)
+            chunk_id = f"{base_id}_chunk_{chunk_idx}"
+            index.add(chunk_id, signature, owner=base_id)
+            kept_chunks.append(chunk)
+            kept_metadatas.append(metadata)
+            kept_ids.append(chunk_id)
+        
+        dropped = len(chunks) - len(kept)
+        if dropped:
+            logger.info(f"Dropped {dropped} near-duplicate chunks of '{base_id}' ({dropped_own} within the paper, {dropped - dropped_own} already stored)")
+        
+        return kept_chunks, kept_metadatas, kept_ids, duplicates
+
+    def resolve_near_duplicates(self, collection_name, base_id, chunks, metadatas, ids, duplicates, pending_ids=()):
+        """Drop a near-duplicate only if the chunk that absorbed it is stored or in pending_ids, the
+        chunks written in the same call. The others, e.g. when the absorbing paper failed to upsert,
+        are put back as normal chunks of base_id. Returns (chunks, metadatas, ids, duplicate_refs,
+        restored) where duplicate_refs maps each absorbing chunk id to the base_ids it also covers
+        and restored counts the chunks appended to the end."""
+        if not duplicates:
+            return chunks, metadatas, ids, {}, 0
+        
+        pending_ids = set(pending_ids)
+        targets = {target for target, _, _, _ in duplicates} - pending_ids
+        stored = set(self.get_collection(collection_name, create=True).get(ids=sorted(targets), include=[])['ids']) if targets else set()
+        
+        duplicate_refs = {}
+        restored = []
+        for target, chunk, metadata, signature in duplicates:
+            if target in stored or target in pending_ids:
+                duplicate_refs.setdefault(target, set()).add(base_id)
+            else:
+                restored.append((chunk, metadata, signature))
+        
+        if restored:
+            index = self._get_dedup_index(collection_name)
+            chunks, metadatas, ids = list(chunks), list(metadatas), list(ids)
+            for chunk, metadata, signature in restored:
+                chunk_id = f"{base_id}_chunk_{len(ids)}"
+                metadata['chunk_index'] = len(ids)
+                index.add(chunk_id, signature, owner=base_id)
+                chunks.append(chunk)
+                metadatas.append(metadata)
+                ids.append(chunk_id)
+            for metadata in metadatas:
+                metadata['total_chunks'] = len(ids)
+            logger.warning(f"Kept {len(restored)} near-duplicate chunks of '{base_id}', the chunks they matched were never written")
+        
+        return chunks, metadatas, ids, duplicate_refs, len(restored)
+
+    def release_near_duplicates(self, collection_name, ids):
+        """Forget chunks registered by drop_near_duplicates that were never written"""
+        for slot in registry.shared_slots(self.persist_directory, collection_name, ("dedup",)):
+            with slot.lock:
+                index = slot.value
+            if index is not None:
+                index.remove(ids)
+
+    def link_duplicate_sources(self, collection_name, duplicate_refs):
+        """Record on each stored chunk which other papers contained a near-identical chunk"""
+        if not duplicate_refs:
+            return
+        
+        try:
+            collection = self.get_collection(collection_name)
+            existing = collection.get(ids=list(duplicate_refs), include=["metadatas"])
+            missing = set(duplicate_refs) - set(existing['ids'])
+            if missing:
+                logger.warning(f"Cannot link duplicate sources on {len(missing)} chunks missing from '{collection_name}'")
+            
+            updated_ids = []
+            updated_metadatas = []
+            for chunk_id, metadata in zip(existing['ids'], existing['metadatas']):
+                sources = set(filter(None, (metadata.get('duplicate_sources') or '').split(',')))
+                new_sources = duplicate_refs[chunk_id] - sources - {metadata.get('base_id')}
+                if not new_sources:
+                    continue
+                sources |= new_sources
+                metadata['duplicate_sources'] = ','.join(sorted(sources))
+                metadata['duplicate_count'] = len(sources)
+                updated_ids.append(chunk_id)
+                updated_metadatas.append(metadata)
+            
+            if updated_ids:
+                # Only duplicate_sources/duplicate_count change, the BM25 index does not keep them
+                collection.update(ids=updated_ids, metadatas=updated_metadatas)
+                logger.info(f"Linked duplicate sources on {len(updated_ids)} chunks in '{collection_name}'")
+            
+        except Exception as e:
+            logger.error(f"Failed to link duplicate sources: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            raise
+
+    def add_chunked_documents(self, collection_name, documents, metadatas, base_ids, chunk_size=1000, chunk_overlap=200, mode="add", chunking_strategy="recursive", deduplicate=False):
+        """mode="add" adds all chunks. mode="upsert" skips papers whose text hash is
+        unchanged and replaces all chunks of changed papers.
+        With deduplicate=True near-duplicate chunks are collapsed into the stored one."""
+        if mode not in ("add", "upsert"):
+            raise ValueError(f"Invalid mode: {mode}. Use 'add' or 'upsert'.")
+        
         try:
             chunked_docs = []
             chunked_metadatas = []
             chunked_ids = []
+            replaced_ids = []
+            duplicate_refs = {}
+            stats = {"added": 0, "updated": 0, "skipped": 0, "deleted_chunks": 0, "duplicate_chunks": 0}
+            
+            stored = self.get_stored_chunks(collection_name, base_ids) if mode == "upsert" else {}
             
-            for doc_idx, (doc, metadata, base_id) in enumerate(zip(documents, metadatas, base_ids)):
-                chunks = self.chunk_text(doc, chunk_size, chunk_overlap)
+            for doc, metadata, base_id in zip(documents, metadatas, base_ids):
+                content_hash = None
+                if mode == "upsert":
+                    content_hash = self.compute_content_hash(doc, chunk_size, chunk_overlap, chunking_strategy)
+                    if self.is_unchanged(stored.get(base_id), content_hash):
+                        stats["skipped"] += 1
+                        continue
                 
-                for chunk_idx, chunk in enumerate(chunks):
-                    chunked_docs.append(chunk)
-             
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata['chunk_index'] = chunk_idx
-                    chunk_metadata['total_chunks'] = len(chunks)
-                    chunk_metadata['base_id'] = base_id
-                    chunked_metadatas.append(chunk_metadata)
-                    
-                    chunked_ids.append(f"{base_id}_chunk_{chunk_idx}")
-       
-            self.add_documents(
-                collection_name=collection_name,
-                documents=chunked_docs,
-                metadatas=chunked_metadatas,
-                ids=chunked_ids
-            )
+                chunks, chunk_metadatas, chunk_ids = self.build_chunks(doc, metadata, base_id, chunk_size, chunk_overlap, content_hash, chunking_strategy)
+                if deduplicate:
+                    total = len(chunks)
+                    chunks, chunk_metadatas, chunk_ids, duplicates = self.drop_near_duplicates(collection_name, base_id, chunks, chunk_metadatas)
+                    # Chunks of earlier papers in this batch are written together with this one
+                    chunks, chunk_metadatas, chunk_ids, refs, _ = self.resolve_near_duplicates(collection_name, base_id, chunks, chunk_metadatas, chunk_ids, duplicates, pending_ids=chunked_ids)
+                    stats["duplicate_chunks"] += total - len(chunks)
+                    for chunk_id, sources in refs.items():
+                        duplicate_refs.setdefault(chunk_id, set()).update(sources)
+                chunked_docs.extend(chunks)
+                chunked_metadatas.extend(chunk_metadatas)
+                chunked_ids.extend(chunk_ids)
+                
+                if base_id in stored:
+                    stats["updated"] += 1
+                    replaced_ids.extend(stored[base_id]["ids"])
+                    stats["deleted_chunks"] += len(stored[base_id]["ids"] - set(chunk_ids))
+                else:
+                    stats["added"] += 1
+            
+            if mode == "upsert":
+                self.replace_documents(collection_name, chunked_docs, chunked_metadatas, chunked_ids, replaced_ids)
+            elif chunked_docs:
+                self.add_documents(
+                    collection_name=collection_name,
+                    documents=chunked_docs,
+                    metadatas=chunked_metadatas,
+                    ids=chunked_ids
+                )
+            
+            self.link_duplicate_sources(collection_name, duplicate_refs)
             
-            logger.info(f"Added {len(documents)} documents as {len(chunked_docs)} chunks to '{collection_name}'")
+            logger.info(f"Added {len(documents)} documents as {len(chunked_docs)} chunks to '{collection_name}' ({stats})")
+            
+            return stats
             
         except Exception as e:
             logger.error(f"Failed to add chunked documents: {e}")
@@ -157,25 +808,780 @@ class ChromaManager:
 
     def query_collection(self, collection_name, query_texts, n_results=10, where=None):
         try:
-            collection = self.client.get_collection(name=collection_name)
+            collection = self.get_collection(collection_name)
             
             results = collection.query(
-                query_texts=query_texts,
+                query_embeddings=self.embed_texts(query_texts),
                 n_results=n_results,
                 where=where
             )
             
-            logger.info(f"Found {len(results['ids'][0])} results for query")
+            logger.info(f"Found {sum(len(ids) for ids in results['ids'])} results for {len(query_texts)} queries")
             
             return results
             
         except Exception as e:
             logger.error(f"Failed to query collection: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            return {}
+
+    @staticmethod
+    def _query_grouped(collection, queries, vectors, default_n_results=10):
+        """Search already embedded queries, one call per distinct where filter. Returns the
+        per-query results in the single-query layout and the number of search calls."""
+        groups = {}
+        for position, query in enumerate(queries):
+            group_key = json.dumps(query.get('where'), sort_keys=True)
+            groups.setdefault(group_key, []).append(position)
+        
+        batch_results = [None] * len(queries)
+        for positions in groups.values():
+            where = queries[positions[0]].get('where')
+            n_results = max(queries[position].get('n_results') or default_n_results for position in positions)
+            results = collection.query(
+                query_embeddings=[vectors[queries[position]['query']] for position in positions],
+                n_results=n_results,
+                where=where
+            )
+            
+            for row, position in enumerate(positions):
+                limit = queries[position].get('n_results') or default_n_results
+                batch_results[position] = {
+                    key: [results[key][row][:limit]]
+                    for key in ('ids', 'documents', 'metadatas', 'distances')
+                    if results.get(key) is not None
+                }
+        return batch_results, len(groups)
+
+    def query_collection_batch(self, collection_name, queries, default_n_results=10):
+        """Run many queries at once. Each query is a dict with 'query' and optional
+        'n_results' and 'where'. All texts are embedded in one batch and queries that
+        share a filter are sent in one vector search call. Returns one result dict per
+        query in the single-query layout of query_collection ({'ids': [[...]], ...})."""
+        if not queries:
+            return []
+        
+        try:
+            collection = self.get_collection(collection_name)
+            
+            texts = list(dict.fromkeys(query['query'] for query in queries))
+            vectors = dict(zip(texts, self.embed_texts(texts)))
+            batch_results, search_calls = self._query_grouped(collection, queries, vectors, default_n_results)
+            
+            logger.info(f"Ran {len(queries)} queries ({len(texts)} distinct texts) in {search_calls} search calls on '{collection_name}'")
+            
+            return batch_results
+            
+        except Exception as e:
+            logger.error(f"Failed to run batched query: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            return [{} for _ in queries]
+
+    @staticmethod
+    def shard_name(collection_name, topic):
+        """Collection name of a topic shard, e.g. scientific_publications__edge_ai_3f2a9c1d"""
+        slug = re.sub(r"[^a-z0-9]+", "_", topic.lower()).strip("_")[:40].strip("_") or "topic"
+        digest = hashlib.sha256(topic.strip().lower().encode("utf-8")).hexdigest()[:8]
+        return f"{collection_name}__{slug}_{digest}"
+
+    def create_shard(self, collection_name, topic, **kwargs):
+        """Create (or get) the shard of collection_name for one topic or run, returns its collection name.
+        kwargs are passed on to create_publications_collection."""
+        name = self.shard_name(collection_name, topic)
+        self.create_publications_collection(
+            collection_name=name,
+            extra_metadata={SHARD_OF_KEY: collection_name, SHARD_TOPIC_KEY: topic.strip()},
+            **kwargs
+        )
+        return name
+
+    def list_shards(self, collection_name):
+        """Topic -> shard collection name of every shard of collection_name"""
+        try:
+            shards = {}
+            for collection in registry.get_client(self.persist_directory).list_collections():
+                metadata = collection.metadata or {}
+                if metadata.get(SHARD_OF_KEY) == collection_name:
+                    shards[metadata.get(SHARD_TOPIC_KEY) or collection.name] = collection.name
+            return shards
+        except Exception as e:
+            logger.error(f"Failed to list shards of '{collection_name}': {e}")
             return {}
 
+    def _shard_centroid(self, shard, sample_size=2000):
+        collection = self.get_collection(shard)
+        count = collection.count()
+        slot = registry.shared(self.persist_directory, shard, ("centroid",))
+        with slot.lock:
+            cached = slot.value
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        
+        sample = collection.get(include=["embeddings"], limit=sample_size)
+        if len(sample['ids']) == 0:
+            centroid = None
+        else:
+            vectors = np.asarray(sample['embeddings'], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            centroid = vectors.mean(axis=0)
+            centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+        with slot.lock:
+            slot.value = (count, centroid)
+        return centroid
+
+    def route_queries(self, collection_name, vectors, max_shards):
+        """Per query vector the max_shards shards whose sampled centroid is closest in direction"""
+        shards = list(self.list_shards(collection_name).values())
+        if len(shards) <= max_shards:
+            return [shards for _ in vectors]
+        
+        centroids = [(shard, self._shard_centroid(shard)) for shard in shards]
+        centroids = [(shard, centroid) for shard, centroid in centroids if centroid is not None]
+        if not centroids:
+            return [[] for _ in vectors]
+        matrix = np.vstack([centroid for _, centroid in centroids])
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        similarity = queries @ matrix.T
+        order = np.argsort(-similarity, axis=1)[:, :max_shards]
+        return [[centroids[column][0] for column in row] for row in order]
+
+    def _get_shard_pool(self, max_workers):
+        # One pool per size, so a later call with another max_workers is not capped by the first one
+        with self._shard_lock:
+            pool = self._shard_pools.get(max_workers)
+            if pool is None:
+                pool = self._shard_pools[max_workers] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"shard-{max_workers}")
+            return pool
+
+    def query_shards(self, collection_name, queries, topics=None, max_shards=None, default_n_results=10, max_workers=4):
+        """Federated query_collection_batch over the topic shards of collection_name.
+
+        The queries are embedded once. Each one goes to the shards of topics, or with
+        max_shards to the shards nearest to it, otherwise to every shard. Shards are
+        searched in parallel and the per-shard top-k lists are merged by distance,
+        which is comparable because all shards share one embedding model and space.
+        Result dicts carry an extra 'shards' list with the topic of each hit.
+        """
+        if not queries:
+            return []
+        
+        try:
+            shards = self.list_shards(collection_name)
+            topic_of = {name: topic for topic, name in shards.items()}
+            texts = list(dict.fromkeys(query['query'] for query in queries))
+            vectors = dict(zip(texts, self.embed_texts(texts)))
+            
+            if topics is not None:
+                wanted = [shards[topic.strip()] for topic in topics if topic.strip() in shards]
+                routes = [wanted for _ in queries]
+            elif max_shards:
+                routes = self.route_queries(collection_name, [vectors[query['query']] for query in queries], max_shards)
+            else:
+                routes = [list(shards.values()) for _ in queries]
+            
+            positions_per_shard = {}
+            for position, route in enumerate(routes):
+                for shard in route:
+                    positions_per_shard.setdefault(shard, []).append(position)
+            
+            def search(shard, positions):
+                shard_queries = [queries[position] for position in positions]
+                results, _ = self._query_grouped(self.get_collection(shard), shard_queries, vectors, default_n_results)
+                return shard, positions, results
+            
+            pool = self._get_shard_pool(max_workers)
+            futures = [pool.submit(search, shard, positions) for shard, positions in positions_per_shard.items()]
+            
+            hits = [[] for _ in queries]
+            for future in futures:
+                shard, positions, results = future.result()
+                for position, result in zip(positions, results):
+                    for chunk_id, document, metadata, distance in zip(result['ids'][0], result['documents'][0], result['metadatas'][0], result['distances'][0]):
+                        hits[position].append((distance, chunk_id, document, metadata, topic_of.get(shard, shard)))
+            
+            merged = []
+            for position, query in enumerate(queries):
+                # A paper indexed under several topics may come back from more than one shard
+                top, seen = [], set()
+                for hit in sorted(hits[position], key=lambda hit: hit[0]):
+                    if hit[1] not in seen:
+                        seen.add(hit[1])
+                        top.append(hit)
+                top = top[:query.get('n_results') or default_n_results]
+                merged.append({
+                    'ids': [[hit[1] for hit in top]],
+                    'documents': [[hit[2] for hit in top]],
+                    'metadatas': [[hit[3] for hit in top]],
+                    'distances': [[hit[0] for hit in top]],
+                    'shards': [[hit[4] for hit in top]],
+                })
+            
+            logger.info(f"Ran {len(queries)} queries over {len(positions_per_shard)} of {len(shards)} shards of '{collection_name}'")
+            
+            return merged
+            
+        except Exception as e:
+            logger.error(f"Failed to run sharded query: {e}")
+            registry.invalidate(self.persist_directory)
+            return [{} for _ in queries]
+
+    def export_snapshot(self, collection_name, path):
+        """Write the collection to a memory-mappable snapshot directory, see utils.snapshot"""
+        return export_collection(self.get_collection(collection_name), path, embedding_model=self.embedding_model)
+
+    def import_snapshot(self, path, collection_name=None, drop=False):
+        snapshot = open_snapshot(path)
+        if snapshot is None:
+            raise FileNotFoundError(f"No snapshot found at {path}")
+        return import_snapshot(self, snapshot, collection_name=collection_name, drop=drop)
+
+    def _quantized_directory(self, collection_name, dtype, projection=None):
+        name = f"{projection}_{dtype}" if projection else dtype
+        return os.path.join(self.persist_directory, "quantized", collection_name, name)
+
+    def _mark_quantized_stale(self, collection_name):
+        for slot in registry.shared_slots(self.persist_directory, collection_name, ("quantized",)):
+            with slot.lock:
+                if slot.value is not None:
+                    slot.value["stale"] = True
+
+    def fit_projection(self, collection_name, projection, refit=False):
+        """Fit (or load) the projection given as spec, e.g. 'pca64' or 'prefix128'.
+
+        The fit is stored next to the quantized stores and reused until the
+        collection has doubled in size since it was fitted, or refit is set.
+        """
+        kind, dimension = Projection.parse_spec(projection)
+        path = os.path.join(self.persist_directory, "quantized", collection_name, f"{projection}.projection.npz")
+        collection = self.get_collection(collection_name)
+        count = collection.count()
+        
+        fitted = None if refit else Projection.load(path)
+        if fitted is not None and count < 2 * max(fitted.fitted_on, 1):
+            return fitted
+        
+        sample = sample_embeddings(collection)
+        if len(sample) == 0:
+            raise ValueError(f"Collection '{collection_name}' has no embeddings to fit '{projection}' on")
+        if collection_space(collection) == "cosine":
+            sample /= np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+        fitted = Projection.fit(sample, kind, dimension)
+        fitted.fitted_on = count
+        fitted.save(path)
+        logger.info(f"Fitted {fitted.spec} on {len(sample)} embeddings of '{collection_name}' ({fitted.explained_variance:.1%} of the variance kept)")
+        return fitted
+
+    def get_quantized_store(self, collection_name, dtype="int8", recheck_seconds=60.0, projection=None):
+        """Compact copy of a collection's embeddings, loaded from disk or rebuilt when it is out of date.
+        With projection (e.g. 'pca64') the copy holds dimension-reduced vectors, see fit_projection.
+
+        The store is shared by all managers of the process on this directory. Writes
+        through any of them mark it stale right away, writes from other processes are
+        noticed by a count check at most every recheck_seconds.
+        """
+        slot = registry.shared(self.persist_directory, collection_name, ("quantized", dtype, projection))
+        directory = self._quantized_directory(collection_name, dtype, projection)
+        with slot.lock:
+            entry = slot.value
+            if entry is not None and not entry["stale"] and time.monotonic() - entry["checked_at"] < recheck_seconds:
+                return entry["store"]
+            
+            collection = self.get_collection(collection_name)
+            count = collection.count()
+            if entry is None:
+                store = QuantizedVectorStore.load(directory)
+            else:
+                # A store marked stale by a write here may have the same count but changed vectors
+                store = None if entry["stale"] else entry["store"]
+            if store is None or len(store) != count or store.model != self.embedding_model:
+                fitted = self.fit_projection(collection_name, projection) if projection else None
+                store = QuantizedVectorStore.build(collection, dtype=dtype, model=self.embedding_model, projection=fitted)
+                store.save(directory)
+                # Serve the memory-mapped copy so the freshly built arrays can be released
+                store = QuantizedVectorStore.load(directory) or store
+            
+            slot.value = {"store": store, "checked_at": time.monotonic(), "stale": False}
+            return store
+
+    def query_quantized_batch(self, collection_name, queries, default_n_results=10, dtype="int8", rescore_factor=4, projection=None):
+        """query_collection_batch served from the quantized store: an approximate pass over the
+        compact vectors (dimension-reduced with projection, e.g. 'pca64'), then re-scoring of
+        rescore_factor * n_results candidates at full precision. Queries whose filter the
+        store cannot evaluate go to Chroma instead."""
+        if not queries:
+            return []
+        
+        try:
+            collection = self.get_collection(collection_name)
+            store = self.get_quantized_store(collection_name, dtype, projection=projection)
+            
+            texts = list(dict.fromkeys(query['query'] for query in queries))
+            vectors = dict(zip(texts, self.embed_texts(texts)))
+            
+            groups = {}
+            for position, query in enumerate(queries):
+                group_key = json.dumps(query.get('where'), sort_keys=True)
+                groups.setdefault(group_key, []).append(position)
+            
+            batch_results = [None] * len(queries)
+            for positions in groups.values():
+                where = queries[positions[0]].get('where')
+                n_results = max(queries[position].get('n_results') or default_n_results for position in positions)
+                try:
+                    results = store.search(
+                        collection,
+                        [vectors[queries[position]['query']] for position in positions],
+                        n_results=n_results,
+                        where=where,
+                        rescore_factor=rescore_factor
+                    )
+                except UnsupportedFilterError as e:
+                    logger.info(f"Quantized search cannot evaluate {where} ({e}), using Chroma")
+                    results = self.query_collection_batch(collection_name, [queries[position] for position in positions], default_n_results)
+                
+                for position, result in zip(positions, results):
+                    limit = queries[position].get('n_results') or default_n_results
+                    batch_results[position] = {key: [values[0][:limit]] for key, values in result.items()}
+            
+            logger.info(f"Ran {len(queries)} quantized ({projection + ' ' if projection else ''}{dtype}) queries on '{collection_name}' over {len(store)} vectors")
+            
+            return batch_results
+            
+        except Exception as e:
+            logger.error(f"Failed to run quantized query: {e}")
+            registry.invalidate(self.persist_directory, collection_name)
+            return [{} for _ in queries]
+
+
+    def _bm25_directory(self, collection_name):
+        return os.path.join(self.persist_directory, "bm25", collection_name)
+
+    def _bm25_batches(self, collection_name, count, snapshot_path=None, batch_size=5000):
+        snapshot = open_snapshot(snapshot_path) if snapshot_path else None
+        if snapshot is not None and len(snapshot) == count:
+            for start in range(0, count, batch_size):
+                rows = range(start, min(start + batch_size, count))
+                yield [snapshot.ids[row] for row in rows], [snapshot.documents[row] for row in rows], [snapshot.metadata(row) for row in rows]
+            return
+        for batch in self._scan_collection(collection_name, include=["documents", "metadatas"], batch_size=batch_size):
+            yield batch['ids'], batch['documents'], batch['metadatas']
+
+    def get_bm25_index(self, collection_name, recheck_seconds=60.0, snapshot_path=None):
+        """Persistent BM25 index of a collection (see utils.bm25_index), opened from disk or built once.
+
+        The index is shared by all managers of the process on this directory and
+        writes through any of them update it in place. Writes from other processes
+        are noticed by a count check at most every recheck_seconds and lead to a
+        rebuild, which reads snapshot_path instead of the collection while that
+        snapshot matches the collection size.
+        """
+        slot = self._bm25_slot(collection_name)
+        with slot.lock:
+            entry = slot.value
+            if entry is not None and time.monotonic() - entry["checked_at"] < recheck_seconds:
+                return entry["index"]
+            
+            directory = self._bm25_directory(collection_name)
+            count = self.get_collection(collection_name).count()
+            index = entry["index"] if entry is not None else None
+            if index is None or index.changed_on_disk():
+                index = BM25Index.open(directory)
+            if index is None or len(index) != count:
+                index = BM25Index.build(directory, self._bm25_batches(collection_name, count, snapshot_path))
+            
+            slot.value = {"index": index, "checked_at": time.monotonic()}
+            return index
+
+    def _update_bm25(self, collection_name, ids, documents=None, metadatas=None, replace=True):
+        """Apply a write to the collection's BM25 index, if one was built. Without documents the ids are deleted."""
+        slot = self._bm25_slot(collection_name)
+        with slot.lock:
+            entry = slot.value
+            index = entry["index"] if entry is not None else BM25Index.open(self._bm25_directory(collection_name))
+            if index is None:
+                return
+            try:
+                if documents is None:
+                    index.delete(ids)
+                else:
+                    index.add(ids, documents, metadatas, replace=replace)
+                if entry is None:
+                    # Opened for this write only, the next get_bm25_index still checks it against the collection
+                    slot.value = {"index": index, "checked_at": float("-inf")}
+            except Exception as e:
+                logger.warning(f"Could not update the BM25 index of '{collection_name}' ({e}), it is rebuilt on next use")
+                slot.value = None
+                shutil.rmtree(self._bm25_directory(collection_name), ignore_errors=True)
+
+    def _bm25_slot(self, collection_name):
+        return registry.shared(self.persist_directory, collection_name, ("bm25",))
+
+    def rebuild_bm25_index(self, collection_name, snapshot_path=None):
+        """Build the collection's BM25 index from scratch. The new segment replaces the old ones in
+        one commit, indexes that other managers or processes have open keep working."""
+        slot = self._bm25_slot(collection_name)
+        with slot.lock:
+            count = self.get_collection(collection_name).count()
+            index = BM25Index.build(self._bm25_directory(collection_name), self._bm25_batches(collection_name, count, snapshot_path))
+            slot.value = {"index": index, "checked_at": time.monotonic()}
+            return index
+
+    def drop_bm25_index(self, collection_name):
+        """Delete the collection's BM25 index, the next get_bm25_index builds it again"""
+        slot = self._bm25_slot(collection_name)
+        with slot.lock:
+            slot.value = None
+            shutil.rmtree(self._bm25_directory(collection_name), ignore_errors=True)
+
+
+class AsyncChromaManager:
+    """asyncio facade for ChromaManager.
+
+    Blocking calls run on a dedicated pool of max_workers threads, so they neither
+    block the event loop nor compete with other work on the loop's default
+    executor. At most max_pending calls are admitted at a time, further callers
+    wait on a semaphore until a slot frees up instead of piling up in the pool's
+    queue.
+    """
+
+    def __init__(self, manager=None, max_workers=4, max_pending=32, **manager_kwargs):
+        self.manager = manager or ChromaManager(**manager_kwargs)
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chroma")
+        # asyncio semaphores belong to one event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "waiting": 0, "running": 0}
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_pending)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    def _count(self, key, delta):
+        with self._lock:
+            self.counters[key] += delta
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking function on the pool once a slot is free"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore()
+        self._count("waiting", 1)
+        try:
+            await semaphore.acquire()
+        finally:
+            self._count("waiting", -1)
+        
+        def done(future):
+            self._count("running", -1)
+            self._count("failed" if future.cancelled() or future.exception() else "completed", 1)
+            # The slot is freed when the thread finishes, even if the awaiting task was cancelled
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(semaphore.release)
+        
+        self._count("submitted", 1)
+        self._count("running", 1)
+        try:
+            future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        except Exception:
+            self._count("running", -1)
+            semaphore.release()
+            raise
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    async def connect(self):
+        return await self.run(self.manager.connect)
+
+    async def add_documents(self, collection_name, documents, metadatas, ids, embeddings=None):
+        return await self.run(self.manager.add_documents, collection_name, documents, metadatas, ids, embeddings)
+
+    async def upsert_documents(self, collection_name, documents, metadatas, ids, embeddings=None):
+        return await self.run(self.manager.upsert_documents, collection_name, documents, metadatas, ids, embeddings)
+
+    async def query_collection(self, collection_name, query_texts, n_results=10, where=None):
+        return await self.run(self.manager.query_collection, collection_name, query_texts, n_results, where)
+
+    async def query_collection_batch(self, collection_name, queries, default_n_results=10):
+        return await self.run(self.manager.query_collection_batch, collection_name, queries, default_n_results)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "max_workers": self.max_workers, "max_pending": self.max_pending}
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+def reindex(args):
+    # Imported here so plain ChromaManager users do not load the PDF extraction stack
+    from utils.bulk_index import reindex_directory
+    from utils.embedding_cache import EmbeddingCache
+
+    if args.embedding_model:
+        embedding_registry.configure(args.embedding_model)
+    embedding_cache = EmbeddingCache(os.path.join(args.cache_dir, "embeddings.sqlite3")) if args.cache_dir else None
+    manager = ChromaManager(
+        persist_directory=args.persist_directory,
+        embedding_cache=embedding_cache,
+        embedding_concurrency=args.embedding_concurrency
+    )
+    manager.connect()
+
+    summary = reindex_directory(
+        manager,
+        pdf_dir=args.pdf_dir,
+        collection_name=args.collection,
+        cache_dir=args.cache_dir,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        chunking_strategy=args.chunking,
+        deduplicate=not args.no_dedup,
+        extraction_timeout=args.timeout,
+        extraction_max_memory_mb=args.max_memory_mb,
+        restart=args.restart,
+        drop=args.drop
+    )
+
+    for base_id, error in summary["errors"].items():
+        print(f"Could not index {base_id}: {error}")
+    print(f"Indexed {summary['upserted_papers']}/{summary['papers']} papers as {summary['chunks']} chunks in {summary['seconds']:.1f}s "
+          f"({summary['papers_per_second']:.2f} papers/s, {summary['chunks_per_second']:.1f} chunks/s, "
+          f"{summary['unchanged_papers']} unchanged, {summary['skipped_by_checkpoint']} skipped by checkpoint, {len(summary['errors'])} errors)")
+    print(f"Embedding: {summary['embedding']['texts_per_second']:.1f} texts/s")
+    if embedding_cache is not None:
+        embedding_cache.close()
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["errors"] else 0
+
+
+def hnsw_sweep(args):
+    from utils.hnsw_sweep import sweep_hnsw, write_report
+
+    def int_list(value):
+        return [int(item) for item in value.split(",") if item.strip()]
+
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    report = sweep_hnsw(
+        manager,
+        args.collection,
+        k=args.k,
+        num_queries=args.queries,
+        m_values=int_list(args.m),
+        construction_ef_values=int_list(args.construction_ef),
+        search_ef_values=int_list(args.search_ef),
+        batch_size=args.batch_size,
+        sync_threshold=args.sync_threshold
+    )
+    write_report(report, args.report)
+    
+    for entry in report["results"]:
+        print(f"M={entry['M']:<4} construction_ef={entry['construction_ef']:<5} search_ef={entry['search_ef']:<5} "
+              f"recall@{report['k']}={entry['recall_at_k']:.3f}  p50={entry['p50_ms']:.2f}ms  p99={entry['p99_ms']:.2f}ms")
+    print(f"Report written to {args.report}")
+    return 0
+
+
+def dense_benchmark(args):
+    from utils.dense_benchmark import benchmark_dense, write_report
+
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    report = benchmark_dense(
+        manager,
+        args.collection,
+        k=args.k,
+        num_queries=args.queries,
+        projections=[item.strip() for item in args.projections.split(",") if item.strip()],
+        rescore_factors=[int(item) for item in args.rescore.split(",") if item.strip()]
+    )
+    write_report(report, args.report)
+    
+    for entry in report["results"]:
+        print(f"{entry['engine']:<12} {entry['projection'] or '-':<10} {entry['dtype']:<8} x{entry['rescore_factor'] or '-':<3} "
+              f"recall@{report['k']}={entry['recall_at_k']:.3f}  p50={entry['p50_ms']:.2f}ms  p99={entry['p99_ms']:.2f}ms  "
+              f"{entry['memory_bytes'] / 2**20:.1f} MiB")
+    print(f"Report written to {args.report}")
+    return 0
+
+
+def snapshot_export(args):
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    summary = manager.export_snapshot(args.collection, args.output)
+    print(f"Exported {summary['count']} records of '{summary['collection']}' to {summary['path']} "
+          f"({summary['bytes'] / 2**20:.1f} MiB) in {summary['seconds']:.1f}s")
+    return 0
+
+
+def snapshot_import(args):
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    summary = manager.import_snapshot(args.input, collection_name=args.collection, drop=args.drop)
+    print(f"Imported {summary['count']} records into '{summary['collection']}' in {summary['seconds']:.1f}s")
+    return 0
+
+
+def bm25_index(args):
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    if args.rebuild:
+        index = manager.rebuild_bm25_index(args.collection, snapshot_path=args.snapshot)
+    else:
+        index = manager.get_bm25_index(args.collection, snapshot_path=args.snapshot)
+    if args.compact:
+        index.compact()
+    print(f"BM25 index of '{args.collection}': {len(index)} chunks in {len(index.segments)} segments, "
+          f"{index.nbytes / 2**20:.1f} MiB in {index.directory}")
+    return 0
+
+
+def gc(args):
+    from utils.bulk_index import source_base_ids
+
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    present, deleted = source_base_ids(args.pdf_dir)
+    summary = manager.delete_orphan_chunks(
+        args.collection,
+        referenced_base_ids=present,
+        candidate_base_ids=None if args.include_unlisted else deleted,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run
+    )
+    action = "Would delete" if args.dry_run else "Deleted"
+    print(f"{action} {summary['orphan_chunks']} orphan chunks of {summary['orphan_papers']} papers from '{args.collection}' "
+          f"({len(present)} papers referenced in {args.pdf_dir})")
+    return 0
+
+
+def stats(args):
+    manager = ChromaManager(persist_directory=args.persist_directory)
+    manager.connect()
+    names = [args.collection] if args.collection else manager.list_collections()
+    all_stats = [manager.collection_stats(name) for name in names]
+    
+    if args.json:
+        print(json.dumps(all_stats, indent=2))
+        return 0
+    for entry in all_stats:
+        if not entry:
+            continue
+        print(f"{entry['name']}: {entry['chunks']} chunks, {entry['papers']} papers, "
+              f"{entry['avg_chunks_per_paper']:.1f} chunks/paper (max {entry['max_chunks_per_paper']}), "
+              f"{entry['bytes'] / 2**20:.1f} MiB (documents {entry['document_bytes'] / 2**20:.1f}, "
+              f"metadata {entry['metadata_bytes'] / 2**20:.1f}, embeddings {entry['embedding_bytes'] / 2**20:.1f}), "
+              f"model {entry['embedding_model']}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Manage the ChromaDB publication collections")
+    parser.add_argument("--persist-directory", default="./chroma_db", help="ChromaDB directory")
+    subparsers = parser.add_subparsers(dest="command")
+
+    reindex_parser = subparsers.add_parser("reindex", help="Bulk-index a PDF directory and its sources.json without running the research flow")
+    reindex_parser.add_argument("--pdf-dir", default="./pdfs", help="Directory with the PDFs and sources.json")
+    reindex_parser.add_argument("--collection", default="scientific_publications")
+    reindex_parser.add_argument("--cache-dir", default="./cache", help="PDF text and embedding cache directory, empty to disable")
+    reindex_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="PDF extraction processes (default: all cores)")
+    reindex_parser.add_argument("--embedding-concurrency", type=int, default=2, help="Embedding batches in flight")
+    reindex_parser.add_argument("--chunk-size", type=int, default=1000)
+    reindex_parser.add_argument("--chunk-overlap", type=int, default=200)
+    reindex_parser.add_argument("--chunking", choices=["recursive", "sections"], default="sections")
+    reindex_parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate chunks")
+    reindex_parser.add_argument("--timeout", type=float, default=120.0, help="Seconds per PDF before its extraction is killed")
+    reindex_parser.add_argument("--max-memory-mb", type=int, default=2048, help="Memory cap per extraction process")
+    reindex_parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of an interrupted run")
+    reindex_parser.add_argument("--drop", action="store_true", help="Delete the collection before indexing, required after switching the embedding model")
+    reindex_parser.add_argument("--embedding-model", help="'ollama:<model>' or 'default' for Chroma's all-MiniLM-L6-v2 (default: EMBEDDING_MODEL or 'ollama:nomic-embed-text')")
+    reindex_parser.add_argument("--summary", help="Write the run summary as JSON to this file")
+
+    sweep_parser = subparsers.add_parser("hnsw-sweep", help="Measure recall@k and latency of HNSW settings on a copy of a collection")
+    sweep_parser.add_argument("--collection", default="scientific_publications")
+    sweep_parser.add_argument("--k", type=int, default=10)
+    sweep_parser.add_argument("--queries", type=int, default=200, help="Stored vectors held out as queries")
+    sweep_parser.add_argument("--m", default="16,32", help="Comma-separated M values")
+    sweep_parser.add_argument("--construction-ef", default="100,200", help="Comma-separated construction_ef values")
+    sweep_parser.add_argument("--search-ef", default="10,20,50,100,200", help="Comma-separated search_ef values")
+    sweep_parser.add_argument("--batch-size", type=int, help="hnsw:batch_size of the test collections")
+    sweep_parser.add_argument("--sync-threshold", type=int, help="hnsw:sync_threshold of the test collections")
+    sweep_parser.add_argument("--report", default="./reports/hnsw_sweep.json", help="JSON report, a Markdown table is written next to it")
+
+    benchmark_parser = subparsers.add_parser("dense-benchmark", help="Recall and latency of the dense engines (HNSW, quantized, reduced) against exact search")
+    benchmark_parser.add_argument("--collection", default="scientific_publications")
+    benchmark_parser.add_argument("--k", type=int, default=10)
+    benchmark_parser.add_argument("--queries", type=int, default=200, help="Stored vectors used as queries")
+    benchmark_parser.add_argument("--projections", default="pca32,pca64,pca128,prefix64,prefix128", help="Comma-separated projections")
+    benchmark_parser.add_argument("--rescore", default="2,4,8", help="Comma-separated rescore factors")
+    benchmark_parser.add_argument("--report", default="./reports/dense_benchmark.json", help="JSON report, a Markdown table is written next to it")
+
+    export_parser = subparsers.add_parser("snapshot-export", help="Write a collection to a memory-mappable snapshot directory")
+    export_parser.add_argument("--collection", default="scientific_publications")
+    export_parser.add_argument("--output", default="./snapshots/scientific_publications", help="Snapshot directory, replaced if it exists")
+
+    import_parser = subparsers.add_parser("snapshot-import", help="Load a snapshot into a collection without re-embedding")
+    import_parser.add_argument("--input", default="./snapshots/scientific_publications", help="Snapshot directory")
+    import_parser.add_argument("--collection", help="Target collection (default: the exported one)")
+    import_parser.add_argument("--drop", action="store_true", help="Delete the target collection first")
+
+    bm25_parser = subparsers.add_parser("bm25-index", help="Build, check or compact the persistent BM25 index of a collection")
+    bm25_parser.add_argument("--collection", default="scientific_publications")
+    bm25_parser.add_argument("--snapshot", help="Snapshot directory read instead of the collection when the index is built")
+    bm25_parser.add_argument("--rebuild", action="store_true", help="Drop the index and build it again")
+    bm25_parser.add_argument("--compact", action="store_true", help="Merge all segments and drop deleted chunks")
+
+    gc_parser = subparsers.add_parser("gc", help="Delete chunks of papers whose PDF was removed from the PDF directory")
+    gc_parser.add_argument("--collection", default="scientific_publications")
+    gc_parser.add_argument("--pdf-dir", default="./pdfs", help="Directory with the PDFs and sources.json")
+    gc_parser.add_argument("--include-unlisted", action="store_true", help="Also delete chunks of papers that sources.json does not list, e.g. abstract-only papers")
+    gc_parser.add_argument("--batch-size", type=int, default=500, help="Chunks deleted per call")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+
+    stats_parser = subparsers.add_parser("stats", help="Chunk, paper and size statistics per collection")
+    stats_parser.add_argument("--collection", help="Only this collection (default: all)")
+    stats_parser.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "reindex":
+        sys.exit(reindex(args))
+    if args.command == "hnsw-sweep":
+        sys.exit(hnsw_sweep(args))
+    if args.command == "dense-benchmark":
+        sys.exit(dense_benchmark(args))
+    if args.command == "snapshot-export":
+        sys.exit(snapshot_export(args))
+    if args.command == "snapshot-import":
+        sys.exit(snapshot_import(args))
+    if args.command == "bm25-index":
+        sys.exit(bm25_index(args))
+    if args.command == "gc":
+        sys.exit(gc(args))
+    if args.command == "stats":
+        sys.exit(stats(args))
 
-def main():
-    manager = ChromaManager(persist_directory="./chroma_db")
+    manager = ChromaManager(persist_directory=args.persist_directory)
     
     try:
         manager.connect()
@@ -8,7 +8,9 @@ from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 from fastmcp import FastMCP, Context
+from typing import List, Optional
 from src.test2.research_flow import ResearchFlow
+from chroma_manager import AsyncChromaManager
 
 load_dotenv()
 
@@ -21,6 +23,21 @@ mcp = FastMCP(name="Scientific Research Server")
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 
+# Vector store calls run on their own bounded pool, concurrent searches wait for a slot instead of flooding Chroma
+_store = None
+# Concurrent first calls would otherwise each create a store
+_store_lock = asyncio.Lock()
+
+async def _get_store() -> AsyncChromaManager:
+    global _store
+    if _store is None:
+        async with _store_lock:
+            if _store is None:
+                store = AsyncChromaManager(persist_directory=str(BASE_DIR / "chroma_db"), max_workers=4, max_pending=32)
+                await store.connect()
+                _store = store
+    return _store
+
 @mcp.tool
 async def do_scientific_research(
     ctx: Context,
@@ -85,6 +102,55 @@ async def do_scientific_research(
         }
 
 
+@mcp.tool
+async def search_publications(
+    queries: List[str],
+    n_results: int = 5,
+    year_from: Optional[int] = None,
+    source: Optional[str] = None
+) -> list:
+    """
+    Semantic search over the indexed publication chunks.
+    
+    Args:
+        queries: One or more search queries, answered in one batch
+        n_results: Results per query (default: 5)
+        year_from: Optional minimum publication year
+        source: Optional source filter ('arxiv' or 'openalex')
+    
+    Returns:
+        list with one entry per query holding the matching chunks and their metadata
+    """
+    conditions = []
+    if year_from:
+        conditions.append({'year': {'$gte': year_from}})
+    if source:
+        conditions.append({'source': source})
+    where = {'$and': conditions} if len(conditions) > 1 else (conditions[0] if conditions else None)
+    
+    store = await _get_store()
+    results = await store.query_collection_batch(
+        "scientific_publications",
+        [{'query': query, 'n_results': min(n_results, 20), 'where': where} for query in queries]
+    )
+    
+    return [
+        {
+            "query": query,
+            "results": [
+                {"id": chunk_id, "document": document, "metadata": metadata, "distance": distance}
+                for chunk_id, document, metadata, distance in zip(
+                    result.get('ids', [[]])[0],
+                    result.get('documents', [[]])[0],
+                    result.get('metadatas', [[]])[0],
+                    result.get('distances', [[]])[0]
+                )
+            ]
+        }
+        for query, result in zip(queries, results)
+    ]
+
+
 @mcp.resource("report://final_chapter")
 async def get_final_chapter() -> str:
     """Get the final related work chapter (if available)"""
@@ -6,10 +6,8 @@ import getpass
 from typing import Dict, List, Optional
 from datetime import datetime
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFium2Loader
 from pydantic import BaseModel, Field
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_ollama import OllamaEmbeddings
 from langchain_nvidia import NVIDIAEmbeddings
 from crewai.flow.flow import Flow, listen, router, start, or_
 from crewai import Agent, Task, Crew, Process, LLM
@@ -19,7 +17,14 @@ from tools.ArxivTool import ArxivTool
 from tools.RetrievalTool import RetrievalTool
 from langchain_chroma import Chroma
 import chromadb
-from chroma_manager import ChromaManager
+from chroma_manager import ChromaManager, registry as chroma_registry
+from utils.pdf_extraction import EXTRACTOR_VERSION
+from utils.ingestion_pipeline import IngestionPipeline
+from utils.pdf_cache import PdfTextCache
+from utils.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from utils.embedding_registry import registry as embedding_registry, LangchainEmbeddings, DEFAULT_MODEL, MODEL_KEY, mismatch_hint
+from utils.bulk_index import paper_base_id
+from utils.quantized_store import REDUCED_DTYPE
 import json
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
@@ -46,6 +51,20 @@ class ScientificResearchState(BaseModel):
     timeframe: int = 5
     max_pdfs_per_tool: int = 10
     pdf_save_dir: str = str((Path(__file__).parent.parent.parent / "pdfs").resolve())
+    extraction_workers: int = os.cpu_count() or 1
+    extraction_timeout: float = 120.0
+    extraction_max_memory_mb: int = 2048
+    pdf_text_cache_dir: str = str((Path(__file__).parent.parent.parent / "cache" / "pdf_text").resolve())
+    pdf_text_cache_max_bytes: int = 512 * 1024 * 1024
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+    embedding_cache_path: str = str((Path(__file__).parent.parent.parent / "cache" / "embeddings.sqlite3").resolve())
+    embedding_cache_max_bytes: int = 1024 * 1024 * 1024
+    embedding_concurrency: int = 2
+    dense_backend: str = os.getenv("DENSE_BACKEND", "chroma")
+    reduced_projection: str = os.getenv("DENSE_PROJECTION", "pca64")
+    snapshot_path: Optional[str] = os.getenv("CHROMA_SNAPSHOT")
+    # Index every topic into its own shard of scientific_publications, retrieval then only searches that shard
+    shard_by_topic: bool = os.getenv("SHARD_BY_TOPIC", "false").lower() in ("1", "true", "yes")
     current_step: str = "initialized"
     iteration_count: int = 0
     max_iterations: int = 5
@@ -77,12 +96,25 @@ class ResearchFlow(Flow[ScientificResearchState]):
         self.llm = LLM(model="gemini/gemini-2.0-flash", temperature=0.3, api_key=os.getenv("GEMINI_API_KEY"))
         self._ensure_output_directories()
 
+        self.embedding_cache = EmbeddingCache(self.state.embedding_cache_path, max_bytes=self.state.embedding_cache_max_bytes)
+        # The vector store and ChromaManager write to the same collection and must embed with the same model
+        embedding_registry.configure(self.state.embedding_model)
+        client = chroma_registry.get_client(self.state.chroma_persist_directory)
+        self._warn_about_embedding_mismatch(client, "scientific_publications")
         self.vector_store = Chroma(
             collection_name="scientific_publications",
-            embedding_function=OllamaEmbeddings(model="nomic-embed-text"),
-            persist_directory=self.state.chroma_persist_directory
+            embedding_function=LangchainEmbeddings(CachedEmbeddingFunction(embedding_registry.get(), self.embedding_cache)),
+            client=client
         )
         
+    def _warn_about_embedding_mismatch(self, client, collection_name):
+        # Writes into the collection would be refused later, say so before any work is done
+        for collection in client.list_collections():
+            pinned_model = (collection.metadata or {}).get(MODEL_KEY) if collection.name == collection_name else None
+            if pinned_model and pinned_model != self.state.embedding_model:
+                print(f"Warning: '{collection_name}' holds '{pinned_model}' embeddings but the flow embeds with '{self.state.embedding_model}'. "
+                      f"To fix this, {mismatch_hint(pinned_model)}")
+
     def _get_base_dir(self):
         return Path(__file__).parent.parent.parent.resolve()
     
@@ -390,35 +422,24 @@ class ResearchFlow(Flow[ScientificResearchState]):
             if len(filtered_pubs) == 0:
                 return
 
-            manager = ChromaManager(persist_directory=self.state.chroma_persist_directory)
+            manager = ChromaManager(persist_directory=self.state.chroma_persist_directory, embedding_cache=self.embedding_cache, embedding_concurrency=self.state.embedding_concurrency)
             manager.connect()
             
-            documents = []
-            metadatas = []
-            base_ids = []
+            collection_name = "scientific_publications"
+            if self.state.shard_by_topic:
+                collection_name = manager.create_shard("scientific_publications", self.state.topic)
+            
+            papers = []
             
             for idx, pub in enumerate(filtered_pubs):
                 title = pub.get('title', '')
                 
                 pdf_filename = pub.get('pdf_filename')
-                doc_text = None
-                
-                if pdf_filename:
-                    pdf_path = pdf_dir / pdf_filename
-                    if pdf_path.exists():
-                        try:
-                            print(f"Loading PDF: {pdf_filename}")
-                            loader = PyPDFium2Loader(str(pdf_path))
-                            pages = loader.load()
-                            doc_text = "\n\n".join([page.page_content for page in pages])      
-                        except Exception as e:
-                            raise
+                pdf_path = None
+                if pdf_filename and (pdf_dir / pdf_filename).exists():
+                    pdf_path = str(pdf_dir / pdf_filename)
                 
-                if not doc_text or len(doc_text.strip()) < 100:
-                    abstract = pub.get('abstract', '')
-                    doc_text = f"Title: {title}\n\nAbstract: {abstract}"
-                
-                documents.append(doc_text)
+                abstract = pub.get('abstract', '')
                 
                 metadata = {
                     'title': title or '',
@@ -433,22 +454,65 @@ class ResearchFlow(Flow[ScientificResearchState]):
                     'filtered': 'true' 
                 }
 
-                metadatas.append(metadata)
-
-                paper_id = pub.get('doi') or pub.get('arxiv_id') or f"paper_{idx}"
-                paper_id = paper_id.replace('/', '_').replace(':', '_').replace('.', '_')
-                base_ids.append(paper_id)
-            
-            manager.add_chunked_documents(
-                collection_name="scientific_publications",
-                documents=documents,
-                metadatas=metadatas,
-                base_ids=base_ids,
+                paper_id = paper_base_id(pub.get('doi'), pub.get('arxiv_id'), f"paper_{idx}")
+                
+                papers.append({
+                    'base_id': paper_id,
+                    'metadata': metadata,
+                    'pdf_path': pdf_path,
+                    'fallback_text': f"Title: {title}\n\nAbstract: {abstract}"
+                })
+            
+            text_cache = PdfTextCache(
+                cache_dir=self.state.pdf_text_cache_dir,
+                extractor_version=EXTRACTOR_VERSION,
+                max_bytes=self.state.pdf_text_cache_max_bytes
+            )
+            pipeline = IngestionPipeline(
+                manager,
+                collection_name=collection_name,
+                extraction_workers=self.state.extraction_workers,
+                text_cache=text_cache,
                 chunk_size=1000,
-                chunk_overlap=200
+                chunk_overlap=200,
+                chunking_strategy="sections",
+                deduplicate=True,
+                extraction_timeout=self.state.extraction_timeout,
+                extraction_max_memory_mb=self.state.extraction_max_memory_mb
             )
+            summary = pipeline.run(papers)
             
-            info = manager.get_collection_info("scientific_publications")
+            for base_id, error in summary['extraction_errors'].items():
+                print(f"Could not load PDF for {base_id}, using abstract instead: {error}")
+            for event in summary['sandbox_events']:
+                print(f"Killed extraction of {Path(event['path']).name} ({event['event']}: {event['detail']})")
+            for base_id, error in summary['errors'].items():
+                print(f"Could not index {base_id}: {error}")
+            
+            try:
+                with open(self._get_base_dir() / "logs" / "ingestion_summary.json", "w", encoding="utf-8") as f:
+                    json.dump(summary, f, indent=2)
+            except Exception as e:
+                print(f"Could not write logs/ingestion_summary.json: {e}")
+            print(f"Indexed {summary['upserted_papers']}/{summary['papers']} papers as {summary['chunks']} chunks in {summary['seconds']:.1f}s ({summary['unchanged_papers']} unchanged, {summary['duplicate_chunks']} duplicate chunks dropped)")
+            print(f"PDF text cache: {text_cache.stats()}")
+            self.embedding_cache.flush()
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
+            print(f"Embedding throughput: {manager.embedding_executor.stats()['texts_per_second']:.1f} texts/s")
+            
+            cleaning = summary['cleaning']
+            if cleaning['original_chars']:
+                print(f"Cleaning removed {cleaning['removed_chars']}/{cleaning['original_chars']} characters of boilerplate and references from {cleaning['papers']} papers (see logs/ingestion_summary.json)")
+            
+            # Fit the projection and build the compact copy now so the first search does not pay for it
+            if self.state.dense_backend == "quantized" and not self.state.shard_by_topic:
+                manager.get_quantized_store(collection_name, "int8")
+            elif self.state.dense_backend == "reduced" and not self.state.shard_by_topic:
+                manager.get_quantized_store(collection_name, REDUCED_DTYPE, projection=self.state.reduced_projection)
+            # Built once on disk, later ingestion runs update it in place
+            manager.get_bm25_index(collection_name, snapshot_path=self.state.snapshot_path)
+            
+            info = manager.get_collection_info(collection_name)
         except Exception as e:
             raise
             
@@ -474,7 +538,7 @@ class ResearchFlow(Flow[ScientificResearchState]):
             verbose=True,
             max_rpm=10,
             llm=self.llm,
-            tools=[RetrievalTool(chroma_persist_directory=self.state.chroma_persist_directory)]
+            tools=[RetrievalTool(chroma_persist_directory=self.state.chroma_persist_directory, embedding_cache_path=self.state.embedding_cache_path, dense_backend=self.state.dense_backend, reduced_projection=self.state.reduced_projection, snapshot_path=self.state.snapshot_path, shard_topics=[self.state.topic] if self.state.shard_by_topic else None)]
         )
         
         filtered_pubs = self.state.filtered_publications if self.state.filtered_publications else "No filtered publications available."
@@ -542,7 +606,7 @@ class ResearchFlow(Flow[ScientificResearchState]):
             max_iter=15,
             max_rpm=10,
             llm=self.llm,
-            tools=[RetrievalTool(chroma_persist_directory=self.state.chroma_persist_directory)]
+            tools=[RetrievalTool(chroma_persist_directory=self.state.chroma_persist_directory, embedding_cache_path=self.state.embedding_cache_path, dense_backend=self.state.dense_backend, reduced_projection=self.state.reduced_projection, snapshot_path=self.state.snapshot_path, shard_topics=[self.state.topic] if self.state.shard_by_topic else None)]
         )
         
         if is_revision:
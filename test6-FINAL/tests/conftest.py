@@ -0,0 +1,43 @@
+import hashlib
+
+import numpy as np
+import pytest
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from chroma_manager import ChromaManager
+
+
+class HashingEmbeddingFunction(EmbeddingFunction):
+    """Deterministic bag-of-words vectors, so tests need no embedding model"""
+
+    DIMENSION = 32
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.DIMENSION, dtype=np.float32)
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.DIMENSION] += 1
+            vectors.append(vector / (np.linalg.norm(vector) or 1))
+        return vectors
+
+    @staticmethod
+    def name():
+        return "test-hashing"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashingEmbeddingFunction()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ChromaManager(persist_directory=str(tmp_path / "chroma_db"), embedding_function=HashingEmbeddingFunction())
+    manager.connect()
+    return manager
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from chroma_manager import AsyncChromaManager
+
+COLLECTION = "publications"
+
+
+class Gate:
+    """Blocking call that records how many run at once and waits until opened"""
+
+    def __init__(self):
+        self.opened = threading.Event()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.started = 0
+
+    def __call__(self, value):
+        with self.lock:
+            self.active += 1
+            self.started += 1
+            self.peak = max(self.peak, self.active)
+        self.opened.wait(5)
+        with self.lock:
+            self.active -= 1
+        return value
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_calls_beyond_max_pending_wait_on_the_loop(manager):
+    facade = AsyncChromaManager(manager, max_workers=2, max_pending=3)
+    gate = Gate()
+
+    async def scenario():
+        tasks = [asyncio.create_task(facade.run(gate, i)) for i in range(8)]
+        await wait_for(lambda: facade.stats()["waiting"] == 5)
+        stats = facade.stats()
+        # Three calls are admitted, two of them run, the rest wait without reaching the pool's queue
+        assert stats["submitted"] == 3 and stats["running"] == 3
+        assert gate.started == 2
+        gate.opened.set()
+        return await asyncio.gather(*tasks)
+
+    try:
+        assert asyncio.run(scenario()) == list(range(8))
+    finally:
+        facade.close()
+    assert gate.peak == 2
+    assert facade.stats()["completed"] == 8 and facade.stats()["running"] == 0 and facade.stats()["waiting"] == 0
+
+
+def test_blocking_calls_do_not_block_the_loop(manager):
+    facade = AsyncChromaManager(manager, max_workers=1)
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    async def scenario():
+        await asyncio.gather(facade.run(time.sleep, 0.3), ticker())
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        facade.close()
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.25
+
+
+def test_cancelled_caller_frees_its_slot_when_the_call_finishes(manager):
+    facade = AsyncChromaManager(manager, max_workers=1, max_pending=1)
+    gate = Gate()
+
+    async def scenario():
+        running = asyncio.create_task(facade.run(gate, "first"))
+        await wait_for(lambda: gate.started == 1)
+        waiting = asyncio.create_task(facade.run(gate, "second"))
+        await wait_for(lambda: facade.stats()["waiting"] == 1)
+
+        running.cancel()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        # The first call still occupies the only slot until its thread returns
+        assert facade.stats()["running"] == 1
+        gate.opened.set()
+        return await asyncio.wait_for(facade.run(gate, "third"), 5)
+
+    try:
+        assert asyncio.run(scenario()) == "third"
+    finally:
+        facade.close()
+    assert gate.started == 2
+
+
+def test_errors_propagate_and_are_counted(manager):
+    facade = AsyncChromaManager(manager, max_workers=1)
+
+    def fail():
+        raise RuntimeError("backend down")
+
+    async def scenario():
+        with pytest.raises(RuntimeError, match="backend down"):
+            await facade.run(fail)
+        return await facade.run(lambda: "still works")
+
+    try:
+        assert asyncio.run(scenario()) == "still works"
+    finally:
+        facade.close()
+    assert facade.stats()["failed"] == 1 and facade.stats()["completed"] == 1
+
+
+def test_facade_methods_reach_the_manager(manager):
+    async def scenario():
+        async with AsyncChromaManager(manager, max_workers=2) as facade:
+            await facade.add_documents(COLLECTION, ["graph networks", "protein folding"], [{"year": 2023}, {"year": 2024}], ["a", "b"])
+            await facade.upsert_documents(COLLECTION, ["graph kernels"], [{"year": 2024}], ["c"])
+            single = await facade.query_collection(COLLECTION, ["graph networks"], n_results=1)
+            batch = await facade.query_collection_batch(COLLECTION, [{"query": "protein folding", "n_results": 1}, {"query": "graph", "where": {"year": 2024}}])
+            return single, batch
+
+    single, batch = asyncio.run(scenario())
+    assert single["ids"] == [["a"]]
+    assert batch[0]["ids"] == [["b"]]
+    assert set(batch[1]["ids"][0]) == {"b", "c"}
@@ -0,0 +1,61 @@
+COLLECTION = "publications"
+
+DOCUMENTS = {
+    "graph_1": ("graph networks pass messages between nodes", {"year": 2023, "source": "arxiv"}),
+    "graph_2": ("graph kernels compare graph structure", {"year": 2024, "source": "openalex"}),
+    "protein_1": ("protein folding with deep networks", {"year": 2023, "source": "arxiv"}),
+    "protein_2": ("protein structure prediction from sequence", {"year": 2024, "source": "arxiv"}),
+    "retrieval_1": ("dense retrieval with dual encoders", {"year": 2024, "source": "openalex"}),
+}
+
+
+def populate(manager):
+    ids = list(DOCUMENTS)
+    manager.add_documents(COLLECTION, [DOCUMENTS[chunk_id][0] for chunk_id in ids], [DOCUMENTS[chunk_id][1] for chunk_id in ids], ids)
+
+
+def test_batch_matches_single_queries(manager):
+    populate(manager)
+    queries = [
+        {"query": "graph networks", "n_results": 2},
+        {"query": "protein folding", "where": {"year": 2024}},
+        {"query": "graph networks", "n_results": 3, "where": {"source": "arxiv"}},
+        {"query": "dense retrieval"},
+    ]
+
+    batch = manager.query_collection_batch(COLLECTION, queries, default_n_results=4)
+
+    assert len(batch) == len(queries)
+    for query, result in zip(queries, batch):
+        single = manager.query_collection(COLLECTION, [query["query"]], n_results=query.get("n_results", 4), where=query.get("where"))
+        assert result["ids"] == single["ids"]
+        assert result["documents"] == single["documents"]
+    assert all(metadata["year"] == 2024 for metadata in batch[1]["metadatas"][0])
+    assert all(metadata["source"] == "arxiv" for metadata in batch[2]["metadatas"][0])
+
+
+def test_batch_embeds_distinct_texts_once_and_groups_filters(manager, monkeypatch):
+    populate(manager)
+    embedded = []
+    embed_texts = manager.embed_texts
+    monkeypatch.setattr(manager, "embed_texts", lambda texts: embedded.append(list(texts)) or embed_texts(texts))
+    calls = []
+    collection = manager.get_collection(COLLECTION)
+    query = collection.query
+    monkeypatch.setattr(collection, "query", lambda **kwargs: calls.append(kwargs) or query(**kwargs))
+
+    batch = manager.query_collection_batch(COLLECTION, [
+        {"query": "graph networks", "n_results": 1},
+        {"query": "protein folding", "n_results": 3},
+        {"query": "graph networks", "where": {"year": 2024}},
+    ])
+
+    assert embedded == [["graph networks", "protein folding"]]
+    # The unfiltered queries share one search call, fetched with the larger n_results and cut per query
+    assert len(calls) == 2
+    assert [len(result["ids"][0]) for result in batch] == [1, 3, 3]
+
+
+def test_batch_failure_returns_empty_results(manager):
+    assert manager.query_collection_batch("missing", [{"query": "a"}, {"query": "b"}]) == [{}, {}]
+    assert manager.query_collection_batch(COLLECTION, []) == []
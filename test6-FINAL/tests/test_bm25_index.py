@@ -0,0 +1,179 @@
+import math
+
+import numpy as np
+import pytest
+
+from utils.bm25_index import BM25Index, tokenize
+
+
+def segment_directories(directory):
+    return sorted(path.name for path in directory.glob("segment_*"))
+
+
+def test_open_reader_keeps_replaced_segments(tmp_path):
+    directory = tmp_path / "bm25"
+    writer = BM25Index.create(str(directory))
+    writer.add(["a", "b"], ["graph neural networks", "protein folding"])
+    reader = BM25Index.open(str(directory))
+    reader_segments = [segment.directory for segment in reader.segments]
+
+    writer.add(["c"], ["graph transformers"])
+    writer.compact()
+    writer.add(["d"], ["folding at home"])
+
+    assert all(path.exists() for path in reader_segments)
+    assert [chunk_id for chunk_id, _ in reader.search("protein")] == ["b"]
+
+    reader.close()
+    writer.add(["e"], ["graph kernels"])
+    assert not any(path.exists() for path in reader_segments)
+    reopened = BM25Index.open(str(directory))
+    assert len(reopened) == 5 and set(segment_directories(directory)) == {segment.name for segment in reopened.segments}
+
+
+def test_stale_writer_picks_up_other_commits(tmp_path):
+    directory = tmp_path / "bm25"
+    first = BM25Index.create(str(directory))
+    first.add(["a"], ["graph neural networks"])
+    second = BM25Index.open(str(directory))
+
+    second.add(["b"], ["protein folding"])
+    first.add(["c"], ["graph transformers"])
+
+    reopened = BM25Index.open(str(directory))
+    assert len(reopened) == 3
+    assert [chunk_id for chunk_id, _ in reopened.search("protein")] == ["b"]
+
+
+def test_rebuild_replaces_segments_under_open_reader(tmp_path):
+    directory = tmp_path / "bm25"
+    reader = BM25Index.create(str(directory))
+    reader.add(["a"], ["graph neural networks"])
+
+    rebuilt = BM25Index.build(str(directory), [(["x", "y"], ["protein folding", "graph kernels"], [None, None])])
+
+    assert [chunk_id for chunk_id, _ in reader.search("graph")] == ["a"]
+    assert len(rebuilt) == 2 and len(BM25Index.open(str(directory))) == 2
+
+
+CORPUS = {
+    f"doc_{i}": text for i, text in enumerate([
+        "graph neural networks learn node embeddings",
+        "protein folding with deep networks",
+        "graph kernels compare graph structure",
+        "retrieval augmented generation grounds answers",
+        "dense retrieval with dual encoders",
+        "sparse retrieval with bm25 and inverted indexes",
+        "protein structure prediction from sequence",
+        "message passing graph networks",
+        "contrastive learning of sentence embeddings",
+        "bm25 remains a strong retrieval baseline",
+        "folding proteins on consumer hardware",
+        "embeddings for retrieval and clustering",
+    ])
+}
+QUERIES = ["graph networks", "protein folding", "retrieval embeddings bm25", "graph graph kernels", "unknown words"]
+
+
+def multi_segment_index(directory):
+    index = BM25Index.create(str(directory), max_segments=100)
+    ids = list(CORPUS)
+    for start in range(0, len(ids), 3):
+        index.add(ids[start:start + 3], [CORPUS[chunk_id] for chunk_id in ids[start:start + 3]])
+    index.add(["doc_0"], ["stale text that is replaced"])
+    index.add(["doc_0"], [CORPUS["doc_0"]])
+    index.add(["gone"], ["graph protein retrieval"])
+    index.delete(["gone"])
+    return index
+
+
+def test_scores_match_rank_bm25(tmp_path):
+    rank_bm25 = pytest.importorskip("rank_bm25")
+
+    class SmoothIdfBM25(rank_bm25.BM25Okapi):
+        # The index's idf, log(1 + (N - df + 0.5) / (df + 0.5)), everything else is BM25Okapi's
+        def _calc_idf(self, nd):
+            self.idf = {word: math.log(1 + (self.corpus_size - freq + 0.5) / (freq + 0.5)) for word, freq in nd.items()}
+
+    index = multi_segment_index(tmp_path / "bm25")
+    assert len(index.segments) > 1
+    ids = list(CORPUS)
+    reference = SmoothIdfBM25([tokenize(CORPUS[chunk_id]) for chunk_id in ids])
+
+    for query in QUERIES:
+        expected = {chunk_id: score for chunk_id, score in zip(ids, reference.get_scores(tokenize(query))) if score > 0}
+        hits = dict(index.search(query, n_results=len(ids)))
+        assert hits.keys() == expected.keys()
+        for chunk_id, score in expected.items():
+            assert hits[chunk_id] == pytest.approx(score, rel=1e-5)
+
+
+def test_single_term_ranking_matches_bm25okapi(tmp_path):
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    index = multi_segment_index(tmp_path / "bm25")
+    ids = list(CORPUS)
+    reference = rank_bm25.BM25Okapi([tokenize(CORPUS[chunk_id]) for chunk_id in ids])
+
+    for term in ["graph", "protein", "retrieval", "embeddings", "bm25"]:
+        scores = dict(zip(ids, reference.get_scores([term])))
+        hits = index.search(term, n_results=len(ids))
+        # Same documents, and BM25Okapi's scores never increase down the index's ranking (ties may swap)
+        assert {chunk_id for chunk_id, _ in hits} == {chunk_id for chunk_id, score in scores.items() if score > 0}
+        ranked = [scores[chunk_id] for chunk_id, _ in hits]
+        assert all(a >= b - 1e-9 for a, b in zip(ranked, ranked[1:]))
+
+
+METADATA = {
+    f"doc_{i}": metadata for i, metadata in enumerate([
+        {"year": 2021, "source": "arxiv", "section": "method"},
+        {"year": 2023, "source": "openalex", "section": "results"},
+        {"year": "2024", "source": "arxiv"},
+        {"source": "arxiv", "section": "method"},
+        {"year": 2022, "source": "openalex", "section": "abstract"},
+        {"year": 2024, "source": "arxiv", "section": "results"},
+        None,
+        {"year": 2020, "source": "openalex", "section": "method"},
+        {"year": 2023, "source": "arxiv", "section": "abstract"},
+        {"year": 2024, "source": "openalex", "section": "method"},
+        {"year": 2021, "source": "arxiv", "section": "results"},
+        {"year": 2025, "source": "arxiv", "section": "method"},
+    ])
+}
+
+
+def filtered_index(directory):
+    index = BM25Index.create(str(directory), max_segments=100)
+    ids = list(CORPUS)
+    for start in range(0, len(ids), 4):
+        batch = ids[start:start + 4]
+        index.add(batch, [CORPUS[chunk_id] for chunk_id in batch], [METADATA[chunk_id] for chunk_id in batch])
+    index.delete(["doc_9"])
+    return index
+
+
+@pytest.mark.parametrize("filters, predicate", [
+    ({"year_from": 2023}, lambda metadata: float(metadata.get("year", 0)) >= 2023),
+    ({"source": "arxiv"}, lambda metadata: metadata.get("source") == "arxiv"),
+    ({"section": "method", "year_from": 2021}, lambda metadata: metadata.get("section") == "method" and metadata.get("year", 0) >= 2021),
+    ({"source": "unknown"}, lambda metadata: False),
+])
+def test_filters_match_the_metadata(tmp_path, filters, predicate):
+    index = filtered_index(tmp_path / "bm25")
+
+    for query in QUERIES:
+        unfiltered = index.search(query, n_results=len(CORPUS))
+        expected = [(chunk_id, score) for chunk_id, score in unfiltered if predicate(METADATA[chunk_id] or {})]
+        assert index.search(query, n_results=len(CORPUS), **filters) == expected
+        # The top-k of the filtered rows, not the filtered top-k of all rows
+        assert index.search(query, n_results=2, **filters) == expected[:2]
+
+
+def test_row_filter_masks_agree_with_full_masks(tmp_path):
+    index = filtered_index(tmp_path / "bm25")
+
+    for segment in index.segments:
+        full = segment.filter_mask(2022, "arxiv", None)
+        rows = np.arange(len(segment))[::-1].copy()
+        assert (segment.filter_mask(2022, "arxiv", None, rows=rows) == full[rows]).all()
+        # Tombstoned rows never pass, not even without filters
+        assert (segment.filter_mask() == ~np.asarray(segment.deleted)).all()
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain_community")
+from utils import ingestion_pipeline
+from utils.bulk_index import paper_base_id, reindex_directory, source_base_ids
+
+COLLECTION = "scientific_publications"
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    sources = {
+        "graph.pdf": {"title": "Graph  Networks", "authors": ["Jane Doe", "John Roe"], "year": 2023, "doi": "10.1000/graph.1"},
+        "protein.pdf": {"title": "Protein Folding", "authors": "Ann Smith", "year": 2024, "arxiv_id": "2401.01234"},
+        "deleted.pdf": {"title": "Deleted Paper", "doi": "10.1000/deleted"},
+    }
+    (pdf_dir / "sources.json").write_text(json.dumps(sources), encoding="utf-8")
+    write_paper(pdf_dir / "graph.pdf", "message passing over citation graphs")
+    write_paper(pdf_dir / "protein.pdf", "structure prediction from sequence")
+    return pdf_dir
+
+
+def write_paper(path, topic):
+    path.write_text(" ".join(f"We study {topic} in experiment {i}." for i in range(20)), encoding="utf-8")
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    # Reads the fake PDFs as text, so no PDF parser or worker processes are needed
+    extracted = []
+
+    def fake_iter_pdf_texts(pdf_paths, **kwargs):
+        for idx, path in enumerate(pdf_paths):
+            extracted.append(path)
+            with open(path, encoding="utf-8") as f:
+                yield idx, f.read(), None
+
+    monkeypatch.setattr(ingestion_pipeline, "iter_pdf_texts", fake_iter_pdf_texts)
+    return extracted
+
+
+def base_ids(manager):
+    return {metadata["base_id"] for metadata in manager.get_collection(COLLECTION).get(include=["metadatas"])["metadatas"]}
+
+
+def test_paper_base_ids_and_deleted_sources(pdf_dir):
+    assert paper_base_id("10.1000/graph.1", None, "graph") == "10_1000_graph_1"
+    assert paper_base_id(None, "2401.01234", "protein") == "2401_01234"
+    assert paper_base_id(None, None, "notes") == "notes"
+    assert source_base_ids(str(pdf_dir)) == ({"10_1000_graph_1", "2401_01234"}, {"10_1000_deleted"})
+
+
+def test_reindex_indexes_present_pdfs_and_resumes_from_checkpoint(manager, pdf_dir, extractions):
+    summary = reindex_directory(manager, str(pdf_dir), collection_name=COLLECTION, workers=1, deduplicate=False)
+
+    assert summary["upserted_papers"] == 2 and summary["errors"] == {}
+    assert base_ids(manager) == {"10_1000_graph_1", "2401_01234"}
+    first_chunk = manager.get_collection(COLLECTION).get(where={"$and": [{"base_id": "10_1000_graph_1"}, {"chunk_index": 0}]}, include=["metadatas"])["metadatas"][0]
+    assert first_chunk["title"] == "Graph Networks" and first_chunk["authors"] == "Jane Doe, John Roe" and first_chunk["source"] == "openalex"
+
+    extractions.clear()
+    summary = reindex_directory(manager, str(pdf_dir), collection_name=COLLECTION, workers=1, deduplicate=False)
+
+    assert summary["skipped_by_checkpoint"] == 2 and summary["papers"] == 0
+    assert extractions == []
+
+
+def test_restart_skips_unchanged_papers_and_keeps_screening_results(manager, pdf_dir, extractions):
+    reindex_directory(manager, str(pdf_dir), collection_name=COLLECTION, workers=1, deduplicate=False)
+    collection = manager.get_collection(COLLECTION)
+    first = collection.get(where={"$and": [{"base_id": "2401_01234"}, {"chunk_index": 0}]})
+    collection.update(ids=first["ids"], metadatas=[{"quality_rating": "high", "filtered": "true"}])
+    write_paper(pdf_dir / "protein.pdf", "folding on consumer hardware")
+
+    summary = reindex_directory(manager, str(pdf_dir), collection_name=COLLECTION, workers=1, deduplicate=False, restart=True)
+
+    assert summary["unchanged_papers"] == 1 and summary["upserted_papers"] == 1
+    rewritten = collection.get(where={"$and": [{"base_id": "2401_01234"}, {"chunk_index": 0}]}, include=["documents", "metadatas"])
+    assert "consumer hardware" in rewritten["documents"][0]
+    assert rewritten["metadatas"][0]["quality_rating"] == "high" and rewritten["metadatas"][0]["filtered"] == "true"
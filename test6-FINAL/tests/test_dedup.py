@@ -0,0 +1,102 @@
+import random
+
+import numpy as np
+import pytest
+
+from chroma_manager import ChromaManager
+from utils.dedup import NearDuplicateIndex, estimate_jaccard
+
+COLLECTION = "publications"
+
+SHARED = " ".join(f"transformers attend over every token of the input sequence step {i}" for i in range(8))
+OTHER = " ".join(f"graph networks pass messages between neighbouring nodes round {i}" for i in range(8))
+
+
+def ingest(manager, base_id, text):
+    return manager.add_chunked_documents(COLLECTION, [text], [{"source": "arxiv", "year": 2024}], [base_id], chunk_size=2000, chunk_overlap=0, mode="upsert", deduplicate=True)
+
+
+def metadatas(manager, base_id):
+    return manager.get_collection(COLLECTION).get(where={"base_id": base_id}, include=["metadatas"])["metadatas"]
+
+
+def test_rewritten_chunk_drops_duplicate_links(manager):
+    ingest(manager, "A", SHARED)
+    stats = ingest(manager, "B", SHARED)
+    assert stats["duplicate_chunks"] == 1
+    assert metadatas(manager, "A")[0]["duplicate_sources"] == "B"
+    assert manager.find_orphan_chunks(COLLECTION, referenced_base_ids={"B"}) == []
+
+    ingest(manager, "A", OTHER)
+
+    assert all("duplicate_sources" not in metadata and "duplicate_count" not in metadata for metadata in metadatas(manager, "A"))
+    assert manager.find_orphan_chunks(COLLECTION, referenced_base_ids={"B"}) == ["A_chunk_0"]
+
+
+def test_duplicate_of_unwritten_chunk_is_kept(manager):
+    # A's chunk is registered in the near-duplicate index but its write never happens
+    chunks, chunk_metadatas, _ = manager.build_chunks(SHARED, {"year": 2024}, "A", 2000, 0)
+    manager.drop_near_duplicates(COLLECTION, "A", chunks, chunk_metadatas)
+
+    chunks, chunk_metadatas, ids = manager.build_chunks(SHARED, {"year": 2024}, "B", 2000, 0)
+    chunks, chunk_metadatas, ids, duplicates = manager.drop_near_duplicates(COLLECTION, "B", chunks, chunk_metadatas)
+    assert chunks == [] and [target for target, _, _, _ in duplicates] == ["A_chunk_0"]
+
+    chunks, chunk_metadatas, ids, duplicate_refs, restored = manager.resolve_near_duplicates(COLLECTION, "B", chunks, chunk_metadatas, ids, duplicates)
+
+    assert restored == 1 and duplicate_refs == {}
+    assert ids == ["B_chunk_0"] and chunks == [SHARED]
+    assert chunk_metadatas[0]["chunk_index"] == 0 and chunk_metadatas[0]["total_chunks"] == 1
+
+
+def test_pipeline_keeps_duplicates_of_failed_paper(manager, monkeypatch):
+    IngestionPipeline = pytest.importorskip("utils.ingestion_pipeline").IngestionPipeline
+    replace_documents = manager.replace_documents
+
+    def failing_replace(collection_name, documents, metadatas, ids, replaced_ids, embeddings=None):
+        if ids and ids[0].startswith("A_"):
+            raise RuntimeError("write failed")
+        return replace_documents(collection_name, documents, metadatas, ids, replaced_ids, embeddings=embeddings)
+
+    monkeypatch.setattr(manager, "replace_documents", failing_replace)
+    papers = [{"base_id": base_id, "metadata": {"year": 2024}, "fallback_text": SHARED} for base_id in ("A", "B")]
+    summary = IngestionPipeline(manager, collection_name=COLLECTION, chunk_size=2000, chunk_overlap=0, clean_text=False, deduplicate=True).run(papers)
+
+    assert set(summary["errors"]) == {"A"}
+    assert summary["duplicate_chunks"] == 0
+    assert manager.get_collection(COLLECTION).get(where={"base_id": "B"}, include=["documents"])["documents"] == [SHARED]
+
+
+def test_managers_share_one_near_duplicate_index(manager):
+    ingest(manager, "A", SHARED)
+    other = ChromaManager(persist_directory=manager.persist_directory, embedding_function=manager.embedding_function)
+    other.connect()
+
+    assert other._get_dedup_index(COLLECTION) is manager._get_dedup_index(COLLECTION)
+    stats = other.add_chunked_documents(COLLECTION, [SHARED], [{"year": 2024}], ["B"], chunk_size=2000, chunk_overlap=0, mode="upsert", deduplicate=True)
+    assert stats["duplicate_chunks"] == 1
+
+
+def test_signatures_are_uint32(manager):
+    signature = manager._get_dedup_index(COLLECTION).hasher.signature(SHARED)
+    assert signature.dtype == np.uint32 and signature.nbytes == 512
+
+
+def test_near_threshold_duplicates_are_found():
+    generator = random.Random(7)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    index = NearDuplicateIndex(threshold=0.85)
+    pairs = []
+    for doc in range(200):
+        tokens = [generator.choice(vocabulary) for _ in range(300)]
+        index.add(f"doc_{doc}", index.hasher.signature(" ".join(tokens)), owner=str(doc))
+        for position in generator.sample(range(0, 300, 10), generator.randint(3, 5)):
+            tokens[position] = generator.choice(vocabulary)
+        pairs.append((f"doc_{doc}", index.hasher.signature(" ".join(tokens))))
+
+    # Pairs whose full signatures agree on at least the threshold, only the LSH banding can lose them
+    above = [(key, signature) for key, signature in pairs if estimate_jaccard(signature, index._signatures[key]) >= index.threshold]
+    found = sum(1 for key, signature in above if (index.query(signature) or (None,))[0] == key)
+
+    assert len(above) > 50
+    assert found / len(above) >= 0.95
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils.dense_benchmark import benchmark_dense, write_report
+from utils.hnsw_sweep import exact_top_k, recall_at_k
+from utils.quantized_store import Projection
+
+COLLECTION = "publications"
+DIMENSION = 32
+
+
+def populate(manager, count, distance_metric="l2", seed=0):
+    # Vectors on an 8-dimensional subspace plus noise, so a 12-dimensional projection keeps nearly all variance
+    rng = np.random.default_rng(seed)
+    basis = np.random.default_rng(42).normal(size=(8, DIMENSION))
+    vectors = (rng.normal(size=(count, 8)) @ basis + 0.05 * rng.normal(size=(count, DIMENSION))).astype(np.float32)
+    if COLLECTION not in manager.list_collections():
+        manager.create_publications_collection(COLLECTION, distance_metric=distance_metric)
+    ids = [f"doc_{seed}_{i}" for i in range(count)]
+    manager.add_documents(COLLECTION, [f"paper {chunk_id}" for chunk_id in ids], [{"year": 2020 + i % 5} for i in range(count)], ids, embeddings=vectors.tolist())
+    return ids, vectors
+
+
+@pytest.mark.parametrize("distance_metric", ["l2", "cosine"])
+def test_two_stage_search_recall(manager, distance_metric):
+    ids, vectors = populate(manager, 500, distance_metric)
+    queries = vectors[::25] + 0.01
+
+    store = manager.get_quantized_store(COLLECTION, "float32", projection="pca12")
+    results = store.search(manager.get_collection(COLLECTION), queries.tolist(), n_results=10, rescore_factor=4)
+
+    assert store.codes.shape == (500, 12)
+    row_of = {chroma_id: row for row, chroma_id in enumerate(ids)}
+    found = [[row_of[chroma_id] for chroma_id in result["ids"][0]] for result in results]
+    assert recall_at_k(found, exact_top_k(vectors, queries, 10, distance_metric)) >= 0.95
+
+
+def test_projection_is_reused_until_the_collection_doubles(manager):
+    populate(manager, 100)
+    fitted = manager.fit_projection(COLLECTION, "pca12")
+    assert fitted.fitted_on == 100 and fitted.explained_variance > 0.99
+
+    populate(manager, 60, seed=1)
+    assert manager.fit_projection(COLLECTION, "pca12").fitted_on == 100
+    assert manager.fit_projection(COLLECTION, "pca12", refit=True).fitted_on == 160
+
+    populate(manager, 200, seed=2)
+    assert manager.fit_projection(COLLECTION, "pca12").fitted_on == 360
+
+
+def test_projection_specs_and_prefix_projection():
+    assert Projection.parse_spec("pca64") == ("pca", 64)
+    assert Projection.parse_spec("prefix128") == ("prefix", 128)
+    with pytest.raises(ValueError):
+        Projection.parse_spec("svd64")
+
+    vectors = np.random.default_rng(0).normal(size=(50, 6)).astype(np.float32)
+    prefix = Projection.fit(vectors, "prefix", 4)
+    assert np.array_equal(prefix.project_vectors(vectors), vectors[:, :4])
+    # Only l2 queries are centered, for cosine and ip the constant q . mean is dropped
+    pca = Projection.fit(vectors, "pca", 3)
+    assert np.allclose(pca.project_queries(vectors[:2], "l2"), pca.project_vectors(vectors[:2]), atol=1e-5)
+    assert np.allclose(pca.project_queries(vectors[:2], "ip"), vectors[:2] @ pca.components.T, atol=1e-5)
+
+
+def test_benchmark_compares_every_engine(manager, tmp_path):
+    populate(manager, 200)
+
+    report = benchmark_dense(manager, COLLECTION, k=5, num_queries=20, projections=("pca12",), dtypes=("int8",), rescore_factors=(2, 8))
+
+    engines = [(entry["engine"], entry["projection"], entry["dtype"], entry["rescore_factor"]) for entry in report["results"]]
+    assert engines == [("chroma-hnsw", None, "float32", None), ("quantized", None, "int8", 2), ("quantized", None, "int8", 8), ("reduced", "pca12", "float32", 2), ("reduced", "pca12", "float32", 8)]
+    assert all(entry["recall_at_k"] >= 0.9 for entry in report["results"])
+    reduced = report["results"][-1]
+    assert reduced["memory_bytes"] < report["float32_bytes"] and reduced["explained_variance"] > 0.99
+
+    write_report(report, str(tmp_path / "dense.json"))
+    assert json.loads((tmp_path / "dense.json").read_text())["results"] == report["results"]
+    assert "| reduced | pca12 | float32 | 8 |" in (tmp_path / "dense.md").read_text()
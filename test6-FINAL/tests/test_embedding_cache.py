@@ -0,0 +1,78 @@
+import sqlite3
+
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache, embed_with_cache
+
+MODEL = "test-model@1"
+
+
+def vector(value):
+    return np.full(4, value, dtype=np.float32)
+
+
+def access_times(path):
+    with sqlite3.connect(str(path)) as conn:
+        return dict(conn.execute("SELECT key, last_access FROM embeddings"))
+
+
+def test_lookups_do_not_write_until_the_flush_size(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), access_flush_size=3)
+    cache.put_many(MODEL, {"a": vector(1), "b": vector(2), "c": vector(3)})
+    stored = access_times(tmp_path / "cache.sqlite3")
+    changes = cache._conn.total_changes
+
+    assert set(cache.get_many(["a", "b", "missing"])) == {"a", "b"}
+    assert cache._conn.total_changes == changes
+    assert access_times(tmp_path / "cache.sqlite3") == stored
+
+    cache.get_many(["c"])
+    updated = access_times(tmp_path / "cache.sqlite3")
+    assert all(updated[key] >= stored[key] for key in stored) and cache._conn.total_changes == changes + 3
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_close_writes_buffered_access_times(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = EmbeddingCache(str(path))
+    cache.put_many(MODEL, {"a": vector(1)})
+    with sqlite3.connect(str(path)) as conn:
+        conn.execute("UPDATE embeddings SET last_access = 0")
+
+    cache.get_many(["a"])
+    assert access_times(path)["a"] == 0
+    cache.close()
+    assert access_times(path)["a"] > 0
+
+
+def test_eviction_sees_buffered_hits(tmp_path):
+    # Room for three 16-byte vectors, "a" is the oldest entry but was read last
+    path = tmp_path / "cache.sqlite3"
+    cache = EmbeddingCache(str(path), max_bytes=48)
+    cache.put_many(MODEL, {key: vector(1) for key in "abc"})
+    with sqlite3.connect(str(path)) as conn:
+        conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(1, "a"), (2, "b"), (3, "c")])
+    cache.get_many(["a"])
+
+    cache.put_many(MODEL, {"d": vector(4)})
+
+    assert set(cache.get_many(list("abcd"))) == {"a", "c", "d"}
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+def test_embed_with_cache_embeds_only_missing_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] * 4 for text in texts]
+
+    first = embed_with_cache(cache, MODEL, ["graph networks", "protein  folding", "graph networks"], embed)
+    second = embed_with_cache(cache, MODEL, ["protein folding", "new text"], embed)
+
+    assert calls == [["graph networks", "protein  folding"], ["new text"]]
+    assert np.array_equal(first[1], second[0])
+    cache.close()
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.embedding_executor import EmbeddingExecutor
+
+
+class StandInEmbeddingServer:
+    """Ollama-style /api/embed endpoint on localhost that records every batch it receives"""
+
+    def __init__(self, delay: float = 0.0, max_body_bytes: int = None):
+        self.delay = delay
+        self.max_body_bytes = max_body_bytes
+        self.batches = []
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                server.requests += 1
+                if server.max_body_bytes is not None and len(body) > server.max_body_bytes:
+                    self.send_error(413, "Payload Too Large")
+                    return
+                texts = json.loads(body)["input"]
+                server.batches.append(texts)
+                time.sleep(server.delay)
+                payload = json.dumps({"embeddings": [[float(len(text)), float(sum(map(ord, text)) % 997)] for text in texts]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/api/embed"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def embed_function(self, timeout: float = 5.0):
+        def embed(texts):
+            request = urllib.request.Request(self.url, data=json.dumps({"input": list(texts)}).encode(), headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read())["embeddings"]
+        return embed
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(StandInEmbeddingServer(**kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def expected_vector(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 997)]
+
+
+def test_results_keep_input_order_and_batch_size_grows(stand_in):
+    server = stand_in()
+    executor = EmbeddingExecutor(server.embed_function(), max_concurrency=3, batch_size=4, target_latency=5.0)
+    texts = [f"chunk {i} " * (i % 7 + 1) for i in range(200)]
+    try:
+        assert executor.embed(texts) == [expected_vector(text) for text in texts]
+        assert executor.stats()["batch_size"] > 4
+        assert sum(len(batch) for batch in server.batches) == len(texts)
+    finally:
+        executor.close()
+
+
+def test_slow_backend_shrinks_batches(stand_in):
+    server = stand_in(delay=0.1)
+    executor = EmbeddingExecutor(server.embed_function(), max_concurrency=2, batch_size=16, target_latency=0.05)
+    try:
+        executor.embed([f"text {i}" for i in range(24)])
+        assert executor.stats()["batch_size"] < 16
+        assert executor.stats()["failures"] == 0
+    finally:
+        executor.close()
+
+
+def test_batches_are_capped_by_characters(stand_in):
+    server = stand_in()
+    executor = EmbeddingExecutor(server.embed_function(), batch_size=64, max_batch_chars=1000)
+    texts = ["x" * 300] * 20 + ["y" * 2500]
+    try:
+        assert executor.embed(texts) == [expected_vector(text) for text in texts]
+        assert all(len(batch) == 1 or sum(map(len, batch)) <= 1000 for batch in server.batches)
+        assert ["y" * 2500] in server.batches
+    finally:
+        executor.close()
+
+
+def test_oversized_payload_is_split_until_it_fits(stand_in):
+    server = stand_in(max_body_bytes=2000)
+    executor = EmbeddingExecutor(server.embed_function(), max_concurrency=2, batch_size=32)
+    texts = [f"{i:03d}" + "z" * 150 for i in range(32)]
+    try:
+        assert executor.embed(texts) == [expected_vector(text) for text in texts]
+        assert executor.stats()["failures"] > 0
+        assert executor.stats()["batch_size"] < 32
+        assert max(len(batch) for batch in server.batches) * 160 < 2000
+    finally:
+        executor.close()
+
+
+def test_single_text_over_the_limit_raises(stand_in):
+    server = stand_in(max_body_bytes=500)
+    executor = EmbeddingExecutor(server.embed_function(), batch_size=8)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            executor.embed(["short"] * 4 + ["w" * 1000])
+        assert error.value.code == 413
+    finally:
+        executor.close()
+
+
+def test_timeout_is_raised_without_splitting(stand_in):
+    server = stand_in(delay=1.0)
+    executor = EmbeddingExecutor(server.embed_function(timeout=0.2), max_concurrency=1, batch_size=8)
+    try:
+        with pytest.raises((TimeoutError, urllib.error.URLError)):
+            executor.embed([f"text {i}" for i in range(8)])
+        assert server.requests == 1
+        assert executor.stats()["batch_size"] == 8
+    finally:
+        executor.close()
+
+
+def test_backend_down_is_raised_without_splitting(stand_in):
+    server = stand_in()
+    server.stop()
+    calls = []
+    embed = server.embed_function(timeout=1.0)
+
+    def counting_embed(texts):
+        calls.append(len(texts))
+        return embed(texts)
+
+    executor = EmbeddingExecutor(counting_embed, max_concurrency=1, batch_size=8)
+    try:
+        with pytest.raises(urllib.error.URLError) as error:
+            executor.embed([f"text {i}" for i in range(8)])
+        assert isinstance(error.value.reason, ConnectionError)
+        assert calls == [8]
+    finally:
+        executor.close()
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from chroma_manager import ChromaManager
+from conftest import HashingEmbeddingFunction
+from utils.embedding_registry import DEFAULT_MODEL, EmbeddingMismatchError, EmbeddingRegistry
+
+COLLECTION = "scientific_publications"
+
+
+class OtherEmbeddingFunction(HashingEmbeddingFunction):
+    @staticmethod
+    def name():
+        return "test-other"
+
+
+def test_default_model_is_the_flows_original_model(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_MODEL", raising=False)
+    assert EmbeddingRegistry().model == DEFAULT_MODEL == "ollama:nomic-embed-text"
+
+    monkeypatch.setenv("EMBEDDING_MODEL", "default")
+    assert EmbeddingRegistry().model == "default"
+
+
+def test_pinned_collection_explains_how_to_resolve_a_mismatch(manager):
+    manager.add_documents(COLLECTION, ["graph networks"], [{"year": 2024}], ["a"])
+    other = ChromaManager(persist_directory=manager.persist_directory, embedding_function=OtherEmbeddingFunction())
+    other.connect()
+
+    # Chroma itself refuses the other embedding function, the error still says how to resolve it
+    with pytest.raises(EmbeddingMismatchError, match="test-hashing.*reindex --drop"):
+        other.create_publications_collection(COLLECTION)
+    with pytest.raises(EmbeddingMismatchError, match="reindex --drop"):
+        other.add_documents(COLLECTION, ["protein folding"], [{"year": 2024}], ["b"])
+
+
+def test_pin_names_the_stored_model(manager):
+    collection = manager.create_publications_collection(COLLECTION)
+    collection.modify(metadata={"embedding_model": "ollama:nomic-embed-text"})
+
+    with pytest.raises(EmbeddingMismatchError, match="EMBEDDING_MODEL=ollama:nomic-embed-text.*reindex --drop"):
+        manager.add_documents(COLLECTION, ["graph networks"], [{"year": 2024}], ["a"])
+
+
+def test_unpinned_collection_of_another_dimension_is_detected(manager):
+    # A collection written before the pin existed, e.g. with 768-dimensional nomic-embed-text vectors
+    legacy = manager.client.create_collection(COLLECTION, embedding_function=None)
+    legacy.add(ids=["old"], embeddings=np.ones((1, 8), dtype=np.float32), documents=["old chunk"])
+
+    with pytest.raises(EmbeddingMismatchError, match="8-dimensional embeddings of an unrecorded model.*reindex --drop"):
+        manager.add_documents(COLLECTION, ["graph networks"], [{"year": 2024}], ["a"])
+    assert manager.client.get_collection(COLLECTION).count() == 1
+
+
+def test_unpinned_collection_of_the_same_dimension_is_pinned(manager):
+    legacy = manager.client.create_collection(COLLECTION, embedding_function=None)
+    legacy.add(ids=["old"], embeddings=np.ones((1, HashingEmbeddingFunction.DIMENSION), dtype=np.float32), documents=["old chunk"])
+
+    manager.add_documents(COLLECTION, ["graph networks"], [{"year": 2024}], ["a"])
+
+    metadata = manager.client.get_collection(COLLECTION).metadata
+    assert metadata["embedding_model"] == "test-hashing" and metadata["embedding_dimension"] == HashingEmbeddingFunction.DIMENSION
@@ -0,0 +1,79 @@
+import argparse
+import functools
+import json
+
+import pytest
+
+import chroma_manager
+
+COLLECTION = "publications"
+
+
+@pytest.fixture
+def papers(manager):
+    # kept: PDF present, removed: PDF deleted, abstract: never had a PDF, linked: duplicate of a kept paper
+    chunks = {
+        "kept_0": {"base_id": "kept"},
+        "kept_1": {"base_id": "kept"},
+        "removed_0": {"base_id": "removed"},
+        "removed_1": {"base_id": "removed"},
+        "abstract_0": {"base_id": "abstract"},
+        "linked_0": {"base_id": "linked", "duplicate_sources": "other,kept"},
+        "loose": {"year": 2024},
+    }
+    manager.add_documents(COLLECTION, [f"text of {chunk_id}" for chunk_id in chunks], list(chunks.values()), list(chunks))
+    return chunks
+
+
+def stored_ids(manager):
+    return sorted(manager.get_collection(COLLECTION).get()["ids"])
+
+
+def test_orphans_respect_candidates_and_duplicate_links(manager, papers):
+    assert sorted(manager.find_orphan_chunks(COLLECTION, {"kept"})) == ["abstract_0", "removed_0", "removed_1"]
+    assert sorted(manager.find_orphan_chunks(COLLECTION, {"kept"}, candidate_base_ids={"removed"})) == ["removed_0", "removed_1"]
+
+
+def test_dry_run_reports_without_deleting(manager, papers):
+    summary = manager.delete_orphan_chunks(COLLECTION, {"kept"}, candidate_base_ids={"removed"}, dry_run=True)
+
+    assert summary == {"collection": COLLECTION, "orphan_chunks": 2, "orphan_papers": 1, "deleted_chunks": 0, "dry_run": True}
+    assert stored_ids(manager) == sorted(papers)
+
+
+def test_apply_deletes_in_batches_and_updates_stats(manager, papers):
+    before = manager.collection_stats(COLLECTION)
+    assert before["chunks"] == 7 and before["papers"] == 4 and before["chunks_without_paper"] == 1
+    assert before["max_chunks_per_paper"] == 2 and before["embedding_bytes"] == 7 * 32 * 4
+
+    summary = manager.delete_orphan_chunks(COLLECTION, {"kept"}, batch_size=1)
+
+    assert summary["deleted_chunks"] == 3 and summary["orphan_papers"] == 2
+    assert stored_ids(manager) == ["kept_0", "kept_1", "linked_0", "loose"]
+    assert manager.get_bm25_index(COLLECTION).search("removed_0") == []
+    after = manager.collection_stats(COLLECTION)
+    assert after["chunks"] == 4 and after["papers"] == 2
+    assert after["bytes"] < before["bytes"]
+
+
+def test_gc_command_uses_sources_json(manager, papers, tmp_path, monkeypatch, capsys):
+    # gc reads sources.json through utils.bulk_index, which loads the PDF extraction stack
+    pytest.importorskip("langchain_community")
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    (pdf_dir / "kept.pdf").write_bytes(b"%PDF")
+    (pdf_dir / "sources.json").write_text(json.dumps({"kept.pdf": {}, "removed.pdf": {}}), encoding="utf-8")
+    monkeypatch.setattr(chroma_manager, "ChromaManager", functools.partial(chroma_manager.ChromaManager, embedding_function=manager.embedding_function))
+    args = argparse.Namespace(persist_directory=manager.persist_directory, collection=COLLECTION, pdf_dir=str(pdf_dir), include_unlisted=False, batch_size=500, dry_run=True)
+
+    assert chroma_manager.gc(args) == 0
+    assert "Would delete 2 orphan chunks of 1 papers" in capsys.readouterr().out
+    assert stored_ids(manager) == sorted(papers)
+
+    args.dry_run = False
+    chroma_manager.gc(args)
+    assert "removed_0" not in stored_ids(manager) and "abstract_0" in stored_ids(manager)
+
+    args.include_unlisted = True
+    chroma_manager.gc(args)
+    assert stored_ids(manager) == ["kept_0", "kept_1", "linked_0", "loose"]
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from utils.hnsw_sweep import SWEEP_SUFFIX, exact_top_k, recall_at_k, sweep_hnsw, write_report
+
+COLLECTION = "publications"
+
+
+def populate(manager, count=120, **kwargs):
+    manager.create_publications_collection(COLLECTION, **kwargs)
+    ids = [f"doc_{i}" for i in range(count)]
+    # Random vectors instead of the hashing embeddings, whose ties would make exact recall ambiguous
+    embeddings = np.random.default_rng(1).normal(size=(count, 32)).astype(np.float32).tolist()
+    manager.add_documents(COLLECTION, [f"paper {i}" for i in range(count)], [{"year": 2024} for _ in ids], ids, embeddings=embeddings)
+
+
+def test_exact_top_k_matches_brute_force():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8)).astype(np.float32)
+    queries = rng.normal(size=(5, 8)).astype(np.float32)
+
+    for space in ("l2", "cosine", "ip"):
+        if space == "l2":
+            distances = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+        elif space == "cosine":
+            normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            distances = -(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normed.T
+        else:
+            distances = -queries @ vectors.T
+        assert exact_top_k(vectors, queries, 4, space, block_size=2).tolist() == np.argsort(distances, axis=1)[:, :4].tolist()
+
+    assert recall_at_k([[0, 1], [2, 9]], np.array([[0, 1], [2, 3]])) == 0.75
+
+
+def test_build_parameters_are_stored_and_search_params_updated(manager):
+    populate(manager, count=10, hnsw_m=24, construction_ef=150, search_ef=40)
+    hnsw = manager.get_collection(COLLECTION).configuration["hnsw"]
+    assert hnsw["max_neighbors"] == 24 and hnsw["ef_construction"] == 150 and hnsw["ef_search"] == 40
+
+    manager.update_search_params(COLLECTION, search_ef=80)
+
+    assert manager.get_collection(COLLECTION).configuration["hnsw"]["ef_search"] == 80
+
+
+def test_sweep_reports_every_setting_and_cleans_up(manager, tmp_path):
+    populate(manager)
+
+    report = sweep_hnsw(manager, COLLECTION, k=5, num_queries=20, m_values=(8,), construction_ef_values=(50,), search_ef_values=(10, 100))
+
+    assert report["vectors"] == 100 and report["queries"] == 20 and report["k"] == 5
+    assert [(entry["M"], entry["search_ef"]) for entry in report["results"]] == [(8, 10), (8, 100)]
+    assert all(0.0 <= entry["recall_at_k"] <= 1.0 for entry in report["results"])
+    # With ef far above the collection size the search is exhaustive
+    assert report["results"][1]["recall_at_k"] == 1.0
+    assert report["recommendations"]["recall>=0.99"] is not None
+    assert f"{COLLECTION}{SWEEP_SUFFIX}" not in manager.list_collections()
+
+    write_report(report, str(tmp_path / "sweep.json"))
+    assert json.loads((tmp_path / "sweep.json").read_text())["results"] == report["results"]
+    assert "| 8 | 50 | 100 | 1.000 |" in (tmp_path / "sweep.md").read_text()
@@ -0,0 +1,65 @@
+import os
+
+from utils.pdf_cache import PdfTextCache
+
+
+def write_pdf(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_key_follows_content_and_extractor_version(tmp_path):
+    cache = PdfTextCache(str(tmp_path / "cache"), "v1")
+    original = write_pdf(tmp_path / "paper.pdf", b"%PDF same bytes")
+    renamed = write_pdf(tmp_path / "renamed.pdf", b"%PDF same bytes")
+    changed = write_pdf(tmp_path / "changed.pdf", b"%PDF other bytes")
+
+    assert cache.key_for(original) == cache.key_for(renamed)
+    assert cache.key_for(original) != cache.key_for(changed)
+    assert PdfTextCache(str(tmp_path / "cache"), "v2").key_for(original) != cache.key_for(original)
+
+
+def test_hits_and_misses_survive_reopening(tmp_path):
+    pdf = write_pdf(tmp_path / "paper.pdf", b"%PDF bytes")
+    cache = PdfTextCache(str(tmp_path / "cache"), "v1")
+    key = cache.key_for(pdf)
+
+    assert cache.get(key) is None
+    cache.put(key, "extracted text")
+    assert cache.get(key) == "extracted text"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    reopened = PdfTextCache(str(tmp_path / "cache"), "v1")
+    assert reopened.get(key) == "extracted text"
+    assert reopened.stats()["bytes"] == len("extracted text")
+    new_extractor = PdfTextCache(str(tmp_path / "cache"), "v2")
+    assert new_extractor.get(new_extractor.key_for(pdf)) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PdfTextCache(str(tmp_path / "cache"), "v1", max_bytes=250)
+    for i, key in enumerate(["aa01", "bb02", "cc03"]):
+        cache.put(key, "x" * 100)
+        # mtime is the access time, space the entries out so the order is unambiguous
+        os.utime(cache._entry_path(key), (1_000_000 + i, 1_000_000 + i))
+    assert cache.stats()["evictions"] == 1
+    assert cache.get("aa01") is None
+
+    # Reading bb02 makes cc03 the least recently used entry
+    assert cache.get("bb02") == "x" * 100
+    cache.put("dd04", "y" * 100)
+
+    assert cache.get("cc03") is None
+    assert cache.get("bb02") == "x" * 100
+    assert cache.get("dd04") == "y" * 100
+    assert cache.stats()["bytes"] <= 250
+    assert cache.stats()["evictions"] == 2
+
+
+def test_overwriting_an_entry_does_not_double_count(tmp_path):
+    cache = PdfTextCache(str(tmp_path / "cache"), "v1")
+    cache.put("aa01", "x" * 100)
+    cache.put("aa01", "y" * 40)
+
+    assert cache.get("aa01") == "y" * 40
+    assert cache.stats()["bytes"] == 40
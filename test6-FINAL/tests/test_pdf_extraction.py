@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+pytest.importorskip("langchain_community")
+from utils import pdf_extraction
+from utils.pdf_cache import PdfTextCache
+from utils.pdf_extraction import iter_pdf_texts
+
+# Extractors run in spawned workers, so they have to live at module level
+
+
+def echo_extractor(pdf_path):
+    with open(pdf_path, encoding="utf-8") as f:
+        return f.read()
+
+
+def hanging_extractor(pdf_path):
+    if "hang" in pdf_path:
+        time.sleep(60)
+    return echo_extractor(pdf_path)
+
+
+def allocating_extractor(pdf_path):
+    if "huge" in pdf_path:
+        ballast = bytearray(512 * 1024 * 1024)
+        time.sleep(60)
+        return str(len(ballast))
+    return echo_extractor(pdf_path)
+
+
+def failing_extractor(pdf_path):
+    if "broken" in pdf_path:
+        raise ValueError("not a PDF")
+    return echo_extractor(pdf_path)
+
+
+def write_pdfs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / f"{name}.pdf"
+        path.write_text(f"text of {name}", encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def test_worker_is_killed_on_timeout(tmp_path):
+    paths = write_pdfs(tmp_path, ["hang", "ok"])
+    events = []
+
+    results = {idx: (text, error) for idx, text, error in iter_pdf_texts(paths, max_workers=1, timeout=2, events=events, extractor=hanging_extractor)}
+
+    assert results[0][0] is None and results[0][1].startswith("timeout")
+    assert results[1] == ("text of ok", None)
+    assert [event["event"] for event in events] == ["timeout"]
+
+
+def test_worker_is_killed_above_memory_cap(tmp_path):
+    paths = write_pdfs(tmp_path, ["huge", "ok"])
+    events = []
+
+    results = {idx: (text, error) for idx, text, error in iter_pdf_texts(paths, max_workers=1, timeout=30, max_memory_mb=256, events=events, extractor=allocating_extractor)}
+
+    assert results[0][0] is None and results[0][1].startswith("memory_limit")
+    assert results[1] == ("text of ok", None)
+    assert [event["event"] for event in events] == ["memory_limit"]
+
+
+def test_cached_pdfs_start_no_workers(tmp_path, monkeypatch):
+    paths = write_pdfs(tmp_path, ["a", "b"])
+    cache = PdfTextCache(str(tmp_path / "cache"), "test")
+    for path in paths:
+        cache.put(cache.key_for(path), f"cached {path}")
+
+    started = []
+    sandbox_worker = pdf_extraction._SandboxWorker
+    monkeypatch.setattr(pdf_extraction, "_SandboxWorker", lambda *args: started.append(args) or sandbox_worker(*args))
+
+    results = sorted(iter_pdf_texts(paths, max_workers=4, cache=cache, extractor=echo_extractor))
+
+    assert [text for _, text, _ in results] == [f"cached {path}" for path in paths]
+    assert started == []
+
+
+def test_every_pdf_is_yielded_once_across_workers(tmp_path):
+    paths = write_pdfs(tmp_path, ["a", "b", "broken", "c", "d", "e"])
+    events = []
+
+    results = sorted(iter_pdf_texts(paths, max_workers=3, events=events, extractor=failing_extractor))
+
+    assert [idx for idx, _, _ in results] == list(range(len(paths)))
+    assert results[2][1] is None and results[2][2] == "ValueError: not a PDF"
+    assert [text for idx, text, _ in results if idx != 2] == [f"text of {name}" for name in ["a", "b", "c", "d", "e"]]
+    # An extractor exception is an ordinary failure, the worker keeps running
+    assert events == []
+
+
+def test_lazy_paths_are_pulled_with_bounded_look_ahead(tmp_path):
+    paths = write_pdfs(tmp_path, [f"paper_{i}" for i in range(10)])
+    pulled = []
+
+    def lazy_paths():
+        for path in paths:
+            pulled.append(path)
+            yield path
+
+    results = iter_pdf_texts(lazy_paths(), max_workers=2, max_in_flight=3, extractor=echo_extractor)
+    next(results)
+    assert len(pulled) <= 3
+    assert len(list(results)) == len(paths) - 1
+
+
+def test_extracted_texts_are_cached(tmp_path):
+    paths = write_pdfs(tmp_path, ["a", "broken"])
+    cache = PdfTextCache(str(tmp_path / "cache"), "test")
+
+    list(iter_pdf_texts(paths, max_workers=2, cache=cache, extractor=failing_extractor))
+
+    assert cache.get(cache.key_for(paths[0])) == "text of a"
+    assert cache.get(cache.key_for(paths[1])) is None
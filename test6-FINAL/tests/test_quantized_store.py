@@ -0,0 +1,133 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils.hnsw_sweep import exact_top_k, recall_at_k
+from utils.quantized_store import Projection, QuantizedVectorStore, UnsupportedFilterError
+
+COLLECTION = "publications"
+DIMENSION = 32
+
+
+def clustered_vectors(rng, count):
+    # Vectors on an 8-dimensional subspace plus noise, like real embeddings they are far from isotropic
+    basis = np.random.default_rng(42).normal(size=(8, DIMENSION))
+    return (rng.normal(size=(count, 8)) @ basis + 0.05 * rng.normal(size=(count, DIMENSION))).astype(np.float32)
+
+
+@pytest.fixture
+def populated(manager):
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, 600)
+    ids = [f"doc_{i}" for i in range(len(vectors))]
+    metadatas = [{"year": 2020 + i % 5, "source": ["arxiv", "openalex"][i % 2]} for i in range(len(vectors))]
+    metadatas[3] = {"year": 2024}
+    collection = manager.create_publications_collection(COLLECTION)
+    for start in range(0, len(ids), 200):
+        manager.add_documents(COLLECTION, [f"paper {i}" for i in range(start, start + 200)], metadatas[start:start + 200], ids[start:start + 200], embeddings=vectors[start:start + 200].tolist())
+    return collection, ids, vectors, metadatas, clustered_vectors(rng, 25)
+
+
+def recall(store, collection, ids, vectors, queries, k=10):
+    results = store.search(collection, queries.tolist(), n_results=k, rescore_factor=4)
+    row_of = {chroma_id: row for row, chroma_id in enumerate(ids)}
+    found = [[row_of[chroma_id] for chroma_id in result["ids"][0]] for result in results]
+    return recall_at_k(found, exact_top_k(vectors, queries, k))
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_recall_against_exact_search(populated, dtype):
+    collection, ids, vectors, _, queries = populated
+
+    store = QuantizedVectorStore.build(collection, dtype=dtype, model="test-hashing")
+
+    assert store.codes.dtype == np.dtype(dtype)
+    assert recall(store, collection, ids, vectors, queries) >= 0.98
+
+
+def test_projected_recall_against_exact_search(populated):
+    collection, ids, vectors, _, queries = populated
+    projection = Projection.fit(vectors, "pca", 12)
+
+    store = QuantizedVectorStore.build(collection, dtype="float32", model="test-hashing", projection=projection)
+
+    assert store.codes.shape == (len(ids), 12)
+    assert projection.explained_variance > 0.99
+    assert recall(store, collection, ids, vectors, queries) >= 0.95
+
+
+def test_distances_are_exact_after_rescoring(populated):
+    collection, ids, vectors, _, queries = populated
+    store = QuantizedVectorStore.build(collection, dtype="int8")
+
+    result = store.search(collection, queries[:1].tolist(), n_results=5)[0]
+
+    expected = ((vectors - queries[0]) ** 2).sum(axis=1)
+    rows = [ids.index(chroma_id) for chroma_id in result["ids"][0]]
+    assert result["distances"][0] == pytest.approx(expected[rows].tolist(), rel=1e-4)
+
+
+def test_filter_masks_match_the_metadata(populated):
+    collection, ids, _, metadatas, queries = populated
+    store = QuantizedVectorStore.build(collection, dtype="int8")
+    row_of = {chroma_id: row for row, chroma_id in enumerate(store.ids)}
+    ordered = [metadatas[ids.index(chroma_id)] for chroma_id in store.ids]
+
+    def expected(predicate):
+        return np.array([predicate(metadata) for metadata in ordered])
+
+    assert (store.where_mask({"year": {"$gte": 2023}}) == expected(lambda m: m["year"] >= 2023)).all()
+    assert (store.where_mask({"source": "arxiv"}) == expected(lambda m: m.get("source") == "arxiv")).all()
+    # Rows without the field match neither $ne nor $nin, as in Chroma
+    assert (store.where_mask({"source": {"$ne": "arxiv"}}) == expected(lambda m: m.get("source") == "openalex")).all()
+    assert (store.where_mask({"$or": [{"year": 2020}, {"$and": [{"year": 2024}, {"source": {"$in": ["arxiv"]}}]}]})
+            == expected(lambda m: m["year"] == 2020 or (m["year"] == 2024 and m.get("source") == "arxiv"))).all()
+    assert store.where_mask(None) is None
+
+    results = store.search(collection, queries[:3].tolist(), n_results=5, where={"year": 2021})
+    assert all(metadata["year"] == 2021 for result in results for metadata in result["metadatas"][0])
+    assert all(ordered[row_of[chroma_id]]["year"] == 2021 for result in results for chroma_id in result["ids"][0])
+
+    with pytest.raises(UnsupportedFilterError):
+        store.where_mask({"title": "x"})
+    with pytest.raises(UnsupportedFilterError):
+        store.where_mask({"source": {"$gt": "a"}})
+
+
+def test_saved_store_loads_memory_mapped(populated, tmp_path):
+    collection, ids, vectors, _, queries = populated
+    projection = Projection.fit(vectors, "pca", 12)
+    store = QuantizedVectorStore.build(collection, dtype="int8", model="test-hashing", projection=projection)
+    store.save(str(tmp_path / "store"))
+
+    loaded = QuantizedVectorStore.load(str(tmp_path / "store"))
+
+    assert isinstance(loaded.codes, np.memmap) and isinstance(loaded.ids.blob, np.memmap)
+    assert list(loaded.ids) == list(store.ids) and loaded.ids[7] == store.ids[7]
+    assert loaded.model == "test-hashing" and loaded.projection.spec == "pca12"
+    assert loaded.search(collection, queries[:5].tolist(), n_results=5) == store.search(collection, queries[:5].tolist(), n_results=5)
+    assert "ids" not in json.loads((tmp_path / "store" / "meta.json").read_text())
+    assert QuantizedVectorStore.load(str(tmp_path / "missing")) is None
+
+    # Saving again replaces the files, the mapped ones stay readable
+    first_id = loaded.ids[0]
+    store.save(str(tmp_path / "store"))
+    assert loaded.ids[0] == first_id
+
+
+def test_store_without_id_column_is_not_loaded(populated, tmp_path):
+    collection = populated[0]
+    QuantizedVectorStore.build(collection, dtype="float16").save(str(tmp_path / "store"))
+    # Stores saved before the ids moved out of meta.json are rebuilt
+    (tmp_path / "store" / "ids.bin").unlink()
+    (tmp_path / "store" / "ids.offsets.npy").unlink()
+
+    assert QuantizedVectorStore.load(str(tmp_path / "store")) is None
+
+
+def test_unsupported_filter_falls_back_to_chroma(manager, populated):
+    results = manager.query_quantized_batch(COLLECTION, [{"query": "paper 1", "where": {"title": "none"}}, {"query": "paper 2", "where": {"year": 2022}, "n_results": 3}])
+
+    assert results[0]["ids"] == [[]]
+    assert len(results[1]["ids"][0]) == 3 and all(metadata["year"] == 2022 for metadata in results[1]["metadatas"][0])
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from chroma_manager import ChromaManager, registry
+
+COLLECTION = "publications"
+
+
+def second_manager(manager, persist_directory=None):
+    other = ChromaManager(persist_directory=persist_directory or manager.persist_directory, embedding_function=manager.embedding_function)
+    other.connect()
+    return other
+
+
+def test_managers_share_client_and_collection_handles(manager):
+    manager.create_publications_collection(COLLECTION)
+    # A different spelling of the same directory resolves to the same client
+    other = second_manager(manager, os.path.join(manager.persist_directory, ".", ""))
+    before = registry.stats()
+
+    assert other.client is manager.client
+    assert other.get_collection(COLLECTION) is manager.get_collection(COLLECTION)
+    after = registry.stats()
+    assert after["clients_created"] == before["clients_created"]
+    assert after["collection_hits"] == before["collection_hits"] + 2
+
+
+def test_deleted_collection_handle_is_not_reused(manager):
+    manager.create_publications_collection(COLLECTION)
+    handle = manager.get_collection(COLLECTION)
+
+    second_manager(manager).delete_collection(COLLECTION)
+
+    with pytest.raises(Exception):
+        manager.get_collection(COLLECTION)
+    recreated = manager.create_publications_collection(COLLECTION)
+    assert recreated is not handle
+    assert manager.get_collection(COLLECTION) is recreated
+
+
+def test_shared_slots_are_per_directory_and_collection(manager, tmp_path):
+    slot = registry.shared(manager.persist_directory, COLLECTION, ("test",))
+
+    assert registry.shared(manager.persist_directory + "/", COLLECTION, ("test",)) is slot
+    assert registry.shared(manager.persist_directory, "other", ("test",)) is not slot
+    assert registry.shared(str(tmp_path / "elsewhere"), COLLECTION, ("test",)) is not slot
+
+    slot.value = "derived state"
+    registry.drop_shared(manager.persist_directory, COLLECTION, ("test",))
+    assert registry.shared(manager.persist_directory, COLLECTION, ("test",)) is slot
+    assert slot.value is None
@@ -0,0 +1,74 @@
+import pytest
+
+COLLECTION = "publications"
+
+PAPER = "\n".join([
+    "Introduction",
+    " ".join(f"retrieval augmented generation grounds answers in papers {i}" for i in range(12)),
+    "Method",
+    " ".join(f"chunks are embedded and stored with their section label {i}" for i in range(12)),
+    "Results",
+    " ".join(f"hybrid search finds more relevant chunks than dense search alone {i}" for i in range(12)),
+])
+METADATA = {"title": "Grounded answers", "source": "arxiv", "year": 2024}
+
+
+def stored_chunks(manager, base_id="P"):
+    stored = manager.get_collection(COLLECTION).get(where={"base_id": base_id}, include=["metadatas"])
+    return dict(zip(stored["ids"], stored["metadatas"]))
+
+
+def assert_consistent(chunks):
+    total = len(chunks)
+    hashes = {metadata["content_hash"] for metadata in chunks.values()}
+    assert len(hashes) == 1
+    for chunk_id, metadata in chunks.items():
+        assert chunk_id == f"P_chunk_{metadata['chunk_index']}"
+        assert metadata["total_chunks"] == total
+
+
+def test_rechunking_replaces_all_chunk_metadata(manager):
+    ingest = dict(collection_name=COLLECTION, documents=[PAPER], metadatas=[METADATA], base_ids=["P"], chunk_size=200, chunk_overlap=0, mode="upsert")
+
+    manager.add_chunked_documents(**ingest, chunking_strategy="sections")
+    before = stored_chunks(manager)
+    assert all("section" in metadata for metadata in before.values())
+
+    stats = manager.add_chunked_documents(**ingest, chunking_strategy="recursive")
+    after = stored_chunks(manager)
+
+    assert stats["updated"] == 1
+    assert after
+    assert not any("section" in metadata for metadata in after.values())
+    assert_consistent(after)
+    assert manager.is_unchanged(manager.get_stored_chunks(COLLECTION, ["P"])["P"], next(iter(after.values()))["content_hash"])
+
+
+def test_pipeline_rechunking_replaces_all_chunk_metadata(manager):
+    IngestionPipeline = pytest.importorskip("utils.ingestion_pipeline").IngestionPipeline
+    paper = {"base_id": "P", "metadata": METADATA, "fallback_text": PAPER}
+
+    IngestionPipeline(manager, collection_name=COLLECTION, chunk_size=200, chunk_overlap=0, chunking_strategy="sections", clean_text=False).run([paper])
+    assert all("section" in metadata for metadata in stored_chunks(manager).values())
+
+    summary = IngestionPipeline(manager, collection_name=COLLECTION, chunk_size=200, chunk_overlap=0, chunking_strategy="recursive", clean_text=False).run([paper])
+    after = stored_chunks(manager)
+
+    assert summary["upserted_papers"] == 1 and not summary["errors"]
+    assert not any("section" in metadata for metadata in after.values())
+    assert_consistent(after)
+
+
+def test_section_filters_agree_after_rechunking(manager):
+    ingest = dict(collection_name=COLLECTION, documents=[PAPER], metadatas=[METADATA], base_ids=["P"], chunk_size=200, chunk_overlap=0, mode="upsert")
+    collection = manager.get_collection(COLLECTION, create=True)
+
+    manager.add_chunked_documents(**ingest, chunking_strategy="sections")
+    index = manager.get_bm25_index(COLLECTION)
+    assert collection.get(where={"section": "method"})["ids"]
+    assert index.search("section label", section="method")
+
+    manager.add_chunked_documents(**ingest, chunking_strategy="recursive")
+    index = manager.get_bm25_index(COLLECTION)
+    assert collection.get(where={"section": "method"})["ids"] == []
+    assert index.search("section label", section="method") == []
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("crewai")
+from tools.RetrievalTool import RetrievalTool
+
+
+def add_shard(manager, topic, documents):
+    name = manager.create_shard("scientific_publications", topic)
+    ids = [f"{topic}_{i}" for i in range(len(documents))]
+    manager.add_documents(name, documents, [{"title": chunk_id, "base_id": chunk_id} for chunk_id in ids], ids)
+
+
+def test_sparse_search_merges_shards_by_rank(manager):
+    # "quantum" is rare in the physics shard and common in the computing shard, so its BM25 scores are far higher there
+    add_shard(manager, "physics", ["quantum field theory", "quantum gravity"] + [f"classical mechanics lecture {i}" for i in range(10)])
+    add_shard(manager, "computing", [f"quantum computing survey {i}" for i in range(3)])
+
+    tool = RetrievalTool(chroma_persist_directory=manager.persist_directory, shard_topics=["physics", "computing"])
+    tool._chroma_manager = manager
+    results = tool._sparse_retrieval("quantum", 2, None, None)
+
+    assert {chunk_id.split("_")[0] for chunk_id in results["ids"][0]} == {"physics", "computing"}
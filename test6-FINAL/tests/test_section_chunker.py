@@ -0,0 +1,94 @@
+import pytest
+
+from utils.section_chunker import detect_heading, split_sections
+
+PAPER = """Graph Networks for Retrieval
+Jane Doe, John Roe
+
+Abstract—We propose a retrieval model over citation graphs.
+
+1 Introduction
+Citation graphs carry signal that text models ignore.
+
+2. Related Work
+Prior work embeds papers independently.
+
+III. Proposed Method
+We run message passing over the citation graph.
+
+4.1 Experimental Setup
+We evaluate on three benchmarks.
+
+5 Conclusions and Future Work
+Graphs help retrieval.
+
+Acknowledgements
+Funded by a grant.
+
+References
+[1] A. Author. Some paper. 2020.
+"""
+
+
+@pytest.mark.parametrize("line, section", [
+    ("Abstract", "abstract"),
+    ("1 Introduction", "introduction"),
+    ("2.1. Related Work:", "related_work"),
+    ("IV. METHODOLOGY", "method"),
+    ("C) Results and Discussion", "results"),
+    ("  6 Conclusion  ", "conclusion"),
+    ("REFERENCES", "references"),
+    ("Acknowledgments", "acknowledgements"),
+    ("Appendix", "appendix"),
+])
+def test_numbered_and_styled_headings_are_detected(line, section):
+    assert detect_heading(line) == section
+
+
+@pytest.mark.parametrize("line", [
+    "",
+    "Our method outperforms the baseline.",
+    "The results in Table 2 show a clear gain",
+    "Introduction to graph theory and its applications in large scale retrieval systems",
+])
+def test_body_lines_are_not_headings(line):
+    assert detect_heading(line) is None
+
+
+def test_paper_is_split_in_document_order():
+    sections = split_sections(PAPER)
+
+    assert [section for section, _ in sections] == ["front_matter", "abstract", "introduction", "related_work", "method", "results", "conclusion", "acknowledgements", "references"]
+    parts = dict(sections)
+    assert parts["front_matter"].startswith("Graph Networks for Retrieval")
+    assert parts["abstract"].startswith("Abstract—We propose")
+    assert parts["method"] == "We run message passing over the citation graph."
+    assert parts["related_work"] == "Prior work embeds papers independently."
+
+
+def test_repeated_sections_are_merged():
+    sections = split_sections("Results\nFirst table.\nDiscussion\nSecond table.\nSummary\nDone.")
+
+    assert sections == [("results", "First table.\n\nSecond table."), ("conclusion", "Done.")]
+
+
+def test_text_without_headings_is_one_body_section():
+    text = "Just a paragraph of text.\nAnd another line."
+
+    assert split_sections(text) == [("body", text)]
+
+
+def test_chunks_carry_their_section_and_low_value_sections_are_skipped(manager):
+    chunks = manager.chunk_sections(PAPER, chunk_size=200, chunk_overlap=0)
+
+    sections = [section for section, _ in chunks]
+    assert "references" not in sections and "acknowledgements" not in sections
+    assert ("method", "We run message passing over the citation graph.") in chunks
+    assert all(len(chunk) <= 200 for _, chunk in chunks)
+
+
+def test_stored_chunks_keep_the_section_metadata(manager):
+    manager.add_chunked_documents("papers", [PAPER], [{"title": "Graph Networks"}], ["paper_1"], chunk_size=200, chunk_overlap=0, chunking_strategy="sections")
+
+    stored = manager.get_collection("papers").get(include=["metadatas"])
+    assert {metadata["section"] for metadata in stored["metadatas"]} == {"front_matter", "abstract", "introduction", "related_work", "method", "results", "conclusion"}
@@ -0,0 +1,12 @@
+def test_shard_pool_follows_max_workers(manager):
+    for topic in ("physics", "biology"):
+        name = manager.create_shard("scientific_publications", topic)
+        manager.add_documents(name, [f"{topic} paper"], [{"base_id": topic}], [f"{topic}_chunk_0"])
+
+    queries = [{"query": "physics paper", "n_results": 1}]
+    first = manager.query_shards("scientific_publications", queries, max_workers=1)
+    second = manager.query_shards("scientific_publications", queries, max_workers=3)
+
+    assert first == second
+    assert manager._get_shard_pool(1)._max_workers == 1
+    assert manager._get_shard_pool(3)._max_workers == 3
@@ -0,0 +1,34 @@
+from chroma_manager import ChromaManager
+
+COLLECTION = "publications"
+
+
+def second_manager(manager):
+    other = ChromaManager(persist_directory=manager.persist_directory, embedding_function=manager.embedding_function)
+    other.connect()
+    return other
+
+
+def add(manager, ids):
+    manager.add_documents(COLLECTION, [f"document about topic {chunk_id}" for chunk_id in ids], [{"base_id": chunk_id} for chunk_id in ids], ids)
+
+
+def test_bm25_index_sees_writes_of_other_managers(manager):
+    add(manager, ["a", "b"])
+    index = manager.get_bm25_index(COLLECTION)
+    assert len(index) == 2
+
+    add(second_manager(manager), ["c"])
+
+    assert manager.get_bm25_index(COLLECTION) is index
+    assert len(index) == 3
+    assert [chunk_id for chunk_id, _ in index.search("c")] == ["c"]
+
+
+def test_quantized_store_sees_writes_of_other_managers(manager):
+    add(manager, ["a", "b"])
+    assert len(manager.get_quantized_store(COLLECTION)) == 2
+
+    add(second_manager(manager), ["c"])
+
+    assert len(manager.get_quantized_store(COLLECTION)) == 3
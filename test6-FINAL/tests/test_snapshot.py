@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils.embedding_registry import EmbeddingMismatchError
+from utils.snapshot import MANIFEST_FILE, open_snapshot
+
+COLLECTION = "publications"
+
+
+def contents(collection):
+    stored = collection.get(include=["documents", "metadatas", "embeddings"])
+    order = np.argsort(stored["ids"])
+    return ([stored["ids"][i] for i in order], [stored["documents"][i] for i in order],
+            [stored["metadatas"][i] for i in order], np.asarray(stored["embeddings"])[order])
+
+
+@pytest.fixture
+def source(manager):
+    manager.create_publications_collection(COLLECTION, distance_metric="cosine", hnsw_m=24, construction_ef=150)
+    documents = ["Graph networks für Zitationen", "protein folding — a survey", "", "dense retrieval 検索"]
+    metadatas = [{"year": 2020 + i, "source": "arxiv", "title": f"Paper {i}"} for i in range(len(documents))]
+    manager.add_documents(COLLECTION, documents, metadatas, [f"doc_{i}" for i in range(len(documents))])
+    return manager.get_collection(COLLECTION)
+
+
+def test_round_trip_keeps_records_and_index_settings(manager, source, tmp_path):
+    summary = manager.export_snapshot(COLLECTION, str(tmp_path / "snapshot"))
+    assert summary["count"] == 4 and summary["dimension"] == 32
+
+    snapshot = open_snapshot(str(tmp_path / "snapshot"))
+    assert list(snapshot.ids) == source.get()["ids"]
+    assert snapshot.embedding_model == "test-hashing"
+
+    manager.import_snapshot(str(tmp_path / "snapshot"), collection_name="restored")
+
+    restored = manager.get_collection("restored")
+    original_contents, restored_contents = contents(source), contents(restored)
+    assert original_contents[:3] == restored_contents[:3]
+    assert np.array_equal(original_contents[3], restored_contents[3])
+    hnsw = restored.configuration["hnsw"]
+    assert hnsw["space"] == "cosine" and hnsw["max_neighbors"] == 24 and hnsw["ef_construction"] == 150
+
+
+def test_import_is_idempotent_and_replaces_with_drop(manager, source, tmp_path):
+    manager.export_snapshot(COLLECTION, str(tmp_path / "snapshot"))
+    manager.import_snapshot(str(tmp_path / "snapshot"), collection_name="restored")
+    manager.import_snapshot(str(tmp_path / "snapshot"), collection_name="restored")
+    assert manager.get_collection("restored").count() == 4
+
+    manager.add_documents("restored", ["extra record"], [{"year": 2030}], ["extra"])
+    manager.import_snapshot(str(tmp_path / "snapshot"), collection_name="restored", drop=True)
+    assert sorted(manager.get_collection("restored").get()["ids"]) == [f"doc_{i}" for i in range(4)]
+
+
+def test_export_replaces_an_existing_snapshot(manager, source, tmp_path):
+    manager.export_snapshot(COLLECTION, str(tmp_path / "snapshot"))
+    manager.delete_documents(COLLECTION, ["doc_0", "doc_1"])
+
+    manager.export_snapshot(COLLECTION, str(tmp_path / "snapshot"))
+
+    assert sorted(open_snapshot(str(tmp_path / "snapshot")).ids) == ["doc_2", "doc_3"]
+    assert not any(path.name.endswith(".tmp") for path in tmp_path.iterdir())
+
+
+def test_snapshot_of_another_model_is_refused(manager, source, tmp_path):
+    manager.export_snapshot(COLLECTION, str(tmp_path / "snapshot"))
+    manifest_path = tmp_path / "snapshot" / MANIFEST_FILE
+    manifest = json.loads(manifest_path.read_text())
+    manifest["embedding_model"] = "ollama:nomic-embed-text"
+    manifest_path.write_text(json.dumps(manifest))
+
+    with pytest.raises(EmbeddingMismatchError):
+        manager.import_snapshot(str(tmp_path / "snapshot"), collection_name="restored")
+
+
+def test_missing_snapshot(manager, tmp_path):
+    assert open_snapshot(str(tmp_path / "missing")) is None
+    with pytest.raises(FileNotFoundError):
+        manager.import_snapshot(str(tmp_path / "missing"))
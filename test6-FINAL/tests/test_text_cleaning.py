@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from utils.text_cleaning import MAX_SAMPLED_PAPERS, MAX_SAMPLES_PER_PAPER, PAGE_SEPARATOR, add_cleaning_report, clean_paper_text, new_cleaning_summary
+
+
+def page(number, body):
+    return "\n".join([
+        "Journal of Retrieval Research, Vol. 12",
+        *body,
+        f"{number}",
+    ])
+
+
+PAGES = [
+    "\n".join([
+        "arXiv:2401.01234v2 [cs.IR] 3 Jan 2024",
+        "Graph Networks for Retrieval",
+        "Abstract",
+        "We propose a retrieval model over citation graphs.",
+        "This work is licensed under a Creative Commons Attribution 4.0 License.",
+    ]),
+    page(2, ["1 Introduction", "Citation graphs carry signal that text models ignore."]),
+    page(3, ["2 Method", "We run message passing over the citation graph."]),
+    page(4, ["3 Results", "Recall improves on all benchmarks.", "References", "[1] A. Author. Some paper. 2020."]),
+    page(5, ["[2] B. Author. Another paper. 2021.", "[3] C. Author. A third paper. 2022."]),
+]
+
+
+def test_boilerplate_and_references_are_removed():
+    text = PAGE_SEPARATOR.join(PAGES)
+
+    cleaned, report = clean_paper_text(text)
+
+    for kept in ["Graph Networks for Retrieval", "We propose a retrieval model", "Citation graphs carry signal", "We run message passing", "Recall improves on all benchmarks."]:
+        assert kept in cleaned
+    for removed in ["Journal of Retrieval Research", "arXiv:2401.01234", "Creative Commons", "References", "[1] A. Author", "[3] C. Author"]:
+        assert removed not in cleaned
+    assert not any(line.strip().isdigit() for line in cleaned.splitlines())
+
+    # Digits are masked before counting, so the page numbers repeat like the running header
+    assert report["repeated_lines"] + report["page_numbers"] == 8
+    assert report["arxiv_stamps"] == 1
+    assert report["license_lines"] == 1
+    # The heading, three entries and the blank line between pages 4 and 5
+    assert report["reference_lines"] == 5
+    assert report["original_chars"] == len(text)
+    assert report["removed_chars"] == len(text) - len(cleaned)
+    assert any(sample.startswith("arxiv_stamps: arXiv:2401.01234v2") for sample in report["samples"])
+
+
+def test_body_lines_mentioning_a_license_or_number_are_kept():
+    text = "\n".join([
+        "Graph Networks for Retrieval",
+        "Jane Doe, John Roe",
+        "Introduction",
+        "We study retrieval over citation graphs.",
+        "The dataset is licensed under CC BY 4.0, which allows redistribution.",
+        "42",
+        "is the answer reported by the baseline.",
+        "Conclusion",
+        "Graphs help retrieval.",
+        "Future work extends this to other graphs.",
+        "We thank the reviewers.",
+    ])
+
+    cleaned, report = clean_paper_text(text)
+
+    assert "licensed under CC BY 4.0" in cleaned
+    assert "\n42\n" in cleaned
+    assert report["license_lines"] == 0 and report["page_numbers"] == 0
+
+
+def test_short_documents_have_no_repeated_lines():
+    # Fewer than MIN_REPEATED_PAGES pages, identical first lines are not treated as running headers
+    text = PAGE_SEPARATOR.join(["Shared title\nFirst page text.", "Shared title\nSecond page text."])
+
+    cleaned, report = clean_paper_text(text)
+
+    assert cleaned.count("Shared title") == 2
+    assert report["repeated_lines"] == 0
+
+
+def test_run_summary_keeps_counts_of_all_papers_and_few_samples():
+    text = PAGE_SEPARATOR.join(PAGES)
+    _, report = clean_paper_text(text)
+    summary = new_cleaning_summary()
+
+    for idx in range(MAX_SAMPLED_PAPERS * 5):
+        add_cleaning_report(summary, f"paper_{idx}", report)
+
+    assert summary["papers"] == MAX_SAMPLED_PAPERS * 5
+    assert summary["original_chars"] == len(text) * MAX_SAMPLED_PAPERS * 5
+    assert summary["reference_lines"] == report["reference_lines"] * MAX_SAMPLED_PAPERS * 5
+    assert list(summary["samples"]) == [f"paper_{idx}" for idx in range(MAX_SAMPLED_PAPERS)]
+    assert all(len(samples) <= MAX_SAMPLES_PER_PAPER for samples in summary["samples"].values())
+
+
+def test_pipeline_summary_aggregates_cleaning(manager, monkeypatch):
+    ingestion_pipeline = pytest.importorskip("utils.ingestion_pipeline")
+    text = PAGE_SEPARATOR.join(PAGES)
+    _, report = clean_paper_text(text)
+
+    def fake_iter_pdf_texts(pdf_paths, **kwargs):
+        for idx, _ in enumerate(pdf_paths):
+            yield idx, text, None
+
+    monkeypatch.setattr(ingestion_pipeline, "iter_pdf_texts", fake_iter_pdf_texts)
+    papers = [{"base_id": f"P{idx}", "metadata": {"year": 2024}, "pdf_path": f"P{idx}.pdf", "fallback_text": "abstract"} for idx in range(3)]
+
+    summary = ingestion_pipeline.IngestionPipeline(manager, collection_name="publications", chunk_size=2000, chunk_overlap=0).run(papers)
+
+    cleaning = summary["cleaning"]
+    assert cleaning["papers"] == 3 and cleaning["removed_chars"] == 3 * report["removed_chars"]
+    assert sorted(cleaning["samples"]) == ["P0", "P1", "P2"]
+    json.dumps(summary)
@@ -0,0 +1,67 @@
+import pytest
+
+from utils.write_buffer import WriteBehindError
+
+COLLECTION = "publications"
+
+
+def count_writes(manager, monkeypatch):
+    calls = []
+    upsert_documents = manager.upsert_documents
+
+    def counting_upsert(*args, **kwargs):
+        calls.append(len(kwargs["ids"]))
+        return upsert_documents(*args, **kwargs)
+
+    monkeypatch.setattr(manager, "upsert_documents", counting_upsert)
+    return calls
+
+
+def records(count):
+    ids = [f"doc_{i}" for i in range(count)]
+    return [f"document number {i}" for i in range(count)], [{"year": 2024} for _ in ids], ids
+
+
+def test_bad_record_is_isolated(manager):
+    documents, metadatas, ids = records(8)
+    metadatas[5] = {"year": {"nested": 2024}}
+
+    with manager.write_buffer(COLLECTION, batch_size=8, max_delay=60) as buffer:
+        buffer.add(documents, metadatas, ids)
+        with pytest.raises(WriteBehindError) as error:
+            buffer.flush()
+
+    assert error.value.failed_ids == ["doc_5"]
+    assert sorted(manager.get_collection(COLLECTION).get()["ids"]) == sorted(set(ids) - {"doc_5"})
+
+
+def test_collection_error_fails_batch_once(manager, monkeypatch):
+    calls = count_writes(manager, monkeypatch)
+    documents, metadatas, ids = records(8)
+
+    buffer = manager.write_buffer("x", batch_size=8, max_delay=60)
+    buffer.add(documents, metadatas, ids)
+    with pytest.raises(WriteBehindError) as error:
+        buffer.flush()
+    buffer.close()
+
+    assert calls == [8]
+    assert error.value.failed_ids == ids
+    assert buffer.stats()["failed"] == 8
+
+
+def test_leftover_records_keep_their_age(manager):
+    documents, metadatas, ids = records(6)
+
+    with manager.write_buffer(COLLECTION, batch_size=4, max_delay=60) as buffer:
+        # Holding the lock keeps the background thread from taking the batch itself
+        with buffer._condition:
+            buffer.add(documents, metadatas, ids)
+            leftover_queued_at = buffer._pending[4]["queued_at"]
+            batch = buffer._take_batch()
+            assert buffer._oldest == leftover_queued_at
+            buffer._pending[:0] = batch
+            buffer._in_flight -= len(batch)
+            buffer._oldest = batch[0]["queued_at"]
+
+    assert len(manager.get_collection(COLLECTION).get()["ids"]) == 6
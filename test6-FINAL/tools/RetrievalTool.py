@@ -1,13 +1,20 @@
 from crewai.tools import BaseTool
-from typing import Type, Optional, Literal
+from typing import Type, Optional, Literal, List
 from pydantic import BaseModel, Field
+import os
 import sys
+import threading
 from pathlib import Path
 from chroma_manager import ChromaManager
-from rank_bm25 import BM25Okapi
+from utils.embedding_cache import EmbeddingCache
+from utils.quantized_store import REDUCED_DTYPE
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Every agent gets its own RetrievalTool, they share one ChromaManager (and embedding cache) per database
+_shared_managers = {}
+_shared_managers_lock = threading.Lock()
+
 class RetrievalTool(BaseModel):
     """Input schema for RetrievalTool"""
     query: str = Field(..., description="Search query to find relevant publications")
@@ -18,7 +25,9 @@ class RetrievalTool(BaseModel):
     )
     year_from: Optional[int] = Field(default=None, description="Optional: Filter by minimum year (e.g., 2020)")
     source: Optional[str] = Field(default=None, description="Optional: Filter by source ('arxiv' or 'openalex')")
+    section: Optional[str] = Field(default=None, description="Optional: Filter by paper section ('abstract', 'introduction', 'related_work', 'method', 'results', 'conclusion')")
     hybrid_weight: float = Field(default=0.5, description="Weight for dense vs sparse in hybrid (0.0=sparse only, 1.0=dense only)")
+    additional_queries: Optional[List[str]] = Field(default=None, description="Optional: further queries answered in the same call, results are listed per query")
 
 
 class RetrievalTool(BaseTool):
@@ -36,117 +45,143 @@ class RetrievalTool(BaseTool):
     - Sparse: Exact terms/acronyms
     - Hybrid: Best overall results (recommended)
     
+    Results can be restricted to a paper section, e.g. section="method" or section="results".
+    Several lookups can be batched into one call with additional_queries=["...", "..."].
+    
     Example: query="machine learning", n_results=5, strategy="hybrid", hybrid_weight=0.7"""
     
     args_schema: Type[BaseModel] = RetrievalTool
     
     chroma_persist_directory: str = "./chroma_db"
-    _bm25_index: Optional[BM25Okapi] = None
-    _bm25_documents: list = []
-    _bm25_metadatas: list = []
+    embedding_cache_path: Optional[str] = None
+    # "quantized" searches an int8/float16 copy of the embeddings and re-scores the top candidates, see utils.quantized_store
+    # "reduced" does the first pass on reduced_projection (e.g. "pca64" or "prefix128") projections instead
+    dense_backend: Literal["chroma", "quantized", "reduced"] = "chroma"
+    quantized_dtype: Literal["int8", "float16"] = "int8"
+    reduced_projection: str = "pca64"
+    rescore_factor: int = 4
+    # Snapshot written by `chroma_manager.py snapshot-export`, read instead of the collection when the BM25 index is (re)built
+    snapshot_path: Optional[str] = None
+    # Search only these topic shards (see ChromaManager.create_shard) instead of the whole collection
+    shard_topics: Optional[List[str]] = None
     _chroma_manager: Optional[ChromaManager] = None
     
     def _get_chroma_manager(self):
-        """Get or create ChromaManager instance (singleton pattern)"""
+        """Get or create the ChromaManager shared by all tools on the same database"""
         if self._chroma_manager is None:
-            self._chroma_manager = ChromaManager(persist_directory=self.chroma_persist_directory)
-            self._chroma_manager.connect()
+            key = (os.path.realpath(self.chroma_persist_directory), self.embedding_cache_path)
+            with _shared_managers_lock:
+                manager = _shared_managers.get(key)
+                if manager is None:
+                    embedding_cache = EmbeddingCache(self.embedding_cache_path) if self.embedding_cache_path else None
+                    manager = ChromaManager(persist_directory=self.chroma_persist_directory, embedding_cache=embedding_cache)
+                    manager.connect()
+                    _shared_managers[key] = manager
+            self._chroma_manager = manager
         return self._chroma_manager
     
-    def _initialize_bm25_retriever(self):
-        """Initialize BM25 index with documents from ChromaDB"""
-        if self._bm25_index is not None:
-            return
+    def _get_bm25_indexes(self):
+        """(collection name, BM25Index) pairs to search, the indexes persist next to the Chroma data"""
+        manager = self._get_chroma_manager()
         
         try:
-            manager = self._get_chroma_manager()
-            
-            collection = manager.client.get_collection(name="scientific_publications")
-            
-            all_data = collection.get(include=["documents", "metadatas"])
-            
-            if not all_data['documents']:
-                return
-  
-            self._bm25_documents = all_data['documents']
-            self._bm25_metadatas = all_data['metadatas']
-            
-            tokenized_corpus = [doc.lower().split() for doc in self._bm25_documents]
-
-            self._bm25_index = BM25Okapi(tokenized_corpus)
+            if self.shard_topics is not None:
+                shards = manager.list_shards("scientific_publications")
+                names = [shards[topic.strip()] for topic in self.shard_topics if topic.strip() in shards]
+            else:
+                names = ["scientific_publications"]
+            return [(name, manager.get_bm25_index(name, snapshot_path=self.snapshot_path)) for name in names]
             
         except Exception as e:
             raise Exception(f"Failed to initialize BM25 index: {e}")
     
-    def _dense_retrieval(self, query: str, n_results: int, year_from: Optional[int], source: Optional[str]):
-        """Dense vector search using embeddings"""
-        manager = self._get_chroma_manager()
-
-        where_filter = {}
+    @staticmethod
+    def _build_where_filter(year_from: Optional[int], source: Optional[str], section: Optional[str]):
+        """Build a Chroma where filter, several conditions have to be combined with $and"""
+        conditions = []
         if year_from:
-            where_filter['year'] = {'$gte': year_from}
+            conditions.append({'year': {'$gte': year_from}})
         if source:
-            where_filter['source'] = source
-        
-        results = manager.query_collection(
-            collection_name="scientific_publications",
-            query_texts=[query],
-            n_results=min(n_results, 20),
-            where=where_filter if where_filter else None
-        )
+            conditions.append({'source': source})
+        if section:
+            conditions.append({'section': section})
         
-        return results
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {'$and': conditions}
     
-    def _sparse_retrieval(self, query: str, n_results: int, year_from: Optional[int], source: Optional[str]):
-        """Sparse BM25 keyword search"""
-        self._initialize_bm25_retriever()
-        
-        if not self._bm25_index:
-            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
-
-        tokenized_query = query.lower().split()
+    def _dense_retrieval(self, query: str, n_results: int, year_from: Optional[int], source: Optional[str], section: Optional[str] = None):
+        """Dense vector search using embeddings"""
+        return self._dense_retrieval_batch([query], n_results, year_from, source, section)[0]
+    
+    def _dense_retrieval_batch(self, queries: List[str], n_results: int, year_from: Optional[int], source: Optional[str], section: Optional[str] = None):
+        """Dense vector search for several queries with one embedding batch and one search call"""
+        manager = self._get_chroma_manager()
+        where = self._build_where_filter(year_from, source, section)
         
-        bm25_scores = self._bm25_index.get_scores(tokenized_query)
-
-        top_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)
+        batch = [{'query': query, 'n_results': min(n_results, 20), 'where': where} for query in queries]
         
-        filtered_results = []
-        for idx in top_indices:
-            doc = self._bm25_documents[idx]
-            metadata = self._bm25_metadatas[idx]
-            score = bm25_scores[idx]
-            
-            if year_from and metadata.get('year', 0) < year_from:
-                continue
-
-            if source and metadata.get('source', '') != source:
-                continue
-            
-            filtered_results.append((idx, doc, metadata, score))
-            
-            if len(filtered_results) >= n_results:
-                break
+        if self.shard_topics is not None:
+            return manager.query_shards(collection_name="scientific_publications", queries=batch, topics=self.shard_topics)
+        if self.dense_backend == "quantized":
+            return manager.query_quantized_batch(collection_name="scientific_publications", queries=batch, dtype=self.quantized_dtype, rescore_factor=self.rescore_factor)
+        if self.dense_backend == "reduced":
+            return manager.query_quantized_batch(collection_name="scientific_publications", queries=batch, dtype=REDUCED_DTYPE,
+                                                 rescore_factor=self.rescore_factor, projection=self.reduced_projection)
+        return manager.query_collection_batch(collection_name="scientific_publications", queries=batch)
+    
+    def _sparse_retrieval(self, query: str, n_results: int, year_from: Optional[int], source: Optional[str], section: Optional[str] = None):
+        """Sparse BM25 keyword search"""
+        return self._sparse_retrieval_batch([query], n_results, year_from, source, section)[0]
+    
+    def _sparse_retrieval_batch(self, queries: List[str], n_results: int, year_from: Optional[int], source: Optional[str], section: Optional[str] = None):
+        """Sparse BM25 keyword search for several queries, scored as one sparse matrix product per index"""
+        hits_per_query = [[] for _ in queries]
+        for collection_name, index in self._get_bm25_indexes():
+            for hits, index_hits in zip(hits_per_query, index.search_batch(queries, n_results, year_from, source, section)):
+                # BM25 scores of different shards are on different scales, hits are merged by their rank within the shard like in hybrid search
+                hits.extend((1.0 / (rank + 1), score, chunk_id, collection_name) for rank, (chunk_id, score) in enumerate(index_hits))
+        hits_per_query = [sorted(hits, key=lambda hit: (hit[0], hit[1]), reverse=True)[:n_results] for hits in hits_per_query]
         
-        results = {
-            'ids': [[]],
-            'documents': [[]],
-            'metadatas': [[]],
-            'distances': [[]]
-        }
+        # The index only keeps ids and filter fields, text and metadata come from Chroma
+        manager = self._get_chroma_manager()
+        stored = {}
+        for collection_name in {hit[3] for hits in hits_per_query for hit in hits}:
+            ids = list(dict.fromkeys(chunk_id for hits in hits_per_query for _, _, chunk_id, name in hits if name == collection_name))
+            batch = manager.get_collection(collection_name).get(ids=ids, include=["documents", "metadatas"])
+            stored.update((chunk_id, (doc, metadata)) for chunk_id, doc, metadata in zip(batch['ids'], batch['documents'], batch['metadatas']))
         
-        for idx, doc, metadata, score in filtered_results:
-            results['ids'][0].append(f"bm25_{idx}")
-            results['documents'][0].append(doc)
-            results['metadatas'][0].append(metadata)
-            results['distances'][0].append(1.0 / (1.0 + score) if score > 0 else 1.0)
+        results_per_query = []
+        for hits in hits_per_query:
+            results = {
+                'ids': [[]],
+                'documents': [[]],
+                'metadatas': [[]],
+                'distances': [[]]
+            }
+            for _, score, chunk_id, _ in hits:
+                if chunk_id not in stored:
+                    continue
+                doc, metadata = stored[chunk_id]
+                results['ids'][0].append(chunk_id)
+                results['documents'][0].append(doc)
+                results['metadatas'][0].append(metadata)
+                results['distances'][0].append(1.0 / (1.0 + score) if score > 0 else 1.0)
+            results_per_query.append(results)
         
-        return results
+        return results_per_query
     
-    def _hybrid_retrieval(self, query: str, n_results: int, year_from: Optional[int], source: Optional[str], hybrid_weight: float):
-        """Hybrid search combining dense and sparse"""
-        dense_results = self._dense_retrieval(query, 20, year_from, source)
+    def _hybrid_retrieval(self, query: str, n_results: int, year_from: Optional[int], source: Optional[str], hybrid_weight: float, section: Optional[str] = None, dense_results=None, sparse_results=None):
+        """Hybrid search combining dense and sparse, dense_results and sparse_results may be passed in when they were fetched in a batch"""
+        if dense_results is None:
+            dense_results = self._dense_retrieval(query, 20, year_from, source, section)
+        if not dense_results:
+            dense_results = {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
         
-        sparse_results = self._sparse_retrieval(query, 20, year_from, source)
+        if sparse_results is None:
+            sparse_results = self._sparse_retrieval(query, 20, year_from, source, section)
 
         combined_results = {}
         
@@ -215,6 +250,75 @@ class RetrievalTool(BaseTool):
         
         return results
     
+    def _format_results(self, query: str, strategy: str, strategy_name: str, results) -> str:
+        """Render the results of one query for the agent"""
+        if not results or not results.get('ids') or len(results['ids'][0]) == 0:
+            return f"No publications found for '{query}' using {strategy_name} strategy.\nTry: broader query, different strategy, or remove filters."
+
+        formatted_results = []
+        formatted_results.append(f"strategy: {strategy_name}")
+        formatted_results.append(f"query: '{query}'")
+        formatted_results.append(f"found {len(results['ids'][0])} publications\n")
+        formatted_results.append("\n")
+
+        for idx, (doc_id, document, metadata) in enumerate(zip(
+            results['ids'][0],
+            results['documents'][0],
+            results['metadatas'][0]
+        )):
+            formatted_results.append(f"\n{idx + 1}. {metadata.get('title', 'Untitled')}\n")
+            formatted_results.append(f"Authors: {metadata.get('authors', 'Unknown')}\n")
+            formatted_results.append(f"Year: {metadata.get('year', 'N/A')}\n")
+            formatted_results.append(f"Journal: {metadata.get('journal', 'N/A')}\n")
+
+            doi = metadata.get('doi', '')
+            arxiv_id = metadata.get('arxiv_id', '')
+            if doi:
+                formatted_results.append(f"DOI: {doi}\n")
+            if arxiv_id:
+                formatted_results.append(f"arXiv: {arxiv_id}\n")
+
+            formatted_results.append(f"Source: {metadata.get('source', 'Unknown')}\n")
+
+            quality = metadata.get('quality_rating', '')
+            if quality:
+                formatted_results.append(f"Quality: {quality}\n")
+
+            chunk_idx = metadata.get('chunk_index', 0)
+            total_chunks = metadata.get('total_chunks', 1)
+            formatted_results.append(f"Chunk: {chunk_idx + 1} of {total_chunks}\n")
+
+            chunk_section = metadata.get('section', '')
+            if chunk_section:
+                formatted_results.append(f"Section: {chunk_section}\n")
+
+            duplicate_sources = metadata.get('duplicate_sources', '')
+            if duplicate_sources:
+                formatted_results.append(f"Also found in: {duplicate_sources}\n")
+
+            if strategy == "hybrid" and 'ranks' in results:
+                ranks = results['ranks'][0][idx]
+                rank_info = []
+                if ranks.get('dense'):
+                    rank_info.append(f"Dense: #{ranks['dense']}")
+                if ranks.get('sparse'):
+                    rank_info.append(f"Sparse: #{ranks['sparse']}")
+                if rank_info:
+                    formatted_results.append(f"Ranking: {', '.join(rank_info)}\n")
+
+                if 'scores' in results:
+                    formatted_results.append(f"Combined Score: {results['scores'][0][idx]:.3f}\n")
+
+            if idx < len(results['distances'][0]):
+                distance = results['distances'][0][idx]
+                relevance = 1 - distance if distance <= 1 else 0
+                formatted_results.append(f"Relevance: {relevance:.3f}\n")
+
+            formatted_results.append(f"\nFull Chunk:\n{document}\n")
+            formatted_results.append("\n")
+
+        return "".join(formatted_results)
+
     def _run(
         self, 
         query: str, 
@@ -222,81 +326,36 @@ class RetrievalTool(BaseTool):
         strategy: str = "hybrid",
         year_from: Optional[int] = None, 
         source: Optional[str] = None,
-        hybrid_weight: float = 0.5
+        hybrid_weight: float = 0.5,
+        section: Optional[str] = None,
+        additional_queries: Optional[List[str]] = None
     ) -> str:
         """Execute search with specified strategy"""
         
         try:
+            queries = [query] + [extra for extra in (additional_queries or []) if extra and extra != query]
+            
             if strategy == "dense":
-                results = self._dense_retrieval(query, n_results, year_from, source)
+                results_per_query = self._dense_retrieval_batch(queries, n_results, year_from, source, section)
                 strategy_name = "DENSE (Semantic Embeddings)"
             elif strategy == "sparse":
-                results = self._sparse_retrieval(query, n_results, year_from, source)
+                results_per_query = self._sparse_retrieval_batch(queries, n_results, year_from, source, section)
                 strategy_name = "SPARSE (BM25 Keyword)"
             elif strategy == "hybrid":
-                results = self._hybrid_retrieval(query, n_results, year_from, source, hybrid_weight)
+                dense_per_query = self._dense_retrieval_batch(queries, 20, year_from, source, section)
+                sparse_per_query = self._sparse_retrieval_batch(queries, 20, year_from, source, section)
+                results_per_query = [
+                    self._hybrid_retrieval(q, n_results, year_from, source, hybrid_weight, section, dense_results=dense, sparse_results=sparse)
+                    for q, dense, sparse in zip(queries, dense_per_query, sparse_per_query)
+                ]
                 strategy_name = f"HYBRID (Dense={hybrid_weight:.0%}, Sparse={1-hybrid_weight:.0%})"
             else:
                 return f"Invalid strategy: {strategy}. Use 'dense', 'sparse', or 'hybrid'."
             
-            if not results or not results.get('ids') or len(results['ids'][0]) == 0:
+            if len(queries) == 1 and (not results_per_query[0] or not results_per_query[0].get('ids') or len(results_per_query[0]['ids'][0]) == 0):
                 return f"No publications found using {strategy_name} strategy.\nTry: broader query, different strategy, or remove filters."
-
-            formatted_results = []
-            formatted_results.append(f"strategy: {strategy_name}")
-            formatted_results.append(f"query: '{query}'")
-            formatted_results.append(f"found {len(results['ids'][0])} publications\n")
-            formatted_results.append("\n")
-            
-            for idx, (doc_id, document, metadata) in enumerate(zip(
-                results['ids'][0],
-                results['documents'][0],
-                results['metadatas'][0]
-            )):
-                formatted_results.append(f"\n{idx + 1}. {metadata.get('title', 'Untitled')}\n")
-                formatted_results.append(f"Authors: {metadata.get('authors', 'Unknown')}\n")
-                formatted_results.append(f"Year: {metadata.get('year', 'N/A')}\n")
-                formatted_results.append(f"Journal: {metadata.get('journal', 'N/A')}\n")
-                
-                doi = metadata.get('doi', '')
-                arxiv_id = metadata.get('arxiv_id', '')
-                if doi:
-                    formatted_results.append(f"DOI: {doi}\n")
-                if arxiv_id:
-                    formatted_results.append(f"arXiv: {arxiv_id}\n")
-                
-                formatted_results.append(f"Source: {metadata.get('source', 'Unknown')}\n")
-                
-                quality = metadata.get('quality_rating', '')
-                if quality:
-                    formatted_results.append(f"Quality: {quality}\n")
-                
-                chunk_idx = metadata.get('chunk_index', 0)
-                total_chunks = metadata.get('total_chunks', 1)
-                formatted_results.append(f"Chunk: {chunk_idx + 1} of {total_chunks}\n")
-                
-                if strategy == "hybrid" and 'ranks' in results:
-                    ranks = results['ranks'][0][idx]
-                    rank_info = []
-                    if ranks.get('dense'):
-                        rank_info.append(f"Dense: #{ranks['dense']}")
-                    if ranks.get('sparse'):
-                        rank_info.append(f"Sparse: #{ranks['sparse']}")
-                    if rank_info:
-                        formatted_results.append(f"Ranking: {', '.join(rank_info)}\n")
-                    
-                    if 'scores' in results:
-                        formatted_results.append(f"Combined Score: {results['scores'][0][idx]:.3f}\n")
-  
-                if idx < len(results['distances'][0]):
-                    distance = results['distances'][0][idx]
-                    relevance = 1 - distance if distance <= 1 else 0
-                    formatted_results.append(f"Relevance: {relevance:.3f}\n")
-                
-                formatted_results.append(f"\nFull Chunk:\n{document}\n")
-                formatted_results.append("\n")
             
-            return "".join(formatted_results)
+            return "\n".join(self._format_results(q, strategy, strategy_name, results) for q, results in zip(queries, results_per_query))
             
         except Exception as e:
             return f"Error during {strategy} retrieval: {str(e)}\nPlease check if vector store is initialized."
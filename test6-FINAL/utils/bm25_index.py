@@ -0,0 +1,604 @@
+import os
+import copy
+import json
+import math
+import shutil
+import logging
+import weakref
+import itertools
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from utils.snapshot import TextColumn, TextColumnWriter
+from utils.quantized_store import FILTER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 2
+MANIFEST_FILE = "manifest.json"
+# One file per open index holding the generation it reads, see BM25Index._collect_garbage
+PINS_DIRECTORY = "pins"
+COLUMNS_FILE = "columns.json"
+# Filter fields compared as numbers, the others are stored as codes into a per-segment vocabulary
+NUMERIC_FIELDS = ("year",)
+# Defaults of rank_bm25's BM25Okapi, which the index replaces
+K1 = 1.5
+B = 0.75
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return (text or "").lower().split()
+
+
+def _number(value) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def filter_columns(metadatas: Sequence[Optional[Dict]]) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+    """Filter fields of chunks as arrays: numbers as float32 (NaN if missing), text as int32 codes (-1 if missing)"""
+    columns, vocabularies = {}, {}
+    for field in FILTER_FIELDS:
+        values = [(metadata or {}).get(field) for metadata in metadatas]
+        if field in NUMERIC_FIELDS:
+            columns[field] = np.asarray([_number(value) for value in values], dtype=np.float32)
+            continue
+        vocabulary = sorted({str(value) for value in values if value is not None})
+        lookup = {value: code for code, value in enumerate(vocabulary)}
+        columns[field] = np.asarray([-1 if value is None else lookup[str(value)] for value in values], dtype=np.int32)
+        vocabularies[field] = vocabulary
+    return columns, vocabularies
+
+
+_pin_counter = itertools.count()
+
+
+def _remove_pin(path: Path):
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _process_alive(pid: int) -> bool:
+    # os.kill would terminate the process on Windows, pins are only expired on POSIX
+    if pid == os.getpid() or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+class Segment:
+    """Immutable, memory-mapped part of a BM25Index.
+
+    The postings form a term-major CSR matrix: the rows (chunk positions within
+    the segment) and frequencies of terms[i] are rows[offsets[i]:offsets[i + 1]].
+    Terms are sorted, a lookup is a binary search over the mapped strings. Rows
+    of deleted or replaced chunks are masked by deleted, the tombstones. The
+    filter fields are kept as one array per field, see filter_columns.
+    """
+
+    def __init__(self, directory: Path, deleted_file: Optional[str] = None):
+        self.directory = Path(directory)
+        self.name = self.directory.name
+        self.ids = TextColumn(self.directory, "ids")
+        self.columns = {field: np.load(self.directory / f"column_{field}.npy", mmap_mode="r") for field in FILTER_FIELDS}
+        with open(self.directory / COLUMNS_FILE, "r", encoding="utf-8") as f:
+            self.vocabularies = json.load(f)
+        self.terms = TextColumn(self.directory, "terms")
+        self.lengths = np.load(self.directory / "lengths.npy", mmap_mode="r")
+        self.offsets = np.load(self.directory / "offsets.npy", mmap_mode="r")
+        self.rows = np.load(self.directory / "rows.npy", mmap_mode="r")
+        self.frequencies = np.load(self.directory / "frequencies.npy", mmap_mode="r")
+        self.deleted_file = deleted_file
+        self.deleted = np.load(self.directory / deleted_file) if deleted_file else np.zeros(len(self.ids), dtype=bool)
+        self._count_live()
+
+    def _count_live(self):
+        live = ~self.deleted
+        self.live_count = int(live.sum())
+        self.live_length = int(np.asarray(self.lengths)[live].sum())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def with_deleted(self, rows: Sequence[int], deleted_file: str) -> "Segment":
+        """Copy of the segment with rows tombstoned, the mask is written to deleted_file"""
+        segment = copy.copy(self)
+        segment.deleted = self.deleted.copy()
+        segment.deleted[list(rows)] = True
+        segment.deleted_file = deleted_file
+        np.save(self.directory / deleted_file, segment.deleted)
+        segment._count_live()
+        return segment
+
+    def find_term(self, term: str) -> int:
+        low, high = 0, len(self.terms)
+        while low < high:
+            middle = (low + high) // 2
+            if self.terms[middle] < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self.terms) and self.terms[low] == term else -1
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Live rows containing term and the term's frequency in them"""
+        position = self.find_term(term)
+        if position < 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        rows = np.asarray(self.rows[start:end], dtype=np.int64)
+        live = ~self.deleted[rows]
+        return rows[live], np.asarray(self.frequencies[start:end], dtype=np.float32)[live]
+
+    def filter_mask(self, year_from: Optional[int] = None, source: Optional[str] = None, section: Optional[str] = None, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Which live rows pass the filters, over all rows or only the given ones. Chunks without the filtered field never pass."""
+        selected = slice(None) if rows is None else rows
+        mask = ~self.deleted[selected]
+        if year_from:
+            with np.errstate(invalid="ignore"):
+                mask &= np.asarray(self.columns['year'][selected]) >= year_from
+        for field, value in (('source', source), ('section', section)):
+            if value:
+                vocabulary = self.vocabularies[field]
+                code = vocabulary.index(value) if value in vocabulary else -2
+                mask &= np.asarray(self.columns[field][selected]) == code
+        return mask
+
+    @staticmethod
+    def write(directory: Path, ids: Sequence[str], columns: Dict[str, np.ndarray], vocabularies: Dict[str, List[str]], lengths: np.ndarray,
+              terms: Sequence[str], term_ids: np.ndarray, rows: np.ndarray, frequencies: np.ndarray) -> "Segment":
+        """Write postings given as parallel (term id, row, frequency) arrays, terms must be sorted"""
+        directory.mkdir(parents=True)
+        order = np.lexsort((rows, term_ids))
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(terms)))])
+        np.save(directory / "offsets.npy", offsets.astype(np.int64))
+        np.save(directory / "rows.npy", rows[order].astype(np.int32))
+        np.save(directory / "frequencies.npy", frequencies[order].astype(np.int32))
+        np.save(directory / "lengths.npy", np.asarray(lengths, dtype=np.int32))
+        for field, column in columns.items():
+            np.save(directory / f"column_{field}.npy", column)
+        with open(directory / COLUMNS_FILE, "w", encoding="utf-8") as f:
+            json.dump(vocabularies, f, ensure_ascii=False)
+        for name, values in (("ids", ids), ("terms", terms)):
+            writer = TextColumnWriter(directory, name)
+            for value in values:
+                writer.append(value)
+            writer.close()
+        return Segment(directory)
+
+
+class BM25Index:
+    """Persistent BM25 index of one collection, kept next to the Chroma data.
+
+    The index is a list of immutable segments. add() tokenizes only the new
+    chunks and writes them as a new segment, an id that is already indexed is
+    tombstoned in its old segment. delete() only writes tombstones. Once there
+    are more than max_segments segments the merge_factor smallest ones are
+    merged, which rewrites their postings without tokenizing again and drops
+    tombstoned rows. Every change ends with an atomic replace of the manifest.
+
+    Replaced segments and tombstone files are not deleted right away, other
+    indexes in this or another process may still read them. Every open index
+    pins the generation it reads, and a commit only deletes files that no pinned
+    generation references any more. close() releases the pin, so does garbage
+    collection of the index or the end of its process.
+
+    Scores are BM25Okapi's with the idf log(1 + (N - df + 0.5) / (df + 0.5)),
+    which stays positive for frequent terms without rank_bm25's correction by
+    the average idf of the whole vocabulary.
+    """
+
+    def __init__(self, directory: str, manifest: Dict, segments: List[Segment], max_segments: int = 8, merge_factor: int = 4):
+        self.directory = Path(directory)
+        self.generation = manifest["generation"]
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self._next_segment = manifest["next_segment"]
+        self._garbage = list(manifest.get("garbage", []))
+        self._segments = tuple(segments)
+        # id -> (segment name, row) of the live chunks, only built once the index is written to
+        self._locations = None
+        self._lock = threading.RLock()
+        self._pin_path = self.directory / PINS_DIRECTORY / f"{os.getpid()}_{next(_pin_counter)}"
+        self._write_pin()
+        self._unpin = weakref.finalize(self, _remove_pin, self._pin_path)
+
+    @classmethod
+    def create(cls, directory: str, **kwargs) -> "BM25Index":
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        index = cls(directory, {"generation": 0, "next_segment": 0}, [], **kwargs)
+        index._commit([], [])
+        return index
+
+    @classmethod
+    def open(cls, directory: str, **kwargs) -> Optional["BM25Index"]:
+        """Open an index, None if directory holds none or it cannot be read"""
+        directory = Path(directory)
+        try:
+            with open(directory / MANIFEST_FILE, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != INDEX_FORMAT:
+                raise ValueError(f"unsupported format {manifest.get('format')}")
+            segments = [Segment(directory / entry["name"], entry.get("deleted")) for entry in manifest["segments"]]
+            return cls(directory, manifest, segments, **kwargs)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not open BM25 index {directory}: {e}")
+            return None
+
+    @classmethod
+    def build(cls, directory: str, batches: Iterable[Tuple[List[str], List[str], List[Optional[Dict]]]], **kwargs) -> "BM25Index":
+        """Index (ids, documents, metadatas) batches into a fresh index that replaces the one at directory.
+
+        The new segment is built aside and moved into a readable index at directory
+        with one commit, its old segments are left to the garbage collection.
+        """
+        directory = Path(directory)
+        tmp_directory = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        if tmp_directory.exists():
+            shutil.rmtree(tmp_directory)
+        built = cls.create(tmp_directory, **kwargs)
+        for ids, documents, metadatas in batches:
+            built.add(ids, documents, metadatas, replace=False)
+        built.compact()
+        built.close()
+        logger.info(f"Built BM25 index {directory} over {len(built)} chunks")
+
+        current = cls.open(directory, **kwargs)
+        if current is None:
+            if directory.exists():
+                shutil.rmtree(directory)
+            shutil.rmtree(tmp_directory / PINS_DIRECTORY, ignore_errors=True)
+            os.replace(tmp_directory, directory)
+            return cls.open(directory, **kwargs)
+
+        with current._lock:
+            current._refresh()
+            segments = []
+            for segment in built.segments:
+                target = current._new_segment_directory()
+                os.replace(segment.directory, target)
+                segments.append(Segment(target, segment.deleted_file))
+            obsolete = [segment.directory for segment in current.segments]
+            current._locations = None
+            current._commit(segments, obsolete)
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        return current
+
+    def close(self):
+        """Release the pin on the generation this index reads"""
+        self._unpin()
+
+    def _write_pin(self):
+        self._pin_path.parent.mkdir(exist_ok=True)
+        tmp_path = self._pin_path.with_suffix(".tmp")
+        tmp_path.write_text(str(self.generation), encoding="utf-8")
+        os.replace(tmp_path, self._pin_path)
+
+    def _oldest_pinned_generation(self) -> int:
+        """Oldest generation an open index still reads, pins of exited processes are removed"""
+        oldest = self.generation
+        for path in (self.directory / PINS_DIRECTORY).glob("*_*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                if not _process_alive(int(path.name.split("_")[0])):
+                    path.unlink(missing_ok=True)
+                    continue
+                oldest = min(oldest, int(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return oldest
+
+    def _refresh(self):
+        """Reload segments another index committed since this one read the manifest"""
+        try:
+            with open(self.directory / MANIFEST_FILE, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("generation") == self.generation:
+            return
+        self._segments = tuple(Segment(self.directory / entry["name"], entry.get("deleted")) for entry in manifest["segments"])
+        self.generation = manifest["generation"]
+        self._next_segment = max(self._next_segment, manifest["next_segment"])
+        self._garbage = list(manifest.get("garbage", []))
+        self._locations = None
+        self._write_pin()
+
+    def __len__(self):
+        return sum(segment.live_count for segment in self._segments)
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self._segments
+
+    @property
+    def nbytes(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.rglob("*") if path.is_file())
+
+    def changed_on_disk(self) -> bool:
+        """True if another process committed a newer manifest"""
+        try:
+            with open(self.directory / MANIFEST_FILE, "r", encoding="utf-8") as f:
+                return json.load(f).get("generation") != self.generation
+        except (OSError, ValueError):
+            return True
+
+    def _load_locations(self) -> Dict[str, Tuple[str, int]]:
+        if self._locations is None:
+            locations = {}
+            for segment in self._segments:
+                for row, chunk_id in enumerate(segment.ids):
+                    if not segment.deleted[row]:
+                        locations[chunk_id] = (segment.name, row)
+            self._locations = locations
+        return self._locations
+
+    def _new_segment_directory(self) -> Path:
+        directory = self.directory / f"segment_{self._next_segment:06d}"
+        self._next_segment += 1
+        return directory
+
+    def add(self, ids: Sequence[str], documents: Sequence[Optional[str]], metadatas: Optional[Sequence[Optional[Dict]]] = None, replace: bool = True) -> int:
+        """Index chunks, returns how many were written.
+
+        replace=True follows Chroma's upsert: an indexed id is replaced. With
+        replace=False (Chroma's add) indexed ids are skipped.
+        """
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            self._refresh()
+            locations = self._load_locations()
+            # The last record per id wins within one call
+            latest = {chunk_id: position for position, chunk_id in enumerate(ids)}
+            if not replace:
+                latest = {chunk_id: position for chunk_id, position in latest.items() if chunk_id not in locations}
+            if not latest:
+                return 0
+
+            segments, obsolete = self._tombstone([chunk_id for chunk_id in latest if chunk_id in locations])
+            counters = [Counter(tokenize(documents[position])) for position in latest.values()]
+            terms = sorted(set().union(*counters))
+            term_index = {term: position for position, term in enumerate(terms)}
+            columns, vocabularies = filter_columns([metadatas[position] for position in latest.values()])
+            segment = Segment.write(
+                self._new_segment_directory(),
+                ids=list(latest),
+                columns=columns,
+                vocabularies=vocabularies,
+                lengths=np.asarray([sum(counter.values()) for counter in counters]),
+                terms=terms,
+                term_ids=np.asarray([term_index[term] for counter in counters for term in counter], dtype=np.int64),
+                rows=np.repeat(np.arange(len(counters), dtype=np.int64), [len(counter) for counter in counters]),
+                frequencies=np.asarray([frequency for counter in counters for frequency in counter.values()], dtype=np.int64)
+            )
+            for row, chunk_id in enumerate(latest):
+                locations[chunk_id] = (segment.name, row)
+
+            segments.append(segment)
+            if len(segments) > self.max_segments:
+                segments, merged_obsolete = self._merge(sorted(segments, key=lambda candidate: candidate.live_count)[:self.merge_factor], segments)
+                obsolete.extend(merged_obsolete)
+            self._commit(segments, obsolete)
+            return len(latest)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """Tombstone chunks, returns how many were indexed"""
+        with self._lock:
+            self._refresh()
+            locations = self._load_locations()
+            present = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id in locations]
+            if not present:
+                return 0
+            segments, obsolete = self._tombstone(present)
+            self._commit(segments, obsolete)
+            return len(present)
+
+    def compact(self):
+        """Merge all segments into one without tombstones"""
+        with self._lock:
+            self._refresh()
+            segments = list(self._segments)
+            if len(segments) > 1 or any(segment.live_count < len(segment) for segment in segments):
+                self._load_locations()
+                segments, obsolete = self._merge(segments, segments)
+                self._commit(segments, obsolete)
+
+    def _tombstone(self, ids: Sequence[str]) -> Tuple[List[Segment], List[Path]]:
+        """Segments with ids marked deleted and the tombstone files they replace"""
+        rows_by_segment = {}
+        for chunk_id in ids:
+            segment_name, row = self._locations.pop(chunk_id)
+            rows_by_segment.setdefault(segment_name, []).append(row)
+
+        segments, obsolete = [], []
+        for segment in self._segments:
+            rows = rows_by_segment.get(segment.name)
+            if rows:
+                if segment.deleted_file:
+                    obsolete.append(segment.directory / segment.deleted_file)
+                segment = segment.with_deleted(rows, f"deleted_{self.generation + 1}.npy")
+            segments.append(segment)
+        return segments, obsolete
+
+    def _merge(self, selected: List[Segment], segments: List[Segment]) -> Tuple[List[Segment], List[Path]]:
+        """Replace selected segments by one holding their live rows, postings are remapped, not re-tokenized"""
+        selected_names = {segment.name for segment in selected}
+        kept = [segment for segment in segments if segment.name not in selected_names]
+        obsolete = [segment.directory for segment in selected]
+
+        segment_terms = [list(segment.terms) for segment in selected]
+        terms = sorted(set().union(*segment_terms))
+        term_index = {term: position for position, term in enumerate(terms)}
+        vocabularies = {field: sorted(set().union(*(segment.vocabularies[field] for segment in selected))) for field in FILTER_FIELDS if field not in NUMERIC_FIELDS}
+        ids, lengths, term_ids, rows, frequencies = [], [], [], [], []
+        columns = {field: [] for field in FILTER_FIELDS}
+        base = 0
+        for segment, local_terms in zip(selected, segment_terms):
+            live = ~segment.deleted
+            new_rows = np.cumsum(live) - 1 + base
+            term_map = np.asarray([term_index[term] for term in local_terms], dtype=np.int64)
+            posting_terms = np.repeat(term_map, np.diff(np.asarray(segment.offsets)))
+            posting_rows = np.asarray(segment.rows, dtype=np.int64)
+            keep = live[posting_rows]
+            term_ids.append(posting_terms[keep])
+            rows.append(new_rows[posting_rows[keep]])
+            frequencies.append(np.asarray(segment.frequencies)[keep])
+
+            live_rows = np.flatnonzero(live)
+            ids.extend(segment.ids[row] for row in live_rows)
+            for field in FILTER_FIELDS:
+                column = np.asarray(segment.columns[field])[live]
+                if field not in NUMERIC_FIELDS:
+                    lookup = {value: code for code, value in enumerate(vocabularies[field])}
+                    # The appended -1 keeps missing values (code -1) missing
+                    remap = np.asarray([lookup[value] for value in segment.vocabularies[field]] + [-1], dtype=np.int32)
+                    column = remap[column]
+                columns[field].append(column)
+            lengths.append(np.asarray(segment.lengths)[live])
+            base += len(live_rows)
+
+        if base == 0:
+            return kept, obsolete
+
+        term_ids = np.concatenate(term_ids)
+        # Terms that only occurred in deleted rows are dropped
+        used = np.bincount(term_ids, minlength=len(terms)) > 0
+        remap = np.cumsum(used) - 1
+        merged = Segment.write(
+            self._new_segment_directory(),
+            ids=ids,
+            columns={field: np.concatenate(parts) for field, parts in columns.items()},
+            vocabularies=vocabularies,
+            lengths=np.concatenate(lengths),
+            terms=[term for term, is_used in zip(terms, used) if is_used],
+            term_ids=remap[term_ids],
+            rows=np.concatenate(rows),
+            frequencies=np.concatenate(frequencies)
+        )
+        if self._locations is not None:
+            for row, chunk_id in enumerate(ids):
+                self._locations[chunk_id] = (merged.name, row)
+        logger.debug(f"Merged {len(selected)} BM25 segments into {merged.name} ({base} chunks)")
+        return kept + [merged], obsolete
+
+    def _commit(self, segments: List[Segment], obsolete: List[Path]):
+        generation = self.generation + 1
+        # Files of generations below the oldest pin are unreachable, the new obsolete ones wait until no pin is older than generation
+        oldest = self._oldest_pinned_generation()
+        collectable = [entry for entry in self._garbage if entry["obsolete_at"] <= oldest]
+        garbage = [entry for entry in self._garbage if entry["obsolete_at"] > oldest]
+        garbage.extend({"path": str(path.relative_to(self.directory)), "obsolete_at": generation} for path in obsolete)
+        for entry in collectable:
+            path = self.directory / entry["path"]
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+        manifest = {
+            "format": INDEX_FORMAT,
+            "generation": generation,
+            "next_segment": self._next_segment,
+            "segments": [{"name": segment.name, "deleted": segment.deleted_file} for segment in segments],
+            "garbage": garbage,
+        }
+        tmp_path = self.directory / f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.directory / MANIFEST_FILE)
+        self.generation = generation
+        self._garbage = garbage
+        self._segments = tuple(segments)
+        self._write_pin()
+
+    def score_batch(self, queries: Sequence[str], segments: Sequence[Segment]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Per query the rows (positions in segments concatenated) that contain a query term and their BM25 scores.
+
+        Only the postings of the query terms are read, once for all queries. Their
+        weights tf (k1 + 1) / (tf + k1 (1 - b + b length / average_length)) and
+        the idf are computed for these postings alone, so nothing is precomputed
+        that a write would invalidate. Each query sums its terms' postings in a
+        sparse accumulator over the matched rows, the cost follows the number of
+        matches, not the number of chunks.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        count = sum(segment.live_count for segment in segments)
+        if count == 0 or not queries:
+            return [empty for _ in queries]
+        average_length = max(sum(segment.live_length for segment in segments) / count, 1e-9)
+
+        # Repeated query terms count once per occurrence, as in BM25Okapi
+        query_terms = [Counter(tokenize(query)) for query in queries]
+        gathered = {}
+        base = 0
+        for segment in segments:
+            for term in set().union(*query_terms):
+                rows, frequencies = segment.postings(term)
+                if len(rows):
+                    lengths = np.asarray(segment.lengths[rows], dtype=np.float32)
+                    weights = frequencies * (K1 + 1) / (frequencies + K1 * (1 - B + B * lengths / np.float32(average_length)))
+                    gathered.setdefault(term, []).append((base + rows, weights))
+            base += len(segment)
+
+        postings = {}
+        for term, parts in gathered.items():
+            rows = np.concatenate([part[0] for part in parts])
+            idf = math.log(1.0 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            postings[term] = (rows, np.concatenate([part[1] for part in parts]), idf)
+
+        results = []
+        for terms in query_terms:
+            matched = [(postings[term], query_frequency) for term, query_frequency in terms.items() if term in postings]
+            if not matched:
+                results.append(empty)
+                continue
+            rows = np.concatenate([rows for (rows, _, _), _ in matched])
+            values = np.concatenate([weights * np.float32(query_frequency * idf) for (_, weights, idf), query_frequency in matched])
+            unique_rows, inverse = np.unique(rows, return_inverse=True)
+            results.append((unique_rows, np.bincount(inverse, weights=values, minlength=len(unique_rows)).astype(np.float32)))
+        return results
+
+    def search_batch(self, queries: Sequence[str], n_results: int = 10, year_from: Optional[int] = None, source: Optional[str] = None, section: Optional[str] = None) -> List[List[Tuple[str, float]]]:
+        """Per query the (chunk id, score) of the best n_results chunks that contain a query term and pass the filters.
+
+        The filters are evaluated on the filter columns of the matched rows only,
+        before ranking. The best rows are selected with argpartition and only
+        those are sorted.
+        """
+        segments = self._segments
+        if n_results <= 0:
+            return [[] for _ in queries]
+        bases = np.cumsum([0] + [len(segment) for segment in segments])
+        batch_results = []
+        for rows, scores in self.score_batch(queries, segments):
+            positions = np.searchsorted(bases, rows, side="right") - 1
+            if year_from or source or section:
+                keep = np.zeros(len(rows), dtype=bool)
+                for position in np.unique(positions):
+                    selected = positions == position
+                    keep[selected] = segments[position].filter_mask(year_from, source, section, rows=rows[selected] - bases[position])
+                rows, scores, positions = rows[keep], scores[keep], positions[keep]
+            if len(rows) > n_results:
+                best = np.argpartition(-scores, n_results - 1)[:n_results]
+                rows, scores, positions = rows[best], scores[best], positions[best]
+            order = np.lexsort((rows, -scores))
+            batch_results.append([(segments[positions[i]].ids[int(rows[i] - bases[positions[i]])], float(scores[i])) for i in order])
+        return batch_results
+
+    def search(self, query: str, n_results: int = 10, year_from: Optional[int] = None, source: Optional[str] = None, section: Optional[str] = None) -> List[Tuple[str, float]]:
+        return self.search_batch([query], n_results, year_from, source, section)[0]
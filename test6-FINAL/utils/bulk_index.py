@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from utils.pdf_cache import PdfTextCache
+from utils.pdf_extraction import EXTRACTOR_VERSION
+from utils.ingestion_pipeline import IngestionPipeline
+
+logger = logging.getLogger(__name__)
+
+SOURCES_FILE = "sources.json"
+CHECKPOINT_FILE = "reindex_checkpoint.json"
+
+
+def paper_base_id(doi: Optional[str], arxiv_id: Optional[str], fallback: str) -> str:
+    """Chunk id prefix of a paper, shared by the research flow and the bulk re-index"""
+    paper_id = doi or arxiv_id or fallback
+    return paper_id.replace('/', '_').replace(':', '_').replace('.', '_')
+
+
+def source_base_ids(pdf_dir: str) -> Tuple[Set[str], Set[str]]:
+    """Base ids of the papers in pdf_dir/sources.json, split into (PDF present, PDF deleted)"""
+    pdf_dir = Path(pdf_dir)
+    with open(pdf_dir / SOURCES_FILE, "r", encoding="utf-8") as f:
+        sources = json.load(f)
+
+    present, deleted = set(), set()
+    for filename, entry in sources.items():
+        base_id = paper_base_id(entry.get('doi'), entry.get('arxiv_id'), Path(filename).stem)
+        (present if (pdf_dir / filename).exists() else deleted).add(base_id)
+    # A paper downloaded twice under different names stays referenced while one copy exists
+    return present, deleted - present
+
+
+def load_source_papers(pdf_dir: str, stored_metadata: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """Build IngestionPipeline papers from the PDFs listed in pdf_dir/sources.json.
+
+    Entries whose PDF is missing are skipped. quality_rating and filtered are not
+    part of sources.json, they are kept from stored_metadata (base_id -> metadata)
+    so a re-index does not drop the screening results of the research flow.
+    """
+    pdf_dir = Path(pdf_dir)
+    with open(pdf_dir / SOURCES_FILE, "r", encoding="utf-8") as f:
+        sources = json.load(f)
+
+    stored_metadata = stored_metadata or {}
+    papers = []
+    for filename, entry in sorted(sources.items()):
+        pdf_path = pdf_dir / filename
+        if not pdf_path.exists():
+            logger.warning(f"Skipping {filename}: listed in {SOURCES_FILE} but not found in {pdf_dir}")
+            continue
+
+        title = " ".join((entry.get('title') or '').split())
+        authors = entry.get('authors')
+        base_id = paper_base_id(entry.get('doi'), entry.get('arxiv_id'), pdf_path.stem)
+        stored = stored_metadata.get(base_id, {})
+        metadata = {
+            'title': title,
+            'authors': authors if isinstance(authors, str) else ', '.join(authors or []),
+            'year': entry.get('year') or 0,
+            'journal': entry.get('journal') or '',
+            'doi': entry.get('doi') or '',
+            'arxiv_id': entry.get('arxiv_id') or '',
+            'pdf_url': entry.get('pdf_url') or '',
+            'source': 'arxiv' if entry.get('arxiv_id') else 'openalex',
+            'quality_rating': stored.get('quality_rating') or '',
+            'filtered': stored.get('filtered') or 'false'
+        }
+        citation = " ".join((entry.get('citation') or '').split())
+        papers.append({
+            'base_id': base_id,
+            'metadata': metadata,
+            'pdf_path': str(pdf_path),
+            'fallback_text': f"Title: {title}\n\nCitation: {citation}"
+        })
+    return papers
+
+
+class ReindexCheckpoint:
+    """Records finished papers so an interrupted re-index can resume.
+
+    The checkpoint is only valid for the settings it was written with, a
+    different signature (chunking, extractor, embedding model) starts over.
+    """
+
+    def __init__(self, path: str, signature: Dict, flush_every: int = 10):
+        self.path = Path(path)
+        self.signature = signature
+        self.flush_every = flush_every
+        self.done = set()
+        self._unflushed = 0
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("signature") == signature:
+                    self.done = set(data.get("done", []))
+                else:
+                    logger.info("Re-index settings changed, ignoring the previous checkpoint")
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Could not read checkpoint {self.path}: {e}")
+
+    def mark(self, base_id: str):
+        with self._lock:
+            self.done.add(base_id)
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+        self._unflushed = 0
+
+    def clear(self):
+        with self._lock:
+            self.done = set()
+            self._unflushed = 0
+            if self.path.exists():
+                self.path.unlink()
+
+
+class _Progress:
+    def __init__(self, total: int, stream=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.counts = {"upserted": 0, "unchanged": 0, "failed": 0}
+        self.chunks = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, base_id: str, status: str, chunks: int):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self.chunks += chunks
+            done = sum(self.counts.values())
+            elapsed = max(time.monotonic() - self.start, 1e-9)
+            self.stream.write(f"[{done}/{self.total}] {status:<9} {base_id} | "
+                              f"{done / elapsed:.2f} papers/s, {self.chunks / elapsed:.1f} chunks/s\n")
+            self.stream.flush()
+
+
+def _stored_first_chunks(manager, collection_name: str, batch_size: int = 1000) -> Dict[str, Dict]:
+    if collection_name not in manager.list_collections():
+        return {}
+    collection = manager.get_collection(collection_name)
+    stored = {}
+    offset = 0
+    while True:
+        batch = collection.get(where={"chunk_index": 0}, include=["metadatas"], limit=batch_size, offset=offset)
+        for metadata in batch["metadatas"]:
+            if metadata and metadata.get("base_id"):
+                stored[metadata["base_id"]] = metadata
+        if len(batch["ids"]) < batch_size:
+            return stored
+        offset += batch_size
+
+
+def reindex_directory(manager, pdf_dir: str, collection_name: str = "scientific_publications", cache_dir: Optional[str] = None, workers: Optional[int] = None, chunk_size: int = 1000, chunk_overlap: int = 200, chunking_strategy: str = "sections", deduplicate: bool = True, extraction_timeout: Optional[float] = 120.0, extraction_max_memory_mb: Optional[int] = 2048, restart: bool = False, drop: bool = False) -> Dict:
+    """Bulk-index every PDF of pdf_dir/sources.json into a collection without running the research flow.
+
+    Papers recorded in the checkpoint (next to the Chroma directory) and still
+    present in the collection are skipped without being parsed. All other
+    papers go through the IngestionPipeline, which itself skips papers whose
+    chunks are already stored unchanged. restart=True discards the checkpoint,
+    drop=True deletes the collection first (needed after an embedding model change).
+    """
+    manager.create_publications_collection(collection_name=collection_name, drop_if_exists=drop)
+    stored_metadata = _stored_first_chunks(manager, collection_name)
+    papers = load_source_papers(pdf_dir, stored_metadata)
+
+    signature = {
+        "collection": collection_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunking_strategy": chunking_strategy,
+        "deduplicate": deduplicate,
+        "extractor_version": EXTRACTOR_VERSION,
+        "embedding_model": manager.embedding_model,
+    }
+    checkpoint = ReindexCheckpoint(Path(manager.persist_directory) / CHECKPOINT_FILE, signature)
+    if restart:
+        checkpoint.clear()
+
+    pending = [paper for paper in papers if paper["base_id"] not in checkpoint.done or paper["base_id"] not in stored_metadata]
+    skipped = len(papers) - len(pending)
+    print(f"Re-indexing {len(pending)} of {len(papers)} papers from {pdf_dir} into '{collection_name}' "
+          f"({skipped} already done according to the checkpoint)", file=sys.stderr)
+
+    progress = _Progress(len(pending))
+
+    def on_paper(base_id, status, chunks):
+        progress(base_id, status, chunks)
+        if status != "failed":
+            checkpoint.mark(base_id)
+
+    text_cache = None
+    if cache_dir:
+        text_cache = PdfTextCache(cache_dir=str(Path(cache_dir) / "pdf_text"), extractor_version=EXTRACTOR_VERSION)
+
+    pipeline = IngestionPipeline(
+        manager,
+        collection_name=collection_name,
+        extraction_workers=workers or os.cpu_count(),
+        text_cache=text_cache,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        chunking_strategy=chunking_strategy,
+        deduplicate=deduplicate,
+        extraction_timeout=extraction_timeout,
+        extraction_max_memory_mb=extraction_max_memory_mb,
+        on_paper=on_paper
+    )
+    try:
+        summary = pipeline.run(pending)
+    finally:
+        checkpoint.flush()
+
+    summary["skipped_by_checkpoint"] = skipped
+    summary["papers_per_second"] = summary["papers"] / summary["seconds"] if summary["seconds"] else 0.0
+    summary["chunks_per_second"] = summary["chunks"] / summary["seconds"] if summary["seconds"] else 0.0
+    summary["embedding"] = manager.embedding_executor.stats()
+    if text_cache is not None:
+        summary["pdf_text_cache"] = text_cache.stats()
+    if manager.embedding_cache is not None:
+        summary["embedding_cache"] = manager.embedding_cache.stats()
+    return summary
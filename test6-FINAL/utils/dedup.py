@@ -0,0 +1,136 @@
+import re
+import zlib
+import functools
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_MAX_HASH = (1 << 31) - 1
+
+
+class MinHasher:
+    """MinHash signatures over word shingles.
+
+    Hashing uses crc32 and a fixed seed, so signatures are identical across
+    processes and runs. The hashes are below 2^31, signatures are stored as uint32.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, _MAX_HASH, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = generator.randint(0, _MAX_HASH, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def shingles(self, text: str) -> set:
+        tokens = re.findall(r"\w+", text.lower())
+        if len(tokens) < self.shingle_size:
+            return {" ".join(tokens)} if tokens else set()
+        return {" ".join(tokens[i:i + self.shingle_size]) for i in range(len(tokens) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) & _MAX_HASH for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def estimate_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+# Probability that a pair exactly at the threshold shares at least one band
+MIN_CANDIDATE_RECALL = 0.95
+
+
+@functools.lru_cache(maxsize=None)
+def _choose_bands(num_perm: int, threshold: float, min_recall: float = MIN_CANDIDATE_RECALL) -> Tuple[int, int]:
+    """Pick bands * rows <= num_perm for the LSH buckets.
+
+    A pair with Jaccard s shares a band with probability 1 - (1 - s^rows)^bands.
+    Among the layouts that make a pair at the threshold a candidate with at least
+    min_recall, take the one with the fewest expected candidates below the
+    threshold (the area under the S-curve on [0, threshold]). Candidates are
+    verified against all num_perm values afterwards.
+    """
+    below = np.linspace(0.0, threshold, 200)
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            if 1.0 - (1.0 - threshold ** rows) ** bands < min_recall:
+                continue
+            false_positives = float(np.mean(1.0 - (1.0 - below ** rows) ** bands)) * threshold
+            if best is None or false_positives < best[0]:
+                best = (false_positives, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """Thread-safe MinHash LSH index that maps chunk ids to signatures.
+
+    Candidates from the LSH buckets are verified against the estimated Jaccard
+    similarity, so only chunks at or above threshold are reported.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._owners: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, signature: np.ndarray, owner: Optional[str] = None):
+        with self._lock:
+            self._remove(key)
+            self._signatures[key] = signature
+            self._owners[key] = owner
+            for band, band_key in self._band_keys(signature):
+                self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def _remove(self, key: str):
+        signature = self._signatures.pop(key, None)
+        self._owners.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def remove(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def remove_owner(self, owner: str):
+        with self._lock:
+            for key in [key for key, key_owner in self._owners.items() if key_owner == owner]:
+                self._remove(key)
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Return (key, similarity) of the most similar indexed chunk above threshold, or None"""
+        with self._lock:
+            candidates = set()
+            for band, band_key in self._band_keys(signature):
+                candidates.update(self._buckets[band].get(band_key, ()))
+
+            best = None
+            for key in candidates:
+                similarity = estimate_jaccard(signature, self._signatures[key])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+            return best
@@ -0,0 +1,112 @@
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Sequence
+import numpy as np
+from utils.hnsw_sweep import load_embeddings, collection_space, exact_top_k, recall_at_k
+from utils.quantized_store import REDUCED_DTYPE
+
+logger = logging.getLogger(__name__)
+
+
+def _latency_summary(latencies: List[float]) -> Dict:
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+    }
+
+
+def benchmark_dense(manager, collection_name: str, k: int = 10, num_queries: int = 200, projections: Sequence[str] = ("pca32", "pca64", "pca128", "prefix64", "prefix128"), dtypes: Sequence[str] = ("int8", "float16"), rescore_factors: Sequence[int] = (2, 4, 8), seed: int = 0) -> Dict:
+    """Compare the dense engines on stored vectors used as queries.
+
+    Every engine is asked for k+1 neighbours and the query's own id is dropped,
+    recall@k is measured against exact search over the float32 vectors. Chroma's
+    HNSW index is the baseline, the others are quantized stores (full dimension,
+    per dtype) and float32 stores of reduced projections, each with every rescore
+    factor. Stores are built in the manager's quantized directory and reused later.
+    """
+    collection = manager.get_collection(collection_name)
+    space = collection_space(collection)
+    ids, vectors = load_embeddings(collection)
+    if len(ids) <= k + 1:
+        raise ValueError(f"Collection '{collection_name}' needs more than {k + 1} embeddings for a benchmark, found {len(ids)}")
+
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(ids), size=min(num_queries, len(ids)), replace=False)
+    queries = vectors[query_rows]
+    exact_with_self = exact_top_k(vectors, queries, k + 1, space)
+    exact = np.asarray([[row for row in rows if row != query_row][:k] for rows, query_row in zip(exact_with_self.tolist(), query_rows)])
+    row_of = {chroma_id: row for row, chroma_id in enumerate(ids)}
+
+    def measure(search) -> Dict:
+        latencies, found = [], []
+        for query_row, query in zip(query_rows, queries):
+            started = time.monotonic()
+            result_ids = search(query)
+            latencies.append(time.monotonic() - started)
+            found.append([row_of[chroma_id] for chroma_id in result_ids if chroma_id in row_of and row_of[chroma_id] != query_row][:k])
+        return {"recall_at_k": recall_at_k(found, exact), **_latency_summary(latencies)}
+
+    float32_bytes = int(vectors.nbytes)
+    report = {
+        "collection": collection_name,
+        "vectors": len(ids),
+        "dimension": int(vectors.shape[1]),
+        "space": space,
+        "k": k,
+        "queries": len(query_rows),
+        "float32_bytes": float32_bytes,
+        "results": [],
+    }
+    del vectors
+
+    baseline = measure(lambda query: collection.query(query_embeddings=query[None, :], n_results=k + 1, include=["documents", "metadatas", "distances"])["ids"][0])
+    report["results"].append({"engine": "chroma-hnsw", "projection": None, "dtype": "float32", "rescore_factor": None,
+                              "memory_bytes": float32_bytes, "build_seconds": None, **baseline})
+
+    configurations = [(None, dtype) for dtype in dtypes] + [(projection, REDUCED_DTYPE) for projection in projections]
+    for projection, dtype in configurations:
+        started = time.monotonic()
+        store = manager.get_quantized_store(collection_name, dtype, projection=projection)
+        build_seconds = time.monotonic() - started
+        for rescore_factor in rescore_factors:
+            entry = measure(lambda query: store.search(collection, query[None, :], n_results=k + 1, rescore_factor=rescore_factor)[0]["ids"][0])
+            report["results"].append({
+                "engine": "reduced" if projection else "quantized",
+                "projection": projection,
+                "dtype": dtype,
+                "rescore_factor": rescore_factor,
+                "explained_variance": store.projection.explained_variance if store.projection is not None else None,
+                "memory_bytes": store.nbytes,
+                "build_seconds": build_seconds,
+                **entry,
+            })
+            logger.info(f"{projection or 'full'} {dtype} rescore x{rescore_factor}: recall@{k}={entry['recall_at_k']:.3f} p50={entry['p50_ms']:.2f}ms")
+    return report
+
+
+def write_report(report: Dict, path: str):
+    """Write the benchmark as JSON and a Markdown table next to it"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    lines = [
+        f"# Dense engines on '{report['collection']}'",
+        "",
+        f"{report['vectors']} vectors, {report['dimension']} dimensions, space {report['space']}, "
+        f"{report['queries']} stored vectors as queries, k={report['k']}",
+        "",
+        "| engine | projection | dtype | rescore | recall@k | p50 ms | p99 ms | memory MiB | kept variance |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for entry in report["results"]:
+        variance = f"{entry['explained_variance']:.1%}" if entry.get("explained_variance") is not None else ""
+        lines.append(f"| {entry['engine']} | {entry['projection'] or ''} | {entry['dtype']} | {entry['rescore_factor'] or ''} | "
+                     f"{entry['recall_at_k']:.3f} | {entry['p50_ms']:.2f} | {entry['p99_ms']:.2f} | "
+                     f"{entry['memory_bytes'] / 2**20:.1f} | {variance} |")
+    path.with_suffix(".md").write_text("\n".join(lines) + "\n", encoding="utf-8")
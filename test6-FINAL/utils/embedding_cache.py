@@ -0,0 +1,229 @@
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings as ChromaEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so trivially different copies share a cache entry"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """On-disk embedding cache backed by SQLite.
+
+    Entries are keyed by model name, model version and the SHA-256 of the
+    normalized text, so switching models never returns stale vectors. Vectors
+    are stored as float32. When the stored vectors grow above max_bytes the
+    least recently used entries are evicted. Safe to share between threads.
+
+    Lookups only read. Their access times are buffered and written once
+    access_flush_size hits have accumulated, with the next put, before an
+    eviction and on flush() or close().
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024 * 1024, access_flush_size: int = 1000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.access_flush_size = access_flush_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, float] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key_for(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for offset in range(0, len(unique_keys), _SQL_BATCH):
+                batch = unique_keys[offset:offset + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+
+            now = time.time()
+            self._pending_access.update((key, now) for key in found)
+            if len(self._pending_access) >= self.access_flush_size:
+                self._write_access_times()
+                self._conn.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, model: str, entries: Dict[str, Sequence[float]]):
+        if not entries:
+            return
+        now = time.time()
+        rows = [(key, model, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in entries.items()]
+        with self._lock:
+            keys = list(entries)
+            previous = 0
+            for offset in range(0, len(keys), _SQL_BATCH):
+                batch = keys[offset:offset + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                previous += self._conn.execute(f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", batch).fetchone()[0]
+            self._write_access_times()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+            self._total_bytes += sum(len(row[2]) for row in rows) - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _write_access_times(self):
+        # Runs in the caller's transaction, the caller commits
+        if self._pending_access:
+            self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key, now in self._pending_access.items()])
+            self._pending_access.clear()
+
+    def flush(self):
+        """Write the buffered access times of earlier lookups."""
+        with self._lock:
+            self._write_access_times()
+            self._conn.commit()
+
+    def _evict(self):
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append(key)
+            self._total_bytes -= size
+
+        for offset in range(0, len(evicted), _SQL_BATCH):
+            batch = evicted[offset:offset + _SQL_BATCH]
+            self._conn.execute(f"DELETE FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+        self._conn.commit()
+        self.evictions += len(evicted)
+
+        logger.info(f"Embedding cache evicted down to {self._total_bytes} bytes ({self.evictions} evictions so far)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_access_times()
+            self._conn.commit()
+            self._conn.close()
+
+
+def embed_with_cache(cache: EmbeddingCache, model: str, texts: List[str], embed: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[np.ndarray]:
+    """Return one float32 vector per text, embedding only the texts missing from the cache.
+
+    Identical texts within one call are embedded once.
+    """
+    keys = [cache.key_for(model, text) for text in texts]
+    vectors = cache.get_many(keys)
+
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors and key not in missing:
+            missing[key] = text
+
+    if missing:
+        computed = embed(list(missing.values()))
+        new_entries = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, computed)}
+        cache.put_many(model, new_entries)
+        vectors.update(new_entries)
+
+    return [vectors[key] for key in keys]
+
+
+def _describe_embedding_function(embedding_function) -> Tuple[str, str]:
+    # Chroma embedding functions expose name() and a serializable config that pins the model
+    name = embedding_function.name() if hasattr(embedding_function, "name") else NotImplemented
+    if name is NotImplemented or not isinstance(name, str):
+        name = type(embedding_function).__name__
+    try:
+        config = embedding_function.get_config()
+    except Exception:
+        config = NotImplemented
+    if config is NotImplemented or not isinstance(config, dict):
+        config = {}
+    model_name = str(config.get("model_name") or name)
+    model_version = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+    return model_name, model_version
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function that serves repeated texts from an EmbeddingCache.
+
+    name() and the config are delegated to the wrapped function, so collections
+    created with it stay compatible with the unwrapped function.
+    """
+
+    def __init__(self, embedding_function, cache: EmbeddingCache, model_name: Optional[str] = None, model_version: Optional[str] = None):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        default_name, default_version = _describe_embedding_function(embedding_function)
+        self.model_name = model_name or default_name
+        self.model_version = model_version or default_version
+
+    @property
+    def model(self) -> str:
+        return f"{self.model_name}@{self.model_version}"
+
+    def __call__(self, input: Documents) -> ChromaEmbeddings:
+        return embed_with_cache(self.cache, self.model, list(input), self.embedding_function)
+
+    def name(self) -> str:
+        return self.embedding_function.name()
+
+    def get_config(self):
+        return self.embedding_function.get_config()
+
+    def build_from_config(self, config):
+        return self.embedding_function.build_from_config(config)
+
+    def default_space(self):
+        return self.embedding_function.default_space()
+
+    def supported_spaces(self):
+        return self.embedding_function.supported_spaces()
+
+    def is_legacy(self) -> bool:
+        return self.embedding_function.is_legacy()
+
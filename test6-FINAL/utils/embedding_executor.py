@@ -0,0 +1,169 @@
+import re
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the request was too large, so a smaller batch can succeed
+PAYLOAD_TOO_LARGE = 413
+_SIZE_ERROR = re.compile(r"too large|too long|payload|context length|maximum (input|context|sequence|batch)", re.IGNORECASE)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    # requests/httpx errors carry the response, urllib's HTTPError and the ollama client the code itself
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None), getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_size_error(error: Exception) -> bool:
+    """True if the backend rejected a batch for its size (HTTP 413 or a length error)"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status == PAYLOAD_TOO_LARGE
+    return bool(_SIZE_ERROR.search(str(error)))
+
+
+class EmbeddingExecutor:
+    """Sends texts to an embedding backend in adaptive batches with several requests in flight.
+
+    The batch size grows while batches finish well below target_latency and is
+    halved when a batch is slower than that. A batch the backend rejects for its
+    size (HTTP 413 or a length error) is split and retried until a single text
+    fails, any other error, e.g. a refused connection or a timeout, is raised
+    right away. Batches are also capped at max_batch_chars characters so long
+    chunks do not produce huge payloads.
+    Results are returned in input order.
+
+    embed is any callable that maps a list of texts to a list of vectors, e.g. a
+    Chroma embedding function. With chromadb's OllamaEmbeddingFunction(url=...)
+    every batch is one HTTP request to that server.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], Sequence[Sequence[float]]], max_concurrency: int = 4, batch_size: int = 32, min_batch_size: int = 1, max_batch_size: int = 512, target_latency: float = 2.0, max_batch_chars: int = 256 * 1024):
+        self.embed_batch = embed
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.target_latency = target_latency
+        self.max_batch_chars = max_batch_chars
+        self.texts = 0
+        self.batches = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed")
+            return self._pool
+
+    def _next_batch(self, texts: List[str], pending: deque):
+        start, end = pending.popleft()
+        with self._lock:
+            limit = self.batch_size
+        stop = start
+        chars = 0
+        while stop < end and stop - start < limit:
+            chars += len(texts[stop])
+            if stop > start and chars > self.max_batch_chars:
+                break
+            stop += 1
+        if stop < end:
+            pending.appendleft((stop, end))
+        return start, stop
+
+    def _adapt(self, size: int, latency: float, failed: bool = False):
+        with self._lock:
+            if failed or latency > self.target_latency:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif latency < self.target_latency / 2 and size >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    def _timed_embed(self, batch: List[str]):
+        started = time.monotonic()
+        vectors = self.embed_batch(batch)
+        return vectors, time.monotonic() - started
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        texts = list(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if not texts:
+            return []
+
+        started = time.monotonic()
+        pool = self._get_pool()
+        pending = deque([(0, len(texts))])
+        in_flight = {}
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.max_concurrency:
+                    start, stop = self._next_batch(texts, pending)
+                    in_flight[pool.submit(self._timed_embed, texts[start:stop])] = (start, stop)
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, stop = in_flight.pop(future)
+                    try:
+                        vectors, latency = future.result()
+                        if len(vectors) != stop - start:
+                            raise ValueError(f"Embedding backend returned {len(vectors)} embeddings for {stop - start} texts")
+                    except Exception as e:
+                        with self._lock:
+                            self.failures += 1
+                        if not is_size_error(e) or stop - start == 1:
+                            raise
+                        self._adapt(stop - start, 0.0, failed=True)
+                        middle = (start + stop) // 2
+                        logger.warning(f"Embedding batch of {stop - start} texts failed ({e}), retrying as two halves")
+                        pending.appendleft((middle, stop))
+                        pending.appendleft((start, middle))
+                        continue
+
+                    for offset, vector in enumerate(vectors):
+                        results[start + offset] = [float(value) for value in vector]
+                    self._adapt(stop - start, latency)
+                    with self._lock:
+                        self.batches += 1
+                        self.texts += stop - start
+                        self.busy_seconds += latency
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.seconds += elapsed
+        if len(texts) > 1:
+            logger.info(f"Embedded {len(texts)} texts in {elapsed:.2f}s ({len(texts) / elapsed if elapsed else 0.0:.1f} texts/s, batch size now {self.batch_size})")
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "texts": self.texts,
+                "batches": self.batches,
+                "failures": self.failures,
+                "batch_size": self.batch_size,
+                "max_concurrency": self.max_concurrency,
+                "seconds": self.seconds,
+                "busy_seconds": self.busy_seconds,
+                "texts_per_second": self.texts / self.seconds if self.seconds else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
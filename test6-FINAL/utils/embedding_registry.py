@@ -0,0 +1,147 @@
+import os
+import logging
+import threading
+from typing import List, Optional
+from chromadb.api.types import Documents, DefaultEmbeddingFunction, Embeddings as ChromaEmbeddings
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Collection metadata keys that pin the embedding model and dimension of the stored vectors
+MODEL_KEY = "embedding_model"
+DIMENSION_KEY = "embedding_dimension"
+
+# Chroma's built-in all-MiniLM-L6-v2
+MINILM_MODEL = "default"
+# The research flow has always embedded with nomic-embed-text, existing chroma_db directories hold these vectors
+DEFAULT_MODEL = "ollama:nomic-embed-text"
+
+
+class EmbeddingMismatchError(ValueError):
+    """Raised when vectors of another model or dimension would be written to a pinned collection"""
+
+
+class SharedDefaultEmbeddingFunction(DefaultEmbeddingFunction):
+    """Chroma's default all-MiniLM-L6-v2 embedder with one ONNX session per process.
+
+    DefaultEmbeddingFunction builds a new ONNX model on every call. The name and
+    config stay 'default', so collections created with either are compatible.
+    """
+
+    _model = None
+    _lock = threading.Lock()
+
+    def __call__(self, input: Documents) -> ChromaEmbeddings:
+        with SharedDefaultEmbeddingFunction._lock:
+            if SharedDefaultEmbeddingFunction._model is None:
+                from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+                SharedDefaultEmbeddingFunction._model = ONNXMiniLM_L6_V2()
+        return SharedDefaultEmbeddingFunction._model(input)
+
+
+def _build(model: str):
+    if model == MINILM_MODEL:
+        return SharedDefaultEmbeddingFunction()
+    if model.startswith("ollama:"):
+        from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
+        return OllamaEmbeddingFunction(url=os.getenv("OLLAMA_HOST", "http://localhost:11434"), model_name=model.split(":", 1)[1])
+    raise ValueError(f"Unknown embedding model '{model}', use '{MINILM_MODEL}' or 'ollama:<model>'")
+
+
+class EmbeddingRegistry:
+    """Holds the one embedding function of this process.
+
+    The model is chosen with configure() (or EMBEDDING_MODEL in the environment)
+    before the first get(). Asking for a different model once one is loaded
+    raises, so two embedders never end up writing into the same collections.
+    """
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+        self._function = None
+        self._lock = threading.Lock()
+
+    def configure(self, model: str):
+        with self._lock:
+            if model == self.model:
+                return
+            if self._function is not None:
+                raise ValueError(f"Embedding model '{self.model}' is already loaded in this process, cannot switch to '{model}'")
+            self.model = model
+
+    def get(self):
+        with self._lock:
+            if self._function is None:
+                self._function = _build(self.model)
+                logger.info(f"Loaded embedding model '{self.model}'")
+            return self._function
+
+    def model_for(self, embedding_function) -> str:
+        """Name under which vectors of embedding_function are pinned"""
+        if embedding_function is self._function:
+            return self.model
+        name = embedding_function.name() if hasattr(embedding_function, "name") else NotImplemented
+        return name if isinstance(name, str) else type(embedding_function).__name__
+
+
+registry = EmbeddingRegistry()
+
+
+def pin_metadata(metadata: Optional[dict], model: str) -> dict:
+    """Collection metadata with the model pinned, keeping an existing pin"""
+    metadata = dict(metadata or {})
+    metadata.setdefault(MODEL_KEY, model)
+    return metadata
+
+
+def mismatch_hint(pinned_model: Optional[str] = None) -> str:
+    """How to resolve a collection that holds vectors of another model, appended to mismatch errors"""
+    keep = f"set EMBEDDING_MODEL={pinned_model} to keep using the stored vectors" if pinned_model else "set EMBEDDING_MODEL to the model the collection was written with"
+    return f"{keep}, or re-embed the collection with 'python ./chroma_manager.py reindex --drop --embedding-model <model>' (see 'Switching embedding models' in the README)"
+
+
+def _stored_dimension(collection) -> Optional[int]:
+    # Collections written before the pin existed carry no record, their vectors still have a dimension
+    stored = collection.peek(limit=1)
+    embeddings = stored.get("embeddings")
+    return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+
+def check_pin(collection, model: str, dimension: int) -> bool:
+    """Validate a write of dimension-sized vectors from model against the collection's pin.
+
+    Returns True if the pin is incomplete and should be written with pin_collection.
+    """
+    metadata = collection.metadata or {}
+    pinned_model = metadata.get(MODEL_KEY)
+    pinned_dimension = metadata.get(DIMENSION_KEY)
+    if pinned_model is not None and pinned_model != model:
+        raise EmbeddingMismatchError(f"Collection '{collection.name}' holds '{pinned_model}' embeddings, refusing to write '{model}' embeddings: {mismatch_hint(pinned_model)}")
+    if pinned_dimension is None:
+        pinned_dimension = _stored_dimension(collection)
+    if pinned_dimension is not None and pinned_dimension != dimension:
+        raise EmbeddingMismatchError(f"Collection '{collection.name}' holds {pinned_dimension}-dimensional embeddings of {repr(pinned_model) if pinned_model else 'an unrecorded model'}, "
+                                     f"refusing to write {dimension}-dimensional '{model}' embeddings: {mismatch_hint(pinned_model)}")
+    return pinned_model is None or metadata.get(DIMENSION_KEY) is None
+
+
+def pin_collection(collection, model: str, dimension: int):
+    # hnsw:* keys cannot be passed to modify(), the index configuration keeps them
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    metadata[MODEL_KEY] = model
+    metadata[DIMENSION_KEY] = dimension
+    collection.modify(metadata=metadata)
+    logger.info(f"Pinned collection '{collection.name}' to '{model}' ({dimension} dimensions)")
+
+
+class LangchainEmbeddings(Embeddings):
+    """Exposes a Chroma embedding function to LangChain, e.g. the langchain Chroma vector store"""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [[float(value) for value in vector] for vector in self.embedding_function(list(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
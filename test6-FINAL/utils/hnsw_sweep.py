@@ -0,0 +1,204 @@
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SWEEP_SUFFIX = "__hnsw_sweep"
+
+
+def load_embeddings(collection, batch_size: int = 1000) -> Tuple[List[str], np.ndarray]:
+    """Read every id and embedding of a collection into a float32 matrix"""
+    ids: List[str] = []
+    vectors = []
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        ids.extend(batch["ids"])
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch["ids"])
+    if not vectors:
+        return ids, np.zeros((0, 0), dtype=np.float32)
+    return ids, np.vstack(vectors)
+
+
+def collection_configuration(collection) -> Dict:
+    """The collection's index configuration, empty if Chroma cannot load it (e.g. unregistered embedding functions)"""
+    try:
+        return getattr(collection, "configuration", None) or {}
+    except ValueError as e:
+        logger.debug(f"Could not load the configuration of '{collection.name}': {e}")
+        return {}
+
+
+def collection_space(collection) -> str:
+    hnsw = collection_configuration(collection).get("hnsw") or {}
+    return hnsw.get("space") or (collection.metadata or {}).get("hnsw:space") or "l2"
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, space: str = "l2", block_size: int = 64) -> np.ndarray:
+    """Row indices of the k nearest vectors for every query, by brute force in Chroma's distance"""
+    k = min(k, len(vectors))
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    squared_norms = np.einsum("ij,ij->i", vectors, vectors) if space == "l2" else None
+
+    result = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        scores = block @ vectors.T
+        # Lower is closer: l2 drops the constant ||q||^2, cosine and ip rank by 1 - dot
+        distances = squared_norms[None, :] - 2 * scores if space == "l2" else -scores
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, candidates, axis=1).argsort(axis=1)
+        result[start:start + len(block)] = np.take_along_axis(candidates, order, axis=1)
+    return result
+
+
+def recall_at_k(approximate: Sequence[Sequence[int]], exact: np.ndarray) -> float:
+    hits = sum(len(set(found) & set(truth)) for found, truth in zip(approximate, exact.tolist()))
+    total = sum(len(truth) for truth in exact.tolist())
+    return hits / total if total else 0.0
+
+
+def _hnsw_metadata(space: str, m: int, construction_ef: int, search_ef: int, batch_size: Optional[int], sync_threshold: Optional[int]) -> Dict:
+    metadata = {"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+    if batch_size:
+        metadata["hnsw:batch_size"] = batch_size
+    if sync_threshold:
+        metadata["hnsw:sync_threshold"] = sync_threshold
+    return metadata
+
+
+def sweep_hnsw(manager, collection_name: str, k: int = 10, num_queries: int = 200, m_values: Sequence[int] = (16, 32), construction_ef_values: Sequence[int] = (100, 200), search_ef_values: Sequence[int] = (10, 20, 50, 100, 200), batch_size: Optional[int] = None, sync_threshold: Optional[int] = None, seed: int = 0) -> Dict:
+    """Measure recall@k and query latency of HNSW settings on a copy of a collection.
+
+    num_queries stored vectors are held out as queries, the rest is indexed into
+    a temporary collection once per (M, construction_ef, search_ef) and searched
+    with every held-out vector. Recall is measured against exact brute-force search over the
+    same vectors, latency is per single-query call.
+    """
+    source = manager.get_collection(collection_name)
+    space = collection_space(source)
+    ids, vectors = load_embeddings(source)
+    if len(ids) < 2:
+        raise ValueError(f"Collection '{collection_name}' needs at least 2 embeddings for a sweep, found {len(ids)}")
+
+    rng = np.random.default_rng(seed)
+    num_queries = max(1, min(num_queries, len(ids) // 5 or 1))
+    query_rows = rng.choice(len(ids), size=num_queries, replace=False)
+    index_mask = np.ones(len(ids), dtype=bool)
+    index_mask[query_rows] = False
+    index_ids = [chroma_id for chroma_id, keep in zip(ids, index_mask) if keep]
+    index_vectors = vectors[index_mask]
+    queries = vectors[query_rows]
+    k = min(k, len(index_ids))
+
+    started = time.monotonic()
+    exact = exact_top_k(index_vectors, queries, k, space)
+    exact_seconds = time.monotonic() - started
+    row_of = {chroma_id: row for row, chroma_id in enumerate(index_ids)}
+
+    report = {
+        "collection": collection_name,
+        "vectors": len(index_ids),
+        "dimension": int(vectors.shape[1]),
+        "space": space,
+        "k": k,
+        "queries": num_queries,
+        "current_configuration": dict(collection_configuration(source).get("hnsw") or {}),
+        "exact_search_seconds_per_query": exact_seconds / num_queries,
+        "results": [],
+    }
+
+    sweep_name = f"{collection_name}{SWEEP_SUFFIX}"
+    client = manager.client
+    max_batch = client.get_max_batch_size()
+    try:
+        for m in m_values:
+            for construction_ef in construction_ef_values:
+                for search_ef in search_ef_values:
+                    # ef_search changed with modify() does not reach an index that is already loaded,
+                    # so every setting gets its own build
+                    if sweep_name in [collection.name for collection in client.list_collections()]:
+                        client.delete_collection(sweep_name)
+                    collection = client.create_collection(
+                        name=sweep_name,
+                        metadata=_hnsw_metadata(space, m, construction_ef, search_ef, batch_size, sync_threshold)
+                    )
+
+                    started = time.monotonic()
+                    for offset in range(0, len(index_ids), max_batch):
+                        collection.add(ids=index_ids[offset:offset + max_batch], embeddings=index_vectors[offset:offset + max_batch])
+                    build_seconds = time.monotonic() - started
+                    collection.query(query_embeddings=queries[:1], n_results=k, include=[])
+
+                    latencies = []
+                    found = []
+                    for query in queries:
+                        started = time.monotonic()
+                        result = collection.query(query_embeddings=query[None, :], n_results=k, include=[])
+                        latencies.append(time.monotonic() - started)
+                        found.append([row_of[chroma_id] for chroma_id in result["ids"][0]])
+
+                    latencies_ms = np.asarray(latencies) * 1000
+                    entry = {
+                        "M": m,
+                        "construction_ef": construction_ef,
+                        "search_ef": search_ef,
+                        "recall_at_k": recall_at_k(found, exact),
+                        "p50_ms": float(np.percentile(latencies_ms, 50)),
+                        "p99_ms": float(np.percentile(latencies_ms, 99)),
+                        "mean_ms": float(latencies_ms.mean()),
+                        "build_seconds": build_seconds,
+                    }
+                    report["results"].append(entry)
+                    logger.info(f"HNSW M={m} construction_ef={construction_ef} search_ef={search_ef}: "
+                                f"recall@{k}={entry['recall_at_k']:.3f} p50={entry['p50_ms']:.2f}ms p99={entry['p99_ms']:.2f}ms")
+    finally:
+        if sweep_name in [collection.name for collection in client.list_collections()]:
+            client.delete_collection(sweep_name)
+
+    report["recommendations"] = {
+        f"recall>={target}": _fastest_above(report["results"], target) for target in (0.9, 0.95, 0.99)
+    }
+    return report
+
+
+def _fastest_above(results: List[Dict], target: float) -> Optional[Dict]:
+    candidates = [entry for entry in results if entry["recall_at_k"] >= target]
+    return min(candidates, key=lambda entry: entry["p99_ms"]) if candidates else None
+
+
+def write_report(report: Dict, path: str):
+    """Write the sweep as JSON and a Markdown table next to it"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    lines = [
+        f"# HNSW sweep for '{report['collection']}'",
+        "",
+        f"{report['vectors']} vectors, {report['dimension']} dimensions, space {report['space']}, "
+        f"{report['queries']} held-out queries, k={report['k']}",
+        "",
+        f"Current configuration: {report['current_configuration']}",
+        "",
+        "| M | construction_ef | search_ef | recall@k | p50 ms | p99 ms | build s |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for entry in report["results"]:
+        lines.append(f"| {entry['M']} | {entry['construction_ef']} | {entry['search_ef']} | {entry['recall_at_k']:.3f} | "
+                     f"{entry['p50_ms']:.2f} | {entry['p99_ms']:.2f} | {entry['build_seconds']:.1f} |")
+    lines.append("")
+    for target, entry in report["recommendations"].items():
+        choice = f"M={entry['M']}, construction_ef={entry['construction_ef']}, search_ef={entry['search_ef']}" if entry else "none reached"
+        lines.append(f"- Fastest with {target}: {choice}")
+    path.with_suffix(".md").write_text("\n".join(lines) + "\n", encoding="utf-8")
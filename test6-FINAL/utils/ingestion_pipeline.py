@@ -0,0 +1,232 @@
+import time
+import queue
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+from utils.pdf_cache import PdfTextCache
+from utils.pdf_extraction import iter_pdf_texts
+from utils.text_cleaning import add_cleaning_report, clean_paper_text, new_cleaning_summary, PAGE_SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class IngestionPipeline:
+    """Streaming extract -> chunk -> embed -> upsert pipeline.
+
+    Every stage runs on its own thread and hands papers to the next stage
+    through a bounded queue, so only a handful of papers are held in memory at
+    any time and each paper is searchable as soon as its upsert finished.
+
+    Papers are dicts with 'base_id', 'metadata', an optional 'pdf_path' and a
+    'fallback_text' that is indexed when the PDF is missing or unreadable.
+    Extracted PDF text is cleaned of running headers, page numbers, arXiv stamps,
+    license footers and the references section first, the summary counts the
+    removals over all papers and keeps samples of a few of them. With deduplicate=True chunks that are
+    near-identical to an already stored chunk are dropped and linked to it.
+    Writes are idempotent: papers whose text hash is already stored are skipped
+    before embedding, changed papers have all their previous chunks deleted
+    before the new ones are written.
+
+    on_paper is called as on_paper(base_id, status, chunks) once per paper with
+    status 'upserted', 'unchanged' or 'failed'. It runs on the stage threads.
+    """
+
+    MIN_TEXT_LENGTH = 100
+
+    def __init__(self, manager, collection_name="scientific_publications", extraction_workers=None, text_cache: Optional[PdfTextCache] = None, chunk_size=1000, chunk_overlap=200, queue_size=4, extraction_timeout=None, extraction_max_memory_mb=None, chunking_strategy="recursive", clean_text=True, deduplicate=False, on_paper: Optional[Callable[[str, str, int], None]] = None):
+        self.manager = manager
+        self.collection_name = collection_name
+        self.extraction_workers = extraction_workers
+        self.extraction_timeout = extraction_timeout
+        self.extraction_max_memory_mb = extraction_max_memory_mb
+        self.text_cache = text_cache
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunking_strategy = chunking_strategy
+        self.clean_text = clean_text
+        self.deduplicate = deduplicate
+        self.queue_size = queue_size
+        self.on_paper = on_paper
+
+    def run(self, papers: Iterable[Dict]) -> Dict:
+        papers = list(papers)
+        summary = {
+            "papers": len(papers),
+            "upserted_papers": 0,
+            "unchanged_papers": 0,
+            "chunks": 0,
+            "duplicate_chunks": 0,
+            "fallbacks": 0,
+            "extraction_errors": {},
+            "sandbox_events": [],
+            "cleaning": new_cleaning_summary(),
+            "errors": {},
+            "seconds_to_first_upsert": None,
+            "seconds": 0.0,
+        }
+        if not papers:
+            return summary
+
+        start = time.monotonic()
+        extracted = queue.Queue(maxsize=self.queue_size)
+        chunked = queue.Queue(maxsize=self.queue_size)
+        embedded = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        stages = [
+            threading.Thread(target=self._guard, args=(self._extract_stage, papers, extracted, summary, stop), name="ingest-extract", daemon=True),
+            threading.Thread(target=self._guard, args=(self._chunk_stage, extracted, chunked, summary, stop), name="ingest-chunk", daemon=True),
+            threading.Thread(target=self._guard, args=(self._embed_stage, chunked, embedded, summary, stop), name="ingest-embed", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            self._upsert_stage(embedded, summary, start, stop)
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+
+        summary["seconds"] = time.monotonic() - start
+        logger.info(f"Ingested {summary['upserted_papers']}/{summary['papers']} papers as {summary['chunks']} chunks "
+                    f"in {summary['seconds']:.1f}s ({summary['unchanged_papers']} unchanged, {summary['duplicate_chunks']} duplicate chunks, {len(summary['errors'])} errors, "
+                    f"{summary['fallbacks']} abstract fallbacks, {len(summary['sandbox_events'])} killed extractions)")
+        return summary
+
+    @staticmethod
+    def _put(target: queue.Queue, item, stop: threading.Event) -> bool:
+        # Blocks while the next stage is busy, but gives up once the pipeline is stopped
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _get(source: queue.Queue, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _guard(self, stage, source, target, summary, stop):
+        try:
+            stage(source, target, summary, stop)
+        except Exception as e:
+            logger.error(f"Ingestion stage {threading.current_thread().name} failed: {e}")
+            summary["errors"][threading.current_thread().name] = f"{type(e).__name__}: {e}"
+        finally:
+            self._put(target, _DONE, stop)
+
+    def _report(self, summary, base_id, status, chunks=0, error=None):
+        if error is not None:
+            summary["errors"][base_id] = error
+        if self.on_paper is not None:
+            try:
+                self.on_paper(base_id, status, chunks)
+            except Exception as e:
+                logger.warning(f"Progress callback failed for {base_id}: {e}")
+
+    def _extract_stage(self, papers: List[Dict], target, summary, stop):
+        with_pdf = [idx for idx, paper in enumerate(papers) if paper.get("pdf_path")]
+        pdf_paths = (papers[idx]["pdf_path"] for idx in with_pdf)
+
+        for idx in range(len(papers)):
+            if not papers[idx].get("pdf_path"):
+                if not self._put(target, (papers[idx], None), stop):
+                    return
+
+        extracted = iter_pdf_texts(
+            pdf_paths,
+            max_workers=self.extraction_workers,
+            cache=self.text_cache,
+            timeout=self.extraction_timeout,
+            max_memory_mb=self.extraction_max_memory_mb,
+            events=summary["sandbox_events"]
+        )
+        try:
+            for pos, text, error in extracted:
+                paper = papers[with_pdf[pos]]
+                if error:
+                    summary["extraction_errors"][paper["base_id"]] = error
+                if not self._put(target, (paper, text), stop):
+                    return
+        finally:
+            extracted.close()
+
+    def _chunk_stage(self, source, target, summary, stop):
+        while (item := self._get(source, stop)) is not _DONE:
+            paper, text = item
+            if text and self.clean_text:
+                text, report = clean_paper_text(text)
+                add_cleaning_report(summary["cleaning"], paper["base_id"], report)
+            elif text:
+                text = text.replace(PAGE_SEPARATOR, "\n\n")
+
+            if not text or len(text.strip()) < self.MIN_TEXT_LENGTH:
+                summary["fallbacks"] += 1
+                text = paper["fallback_text"]
+
+            try:
+                content_hash = self.manager.compute_content_hash(text, self.chunk_size, self.chunk_overlap, self.chunking_strategy)
+                stored = self.manager.get_stored_chunks(self.collection_name, [paper["base_id"]]).get(paper["base_id"])
+                if self.manager.is_unchanged(stored, content_hash):
+                    summary["unchanged_papers"] += 1
+                    self._report(summary, paper["base_id"], "unchanged")
+                    continue
+
+                chunks, metadatas, ids = self.manager.build_chunks(text, paper["metadata"], paper["base_id"], self.chunk_size, self.chunk_overlap, content_hash, self.chunking_strategy)
+                duplicates = []
+                if self.deduplicate:
+                    total = len(chunks)
+                    chunks, metadatas, ids, duplicates = self.manager.drop_near_duplicates(self.collection_name, paper["base_id"], chunks, metadatas)
+                    summary["duplicate_chunks"] += total - len(chunks)
+            except Exception as e:
+                self._report(summary, paper["base_id"], "failed", error=f"{type(e).__name__}: {e}")
+                continue
+
+            replaced_ids = sorted(stored["ids"]) if stored else []
+            if not self._put(target, (paper, chunks, metadatas, ids, replaced_ids, duplicates), stop):
+                return
+
+    def _embed_stage(self, source, target, summary, stop):
+        while (item := self._get(source, stop)) is not _DONE:
+            paper, chunks, metadatas, ids, replaced_ids, duplicates = item
+            try:
+                # The manager's embedding executor picks the batch size and keeps several requests in flight
+                embeddings = self.manager.embed_texts(chunks)
+            except Exception as e:
+                self.manager.release_near_duplicates(self.collection_name, ids)
+                self._report(summary, paper["base_id"], "failed", error=f"{type(e).__name__}: {e}")
+                continue
+            if not self._put(target, (paper, chunks, metadatas, ids, replaced_ids, duplicates, embeddings), stop):
+                return
+
+    def _upsert_stage(self, source, summary, start, stop):
+        while (item := self._get(source, stop)) is not _DONE:
+            paper, chunks, metadatas, ids, replaced_ids, duplicates, embeddings = item
+            try:
+                # Earlier papers have finished their upsert, so a duplicate whose target failed to write is kept
+                chunks, metadatas, ids, duplicate_refs, restored = self.manager.resolve_near_duplicates(self.collection_name, paper["base_id"], chunks, metadatas, ids, duplicates)
+                if restored:
+                    summary["duplicate_chunks"] -= restored
+                    embeddings = list(embeddings) + list(self.manager.embed_texts(chunks[-restored:]))
+                self.manager.replace_documents(self.collection_name, chunks, metadatas, ids, replaced_ids, embeddings=embeddings)
+                self.manager.link_duplicate_sources(self.collection_name, duplicate_refs)
+            except Exception as e:
+                self.manager.release_near_duplicates(self.collection_name, ids)
+                self._report(summary, paper["base_id"], "failed", error=f"{type(e).__name__}: {e}")
+                continue
+
+            summary["upserted_papers"] += 1
+            summary["chunks"] += len(chunks)
+            if summary["seconds_to_first_upsert"] is None:
+                summary["seconds_to_first_upsert"] = time.monotonic() - start
+            self._report(summary, paper["base_id"], "upserted", len(chunks))
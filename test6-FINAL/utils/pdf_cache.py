@@ -0,0 +1,98 @@
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PdfTextCache:
+    """On-disk cache for extracted PDF text.
+
+    Entries are keyed by the SHA-256 of the PDF bytes and the extractor version,
+    so renamed or re-downloaded files still hit and an extractor change misses.
+    When the cache grows above max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str, extractor_version: str, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.extractor_version = extractor_version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._total_bytes = sum(path.stat().st_size for path in self._entries())
+
+    def _entries(self):
+        return self.cache_dir.glob("*/*.txt")
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.txt"
+
+    def key_for(self, pdf_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return hashlib.sha256(f"{self.extractor_version}:{digest.hexdigest()}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry_path = self._entry_path(key)
+        try:
+            text = entry_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # mtime doubles as the last access time for LRU eviction
+        os.utime(entry_path, None)
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+
+        previous_size = entry_path.stat().st_size if entry_path.exists() else 0
+        tmp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, entry_path)
+
+        self._total_bytes += entry_path.stat().st_size - previous_size
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+            self.evictions += 1
+
+        logger.info(f"PDF text cache evicted down to {self._total_bytes} bytes ({self.evictions} evictions so far)")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from langchain_community.document_loaders import PyPDFium2Loader
+from utils.pdf_cache import PdfTextCache
+from utils.text_cleaning import PAGE_SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever extract_pdf_text changes its output so cached texts are not reused
+EXTRACTOR_VERSION = "pypdfium2-loader-2"
+
+POLL_INTERVAL = 0.2
+
+# Workers are started while the pipeline's other threads and Chroma's client threads run,
+# a forked child could inherit one of their locks in its held state and deadlock
+START_METHOD = "spawn"
+
+
+def extract_pdf_text(pdf_path: str) -> str:
+    """Load a PDF with PyPDFium2Loader and join its pages with PAGE_SEPARATOR"""
+    loader = PyPDFium2Loader(str(pdf_path))
+    pages = loader.load()
+    return PAGE_SEPARATOR.join([page.page_content for page in pages])
+
+
+def _extract_safely(pdf_path: str, extractor: Callable[[str], str] = extract_pdf_text) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        return extractor(pdf_path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _worker_main(conn, max_memory_mb: Optional[int], extractor: Callable[[str], str] = extract_pdf_text):
+    if max_memory_mb and not os.path.exists("/proc/self/statm"):
+        # Without /proc the parent cannot watch the RSS, cap the address space instead
+        import resource
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    while True:
+        try:
+            pdf_path = conn.recv()
+        except EOFError:
+            break
+        if pdf_path is None:
+            break
+        conn.send(_extract_safely(pdf_path, extractor))
+
+
+class _SandboxWorker:
+    """One extraction subprocess that handles a single PDF at a time"""
+
+    def __init__(self, context, max_memory_mb: Optional[int], extractor: Callable[[str], str] = extract_pdf_text):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, max_memory_mb, extractor), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started_at = None
+
+    def submit(self, idx: int, pdf_path: str):
+        self.conn.send(pdf_path)
+        self.task = (idx, pdf_path)
+        self.started_at = time.monotonic()
+
+    def rss_bytes(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+def iter_pdf_texts(pdf_paths: Iterable[str], max_workers: Optional[int] = None, cache: Optional[PdfTextCache] = None, max_in_flight: Optional[int] = None, timeout: Optional[float] = None, max_memory_mb: Optional[int] = None, events: Optional[List[Dict]] = None, extractor: Callable[[str], str] = extract_pdf_text) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+    """Extract PDFs in sandboxed worker subprocesses and yield (index, text, error) as soon as each one is done.
+
+    pdf_paths may be a lazy iterable. At most max_in_flight extractions are
+    queued at once (default: twice the worker count), so finished but not yet
+    consumed texts stay bounded. Cached PDFs are yielded without being parsed,
+    workers are only started once a PDF has to be extracted.
+
+    A worker that runs longer than timeout seconds on one PDF, grows above
+    max_memory_mb of RSS or dies is killed and replaced, the PDF is reported as
+    failed and an event is appended to the optional events list.
+
+    extractor runs inside the workers, it has to be a module-level function so
+    the spawned processes can import it.
+    """
+    workers = max(1, max_workers or os.cpu_count() or 1)
+    max_in_flight = max(workers, max_in_flight or workers * 2)
+    memory_limit = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+    context = multiprocessing.get_context(START_METHOD)
+    cache_keys = {}
+    counts = {"cached": 0, "extracted": 0, "failed": 0, "killed": 0}
+
+    def finish(idx, path, text, error):
+        if error:
+            counts["failed"] += 1
+            logger.warning(f"Failed to extract {path}: {error}")
+            cache_keys.pop(idx, None)
+            return idx, None, error
+        counts["extracted"] += 1
+        if cache is not None:
+            cache.put(cache_keys.pop(idx), text)
+        return idx, text, None
+
+    def recycle(slot, event, detail):
+        worker = pool[slot]
+        idx, path = worker.task
+        worker.kill()
+        # The replacement is started with the next PDF for this slot
+        pool[slot] = None
+        counts["killed"] += 1
+        logger.warning(f"Extraction worker for {path} was killed ({event}: {detail})")
+        if events is not None:
+            events.append({"path": path, "event": event, "detail": detail})
+        return finish(idx, path, None, f"{event}: {detail}")
+
+    pool: List[Optional[_SandboxWorker]] = [None] * workers
+    backlog = deque()
+    remaining = enumerate(pdf_paths)
+    exhausted = False
+    try:
+        while True:
+            busy = sum(1 for worker in pool if worker and worker.task)
+            while not exhausted and len(backlog) + busy < max_in_flight:
+                try:
+                    idx, path = next(remaining)
+                except StopIteration:
+                    exhausted = True
+                    break
+                path = str(path)
+                if cache is not None:
+                    try:
+                        cache_keys[idx] = cache.key_for(path)
+                    except OSError as e:
+                        counts["failed"] += 1
+                        yield idx, None, f"{type(e).__name__}: {e}"
+                        continue
+                    text = cache.get(cache_keys[idx])
+                    if text is not None:
+                        counts["cached"] += 1
+                        yield idx, text, None
+                        continue
+                backlog.append((idx, path))
+
+            for slot, worker in enumerate(pool):
+                if backlog and not (worker and worker.task):
+                    if worker is None:
+                        worker = pool[slot] = _SandboxWorker(context, max_memory_mb, extractor)
+                    worker.submit(*backlog.popleft())
+
+            busy_slots = [slot for slot, worker in enumerate(pool) if worker and worker.task]
+            if not busy_slots:
+                if exhausted and not backlog:
+                    break
+                continue
+
+            ready = wait([pool[slot].conn for slot in busy_slots], timeout=POLL_INTERVAL)
+            for slot in busy_slots:
+                worker = pool[slot]
+                if worker.conn in ready:
+                    try:
+                        text, error = worker.conn.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(timeout=1)
+                        yield recycle(slot, "crashed", f"worker exited with code {worker.process.exitcode}")
+                        continue
+                    idx, path = worker.task
+                    worker.task = None
+                    yield finish(idx, path, text, error)
+                    continue
+
+                elapsed = time.monotonic() - worker.started_at
+                rss = worker.rss_bytes() if memory_limit else None
+                if timeout and elapsed > timeout:
+                    yield recycle(slot, "timeout", f"exceeded {timeout:.0f}s")
+                elif rss and rss > memory_limit:
+                    yield recycle(slot, "memory_limit", f"RSS {rss // (1024 * 1024)} MB exceeded {max_memory_mb} MB")
+                elif not worker.process.is_alive():
+                    yield recycle(slot, "crashed", f"worker exited with code {worker.process.exitcode}")
+    finally:
+        for worker in pool:
+            if worker is None:
+                continue
+            if worker.task:
+                worker.kill()
+            else:
+                worker.stop()
+
+    logger.info(f"Extracted {counts['extracted']} PDFs with {workers} worker(s) "
+                f"({counts['cached']} cached, {counts['failed']} failed, {counts['killed']} workers killed)")
+
+
+def extract_pdf_texts(pdf_paths: List[str], max_workers: Optional[int] = None, cache: Optional[PdfTextCache] = None, timeout: Optional[float] = None, max_memory_mb: Optional[int] = None, events: Optional[List[Dict]] = None) -> Tuple[List[Optional[str]], Dict[str, str]]:
+    """Extract the text of several PDFs in sandboxed worker subprocesses.
+
+    Returns (texts, errors). texts[i] belongs to pdf_paths[i] and is None if the
+    extraction failed, errors maps every failed path to its error message.
+    PDFs found in the optional cache are not parsed again.
+    """
+    texts: List[Optional[str]] = [None] * len(pdf_paths)
+    errors: Dict[str, str] = {}
+
+    if not pdf_paths:
+        return texts, errors
+
+    workers = min(max_workers or os.cpu_count() or 1, len(pdf_paths))
+    for idx, text, error in iter_pdf_texts(pdf_paths, max_workers=workers, cache=cache, max_in_flight=len(pdf_paths), timeout=timeout, max_memory_mb=max_memory_mb, events=events):
+        if error:
+            errors[str(pdf_paths[idx])] = error
+        else:
+            texts[idx] = text
+
+    return texts, errors
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from utils.snapshot import TextColumn, TextColumnWriter
+
+logger = logging.getLogger(__name__)
+
+DTYPES = ("int8", "float16", "float32")
+# Projected vectors are already small, float32 saves the per-query conversion that makes float16 scans slow
+REDUCED_DTYPE = "float32"
+# Metadata fields kept as columns so where filters run before the first pass
+FILTER_FIELDS = ("year", "source", "section")
+META_FILE = "meta.json"
+_BLOCK_ROWS = 65536
+
+
+class UnsupportedFilterError(ValueError):
+    """Raised for where filters that cannot be answered from the stored columns"""
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    if dtype in ("float16", "float32"):
+        return vectors.astype(dtype), None
+    # Symmetric int8 with one scale per vector, x ~= scale * code
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _distances(vectors: np.ndarray, norms: np.ndarray, queries: np.ndarray, space: str) -> np.ndarray:
+    """(rows, queries) distances in Chroma's definition, vectors are pre-normalized for cosine"""
+    scores = vectors @ queries.T
+    if space == "l2":
+        return norms[:, None] ** 2 - 2 * scores + np.einsum("ij,ij->i", queries, queries)[None, :]
+    return 1.0 - scores
+
+
+class Projection:
+    """Linear map to fewer dimensions used for the first pass of a search.
+
+    "pca" keeps the top principal components of a sample of the stored vectors,
+    "prefix" keeps the first dimensions, which suits Matryoshka-trained models.
+    A stored vector x becomes z = C (x - mean). For l2 the query is projected the
+    same way. For cosine and ip it is projected without centering, which only
+    drops the per-query constant q . mean and keeps the ranking.
+    """
+
+    KINDS = ("pca", "prefix")
+
+    def __init__(self, kind: str, mean: np.ndarray, components: np.ndarray, explained_variance: float = 1.0, fitted_on: int = 0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown projection '{kind}', use one of {self.KINDS}")
+        self.kind = kind
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.explained_variance = explained_variance
+        self.fitted_on = fitted_on
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def spec(self) -> str:
+        return f"{self.kind}{self.dimension}"
+
+    @staticmethod
+    def parse_spec(spec: str):
+        """'pca64' -> ('pca', 64)"""
+        for kind in Projection.KINDS:
+            if spec.startswith(kind) and spec[len(kind):].isdigit():
+                return kind, int(spec[len(kind):])
+        raise ValueError(f"Invalid projection '{spec}', expected e.g. 'pca64' or 'prefix128'")
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, kind: str, dimension: int) -> "Projection":
+        """Fit on a sample of (for cosine: normalized) stored vectors"""
+        full_dimension = vectors.shape[1]
+        dimension = min(dimension, full_dimension)
+        if kind == "prefix":
+            components = np.eye(dimension, full_dimension, dtype=np.float32)
+            variance = vectors.var(axis=0)
+            explained = float(variance[:dimension].sum() / variance.sum()) if variance.sum() else 1.0
+            return cls(kind, np.zeros(full_dimension, dtype=np.float32), components, explained, len(vectors))
+
+        mean = vectors.mean(axis=0)
+        centered = vectors - mean
+        covariance = centered.T @ centered / max(len(vectors) - 1, 1)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:dimension]
+        explained = float(eigenvalues[order].sum() / eigenvalues.sum()) if eigenvalues.sum() > 0 else 1.0
+        return cls(kind, mean, eigenvectors[:, order].T, explained, len(vectors))
+
+    def project_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors - self.mean) @ self.components.T
+
+    def project_queries(self, queries: np.ndarray, space: str) -> np.ndarray:
+        return self.project_vectors(queries) if space == "l2" else queries @ self.components.T
+
+    def save(self, path: str):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, kind=self.kind, mean=self.mean, components=self.components,
+                 explained_variance=self.explained_variance, fitted_on=self.fitted_on)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Projection"]:
+        try:
+            with np.load(path) as data:
+                return cls(str(data["kind"]), data["mean"], data["components"], float(data["explained_variance"]), int(data["fitted_on"]))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load projection from {path}: {e}")
+            return None
+
+
+def sample_embeddings(collection, sample_size: int = 20000, batch_size: int = 1000, seed: int = 0) -> np.ndarray:
+    """Up to sample_size embeddings read from random windows of the collection"""
+    count = collection.count()
+    if count <= sample_size:
+        offsets = range(0, count, batch_size)
+    else:
+        windows = np.arange(0, count, batch_size)
+        offsets = sorted(np.random.default_rng(seed).choice(windows, size=min(len(windows), -(-sample_size // batch_size)), replace=False).tolist())
+    vectors = [np.asarray(collection.get(include=["embeddings"], limit=batch_size, offset=int(offset))["embeddings"], dtype=np.float32) for offset in offsets]
+    vectors = [batch for batch in vectors if len(batch)]
+    return np.vstack(vectors)[:sample_size] if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+class QuantizedVectorStore:
+    """Compact float16 or int8 copy of a collection's embeddings for low-memory hosts.
+
+    A search scores the compact vectors of every row that passes the where
+    filter, takes the rescore_factor * n_results best candidates and ranks
+    those by their full-precision embeddings fetched from Chroma. Only the
+    compact copy stays in memory (memory-mapped when loaded from disk), at a
+    quarter (int8) or half (float16) of the float32 size. With a Projection
+    the copy holds the projected low-dimensional vectors instead, which also
+    makes the first pass cheaper.
+    """
+
+    def __init__(self, ids: Sequence[str], codes: np.ndarray, scales: Optional[np.ndarray], norms: np.ndarray, columns: Dict[str, np.ndarray], vocabularies: Dict[str, List[str]], dtype: str, space: str, model: str, projection: Optional[Projection] = None):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+        self.norms = norms
+        self.columns = columns
+        self.vocabularies = vocabularies
+        self.dtype = dtype
+        self.space = space
+        self.model = model
+        self.projection = projection
+        self._codes_of = {field: {value: code for code, value in enumerate(vocabulary)} for field, vocabulary in vocabularies.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.codes, self.norms, *self.columns.values()] + ([self.scales] if self.scales is not None else [])
+        if self.projection is not None:
+            arrays += [self.projection.mean, self.projection.components]
+        return int(sum(array.nbytes for array in arrays))
+
+    @classmethod
+    def build(cls, collection, dtype: str = "int8", model: str = "", batch_size: int = 1000, projection: Optional[Projection] = None) -> "QuantizedVectorStore":
+        """Quantize a collection batch by batch, the float32 vectors are never held all at once"""
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype '{dtype}', use one of {DTYPES}")
+        from utils.hnsw_sweep import collection_space
+        space = collection_space(collection)
+
+        ids: List[str] = []
+        codes, scales, norms = [], [], []
+        raw_columns: Dict[str, list] = {field: [] for field in FILTER_FIELDS}
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            if space == "cosine":
+                vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)[:, None]
+            if projection is not None:
+                vectors = projection.project_vectors(vectors)
+            batch_norms = np.linalg.norm(vectors, axis=1)
+            batch_codes, batch_scales = _quantize(vectors, dtype)
+            codes.append(batch_codes)
+            norms.append(batch_norms.astype(np.float32))
+            if batch_scales is not None:
+                scales.append(batch_scales)
+            for metadata in batch["metadatas"]:
+                for field in FILTER_FIELDS:
+                    raw_columns[field].append((metadata or {}).get(field))
+            ids.extend(batch["ids"])
+            offset += len(batch["ids"])
+
+        columns, vocabularies = {}, {}
+        for field, values in raw_columns.items():
+            present = [value for value in values if value is not None]
+            if present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+                columns[field] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            else:
+                vocabulary = sorted({str(value) for value in present})
+                lookup = {value: code for code, value in enumerate(vocabulary)}
+                columns[field] = np.array([-1 if value is None else lookup[str(value)] for value in values], dtype=np.int32)
+                vocabularies[field] = vocabulary
+
+        dimension = codes[0].shape[1] if codes else 0
+        store = cls(
+            ids=ids,
+            codes=np.vstack(codes) if codes else np.zeros((0, dimension), dtype=dtype),
+            scales=(np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32)) if dtype == "int8" else None,
+            norms=np.concatenate(norms) if norms else np.zeros(0, dtype=np.float32),
+            columns=columns,
+            vocabularies=vocabularies,
+            dtype=dtype,
+            space=space,
+            model=model,
+            projection=projection
+        )
+        reduced = f" {projection.spec}" if projection is not None else ""
+        logger.info(f"Quantized {len(store)} embeddings of '{collection.name}' to{reduced} {dtype} ({store.nbytes / 2**20:.1f} MiB)")
+        return store
+
+    def save(self, directory: str):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        arrays = {"codes": self.codes, "norms": self.norms, **{f"column_{field}": column for field, column in self.columns.items()}}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        for name, array in arrays.items():
+            tmp_path = directory / f"{name}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, directory / f"{name}.npy")
+
+        if self.projection is not None:
+            self.projection.save(directory / "projection.npz")
+
+        # Written under a temporary name and moved into place like the arrays, readers may still map the old files
+        tmp_name = f"ids.{os.getpid()}.tmp"
+        ids = TextColumnWriter(directory, tmp_name)
+        try:
+            for chroma_id in self.ids:
+                ids.append(chroma_id)
+        finally:
+            ids.close()
+        os.replace(directory / f"{tmp_name}.bin", directory / "ids.bin")
+        os.replace(directory / f"{tmp_name}.offsets.npy", directory / "ids.offsets.npy")
+
+        # meta.json is written last, a store without it is incomplete
+        meta = {
+            "projection": self.projection.spec if self.projection is not None else None,
+            "vocabularies": self.vocabularies,
+            "columns": list(self.columns),
+            "dtype": self.dtype,
+            "space": self.space,
+            "model": self.model,
+            "count": len(self.ids),
+            "built_at": time.time(),
+        }
+        tmp_path = directory / f"{META_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, directory / META_FILE)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> Optional["QuantizedVectorStore"]:
+        """Load a saved store, memory-mapped by default. Returns None if there is none."""
+        directory = Path(directory)
+        try:
+            with open(directory / META_FILE, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            mmap_mode = "r" if mmap else None
+            store = cls(
+                ids=TextColumn(directory, "ids"),
+                codes=np.load(directory / "codes.npy", mmap_mode=mmap_mode),
+                scales=np.load(directory / "scales.npy", mmap_mode=mmap_mode) if meta["dtype"] == "int8" else None,
+                norms=np.load(directory / "norms.npy", mmap_mode=mmap_mode),
+                columns={field: np.load(directory / f"column_{field}.npy") for field in meta["columns"]},
+                vocabularies=meta["vocabularies"],
+                dtype=meta["dtype"],
+                space=meta["space"],
+                model=meta["model"],
+                projection=Projection.load(directory / "projection.npz") if meta.get("projection") else None
+            )
+            if len(store.ids) != meta["count"]:
+                raise ValueError(f"{len(store.ids)} ids for {meta['count']} rows")
+            return store
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load quantized store from {directory}: {e}")
+            return None
+
+    def _condition_mask(self, field: str, condition) -> np.ndarray:
+        if field not in self.columns:
+            raise UnsupportedFilterError(f"Field '{field}' is not stored in the quantized store")
+        column = self.columns[field]
+        operator, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+
+        if field in self.vocabularies:
+            lookup = self._codes_of[field]
+            if operator in ("$eq", "$ne"):
+                matches = column == lookup.get(str(value), -2)
+                return matches if operator == "$eq" else ~matches & (column >= 0)
+            if operator in ("$in", "$nin"):
+                matches = np.isin(column, [lookup.get(str(item), -2) for item in value])
+                return matches if operator == "$in" else ~matches & (column >= 0)
+            raise UnsupportedFilterError(f"Operator '{operator}' is not supported on text field '{field}'")
+
+        comparisons = {
+            "$eq": np.equal, "$ne": np.not_equal,
+            "$gt": np.greater, "$gte": np.greater_equal,
+            "$lt": np.less, "$lte": np.less_equal,
+        }
+        with np.errstate(invalid="ignore"):
+            if operator in comparisons:
+                return comparisons[operator](column, value) & ~np.isnan(column)
+            if operator in ("$in", "$nin"):
+                matches = np.isin(column, list(value))
+                return matches if operator == "$in" else ~matches & ~np.isnan(column)
+        raise UnsupportedFilterError(f"Operator '{operator}' is not supported on field '{field}'")
+
+    def where_mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Boolean row mask of a Chroma where filter, None when there is no filter"""
+        if not where:
+            return None
+        masks = []
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self.where_mask(part) for part in condition]
+                parts = [part if part is not None else np.ones(len(self), dtype=bool) for part in parts]
+                combine = np.logical_and if key == "$and" else np.logical_or
+                masks.append(combine.reduce(parts) if parts else np.ones(len(self), dtype=bool))
+            else:
+                masks.append(self._condition_mask(key, condition))
+        return np.logical_and.reduce(masks)
+
+    def approximate_distances(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(rows, queries) distances computed from the compact vectors"""
+        if self.space == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if self.projection is not None:
+            queries = self.projection.project_queries(queries, self.space)
+        rows = np.arange(len(self)) if rows is None else rows
+        result = np.empty((len(rows), len(queries)), dtype=np.float32)
+        for start in range(0, len(rows), _BLOCK_ROWS):
+            block_rows = rows[start:start + _BLOCK_ROWS]
+            vectors = np.asarray(self.codes[block_rows], dtype=np.float32)
+            if self.scales is not None:
+                vectors *= np.asarray(self.scales[block_rows])[:, None]
+            result[start:start + len(block_rows)] = _distances(vectors, np.asarray(self.norms[block_rows]), queries, self.space)
+        return result
+
+    def search(self, collection, query_vectors: Sequence[Sequence[float]], n_results: int = 10, where: Optional[dict] = None, rescore_factor: int = 4) -> List[dict]:
+        """Approximate first pass over the compact vectors, then exact re-scoring of the
+        best candidates with the full-precision embeddings stored in collection.
+        Returns one Chroma-style result dict ({'ids': [[...]], ...}) per query."""
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        mask = self.where_mask(where)
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        if len(rows) == 0 or len(queries) == 0:
+            return [{"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]} for _ in range(len(queries))]
+
+        approximate = self.approximate_distances(queries, rows)
+        num_candidates = min(len(rows), max(n_results * rescore_factor, n_results))
+        candidates = np.argpartition(approximate, num_candidates - 1, axis=0)[:num_candidates] if num_candidates < len(rows) else np.tile(np.arange(len(rows))[:, None], (1, len(queries)))
+        candidate_ids = [[self.ids[rows[position]] for position in candidates[:, column]] for column in range(len(queries))]
+
+        wanted = list(dict.fromkeys(chroma_id for ids in candidate_ids for chroma_id in ids))
+        stored = collection.get(ids=wanted, include=["embeddings", "documents", "metadatas"])
+        row_of = {chroma_id: row for row, chroma_id in enumerate(stored["ids"])}
+        full = np.asarray(stored["embeddings"], dtype=np.float32)
+        if self.space == "cosine":
+            full = full / np.maximum(np.linalg.norm(full, axis=1, keepdims=True), 1e-12)
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        results = []
+        for column, ids in enumerate(candidate_ids):
+            # Rows deleted from Chroma since the store was built are skipped
+            present = [chroma_id for chroma_id in ids if chroma_id in row_of]
+            stored_rows = [row_of[chroma_id] for chroma_id in present]
+            vectors = full[stored_rows] if stored_rows else np.zeros((0, queries.shape[1]), dtype=np.float32)
+            exact = _distances(vectors, np.linalg.norm(vectors, axis=1), queries[column:column + 1], self.space)[:, 0]
+            order = np.argsort(exact)[:n_results]
+            results.append({
+                "ids": [[present[i] for i in order]],
+                "documents": [[stored["documents"][stored_rows[i]] for i in order]],
+                "metadatas": [[stored["metadatas"][stored_rows[i]] for i in order]],
+                "distances": [[float(exact[i]) for i in order]],
+            })
+        return results
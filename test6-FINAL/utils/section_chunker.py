@@ -0,0 +1,78 @@
+import re
+from typing import List, Tuple
+
+# Canonical section name -> heading keywords, matched case-insensitively against short lines
+SECTION_HEADINGS = {
+    "abstract": ["abstract"],
+    "introduction": ["introduction", "motivation"],
+    "related_work": ["related work", "related works", "background", "literature review", "prior work", "state of the art"],
+    "method": ["method", "methods", "methodology", "approach", "proposed approach", "proposed method", "system design", "system architecture", "architecture", "materials and methods", "implementation"],
+    "results": ["results", "experiments", "experimental results", "experimental setup", "evaluation", "discussion", "results and discussion", "case study"],
+    "conclusion": ["conclusion", "conclusions", "concluding remarks", "conclusion and future work", "conclusions and future work", "future work", "summary", "limitations"],
+    "references": ["references", "bibliography", "literature cited"],
+    "acknowledgements": ["acknowledgements", "acknowledgments", "acknowledgement", "acknowledgment", "funding"],
+    "appendix": ["appendix", "appendices", "supplementary material"],
+}
+
+SECTIONS = ["front_matter"] + list(SECTION_HEADINGS) + ["body"]
+
+# Sections that are not worth embedding by default
+LOW_VALUE_SECTIONS = ("references", "acknowledgements")
+
+_NUMBERING = r"(?:(?:\d+(?:\.\d+)*|[IVXLC]+|[A-H])[.):]?\s+)?"
+_HEADING_PATTERNS = [
+    (section, re.compile(rf"^\s*{_NUMBERING}(?:{'|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))})\s*[:.]?\s*$", re.IGNORECASE))
+    for section, keywords in SECTION_HEADINGS.items()
+]
+MAX_HEADING_LENGTH = 60
+
+
+def detect_heading(line: str):
+    """Return the canonical section name if the line is a section heading, otherwise None"""
+    stripped = line.strip()
+    if not stripped or len(stripped) > MAX_HEADING_LENGTH:
+        return None
+    for section, pattern in _HEADING_PATTERNS:
+        if pattern.match(stripped):
+            return section
+    return None
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """Split a paper into (section, text) parts in document order.
+
+    Text before the first detected heading is 'front_matter'. If no heading is
+    found at all the whole text is returned as a single 'body' section.
+    Abstracts are often inlined ("Abstract—We propose ..."), so an abstract
+    keyword at the start of a line also opens the abstract section.
+    """
+    sections: List[Tuple[str, List[str]]] = [("front_matter", [])]
+    found_heading = False
+
+    for line in text.splitlines():
+        section = detect_heading(line)
+        if section is None and not found_heading and re.match(r"^\s*abstract\s*[-—–:.]", line, re.IGNORECASE):
+            section = "abstract"
+            sections.append((section, [line]))
+            found_heading = True
+            continue
+
+        if section is not None:
+            found_heading = True
+            sections.append((section, []))
+            continue
+        sections[-1][1].append(line)
+
+    if not found_heading:
+        return [("body", text)]
+
+    merged: List[Tuple[str, str]] = []
+    for section, lines in sections:
+        section_text = "\n".join(lines).strip()
+        if not section_text:
+            continue
+        if merged and merged[-1][0] == section:
+            merged[-1] = (section, merged[-1][1] + "\n\n" + section_text)
+        else:
+            merged.append((section, section_text))
+    return merged
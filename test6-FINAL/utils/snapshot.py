@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import shutil
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from utils.hnsw_sweep import collection_configuration
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+
+# Chroma reports these index settings in the configuration, on creation they are passed as hnsw:* metadata
+_CONFIGURATION_KEYS = {
+    "space": "hnsw:space",
+    "ef_construction": "hnsw:construction_ef",
+    "ef_search": "hnsw:search_ef",
+    "max_neighbors": "hnsw:M",
+}
+
+
+class TextColumnWriter:
+    def __init__(self, directory: Path, name: str):
+        self._blob = open(directory / f"{name}.bin", "wb")
+        self._offsets_path = directory / f"{name}.offsets.npy"
+        self._offsets = [0]
+
+    def append(self, value: str):
+        data = value.encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self):
+        self._blob.close()
+        np.save(self._offsets_path, np.asarray(self._offsets, dtype=np.int64))
+
+
+class TextColumn:
+    """Memory-mapped UTF-8 strings stored as one blob plus an offsets array"""
+
+    def __init__(self, directory: Path, name: str):
+        self.offsets = np.load(directory / f"{name}.offsets.npy", mmap_mode="r")
+        size = int(self.offsets[-1])
+        # np.memmap cannot map an empty file
+        self.blob = np.memmap(directory / f"{name}.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.blob[int(self.offsets[row]):int(self.offsets[row + 1])].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+
+class Snapshot:
+    """Read side of an exported collection. Embeddings and texts are memory-mapped,
+    nothing is read from disk until it is accessed."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {self.manifest.get('format')} in {self.path}")
+        count, dimension = self.manifest["count"], self.manifest["dimension"]
+        if count and dimension:
+            self.embeddings = np.memmap(self.path / EMBEDDINGS_FILE, dtype=np.float32, mode="r", shape=(count, dimension))
+        else:
+            self.embeddings = np.zeros((count, dimension), dtype=np.float32)
+        self.ids = TextColumn(self.path, "ids")
+        self.documents = TextColumn(self.path, "documents")
+        self._metadatas = TextColumn(self.path, "metadatas")
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def collection_metadata(self) -> Dict:
+        return self.manifest.get("metadata") or {}
+
+    @property
+    def embedding_model(self) -> Optional[str]:
+        return self.manifest.get("embedding_model")
+
+    def metadatas(self) -> List[Optional[Dict]]:
+        return [json.loads(line) for line in self._metadatas]
+
+    def metadata(self, row: int) -> Optional[Dict]:
+        return json.loads(self._metadatas[row])
+
+
+def open_snapshot(path: str) -> Optional[Snapshot]:
+    """Open a snapshot, None if path holds none or it cannot be read"""
+    try:
+        return Snapshot(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not open snapshot {path}: {e}")
+        return None
+
+
+def export_collection(collection, path: str, embedding_model: Optional[str] = None, batch_size: int = 1000) -> Dict:
+    """Stream ids, documents, metadata and float32 embeddings of a collection into a snapshot directory.
+
+    The snapshot is written next to path and moved into place when complete, an
+    existing snapshot at path is replaced.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    started = time.monotonic()
+    ids = TextColumnWriter(tmp_path, "ids")
+    documents = TextColumnWriter(tmp_path, "documents")
+    metadatas = TextColumnWriter(tmp_path, "metadatas")
+    count = 0
+    dimension = 0
+    try:
+        with open(tmp_path / EMBEDDINGS_FILE, "wb") as embeddings:
+            offset = 0
+            while True:
+                batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+                dimension = vectors.shape[1]
+                embeddings.write(vectors.tobytes())
+                for chroma_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                    ids.append(chroma_id)
+                    documents.append(document or "")
+                    metadatas.append(json.dumps(metadata, ensure_ascii=False))
+                count += len(batch["ids"])
+                offset += len(batch["ids"])
+    finally:
+        for column in (ids, documents, metadatas):
+            column.close()
+
+    metadata = dict(collection.metadata or {})
+    hnsw = collection_configuration(collection).get("hnsw") or {}
+    for key, metadata_key in _CONFIGURATION_KEYS.items():
+        if hnsw.get(key) is not None:
+            metadata.setdefault(metadata_key, hnsw[key])
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "collection": collection.name,
+        "metadata": metadata,
+        "embedding_model": metadata.get("embedding_model") or embedding_model,
+        "count": count,
+        "dimension": dimension,
+        "created_at": time.time(),
+    }
+    with open(tmp_path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+    seconds = time.monotonic() - started
+    size = sum(file.stat().st_size for file in path.iterdir())
+    logger.info(f"Exported {count} records of '{collection.name}' to {path} ({size / 2**20:.1f} MiB) in {seconds:.1f}s")
+    return {"collection": collection.name, "path": str(path), "count": count, "dimension": dimension, "bytes": size, "seconds": seconds}
+
+
+def import_snapshot(manager, snapshot: Snapshot, collection_name: Optional[str] = None, drop: bool = False, batch_size: Optional[int] = None) -> Dict:
+    """Load a snapshot into a collection with its stored embeddings, nothing is re-embedded.
+
+    The collection is created with the exported metadata (HNSW settings, model
+    pin). Records are upserted, so importing into an existing collection is
+    idempotent.
+    """
+    from utils.embedding_registry import EmbeddingMismatchError, mismatch_hint
+
+    collection_name = collection_name or snapshot.manifest["collection"]
+    if snapshot.embedding_model and snapshot.embedding_model != manager.embedding_model:
+        raise EmbeddingMismatchError(f"Snapshot holds '{snapshot.embedding_model}' embeddings, this process embeds queries with '{manager.embedding_model}': {mismatch_hint(snapshot.embedding_model)}")
+
+    started = time.monotonic()
+    if drop and collection_name in manager.list_collections():
+        manager.delete_collection(collection_name)
+    metadata = {key: value for key, value in snapshot.collection_metadata.items() if value is not None}
+    manager.get_collection(collection_name, create=True, metadata=metadata or None)
+
+    batch_size = batch_size or manager.client.get_max_batch_size()
+    total = len(snapshot)
+    for start in range(0, total, batch_size):
+        stop = min(start + batch_size, total)
+        manager.upsert_documents(
+            collection_name,
+            documents=[snapshot.documents[row] for row in range(start, stop)],
+            metadatas=[snapshot.metadata(row) for row in range(start, stop)],
+            ids=[snapshot.ids[row] for row in range(start, stop)],
+            embeddings=np.asarray(snapshot.embeddings[start:stop])
+        )
+
+    seconds = time.monotonic() - started
+    logger.info(f"Imported {total} records from {snapshot.path} into '{collection_name}' in {seconds:.1f}s")
+    return {"collection": collection_name, "path": str(snapshot.path), "count": total, "seconds": seconds}
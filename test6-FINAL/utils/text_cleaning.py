@@ -0,0 +1,123 @@
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+from utils.section_chunker import detect_heading
+
+# extract_pdf_text joins pages with this separator so per-page boilerplate can be found
+PAGE_SEPARATOR = "\f"
+
+EDGE_LINES = 3
+MIN_REPEATED_PAGES = 3
+MAX_AUDIT_SAMPLES = 50
+# A run summary keeps the samples of this many papers only, the counts cover all papers
+MAX_SAMPLED_PAPERS = 20
+MAX_SAMPLES_PER_PAPER = 10
+
+_PAGE_NUMBER = re.compile(r"^\s*(?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+_ARXIV_STAMP = re.compile(r"^\s*arXiv:\s*\d{4}\.\d{4,5}(?:v\d+)?\b.{0,60}$", re.IGNORECASE)
+_LICENSE = re.compile(
+    r"(licensed under|creative commons|\bcc[ -]by\b|all rights reserved|©|\(c\)\s*\d{4}|copyright\s+\d{4}|"
+    r"permission to make digital or hard copies|this work is licensed|open access article)",
+    re.IGNORECASE
+)
+MAX_LICENSE_LINE_LENGTH = 250
+
+
+_COUNTS = ("original_chars", "removed_chars", "repeated_lines", "page_numbers", "arxiv_stamps", "license_lines", "reference_lines")
+
+
+def _normalize(line: str) -> str:
+    # Running headers differ only by page number, so digits are masked before counting
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line.strip().lower()))
+
+
+def _edge_indices(lines: List[str]) -> List[int]:
+    non_empty = [idx for idx, line in enumerate(lines) if line.strip()]
+    return sorted(set(non_empty[:EDGE_LINES] + non_empty[-EDGE_LINES:]))
+
+
+def clean_paper_text(text: str) -> Tuple[str, Dict]:
+    """Remove per-page boilerplate and the bibliography from extracted paper text.
+
+    Pages are expected to be separated by PAGE_SEPARATOR. Lines at the top or
+    bottom of a page that repeat on several pages (running headers and footers),
+    page numbers, arXiv stamps, license footers and the references section are
+    dropped. Returns the cleaned text and a report of what was removed.
+    """
+    pages = [page.splitlines() for page in text.split(PAGE_SEPARATOR)]
+    report = {key: 0 for key in _COUNTS}
+    report["original_chars"] = len(text)
+    report["samples"] = []
+    samples = Counter()
+
+    repeated = set()
+    if len(pages) >= MIN_REPEATED_PAGES:
+        page_counts = Counter()
+        for lines in pages:
+            page_counts.update({_normalize(lines[idx]) for idx in _edge_indices(lines)})
+        threshold = max(MIN_REPEATED_PAGES, len(pages) // 2)
+        repeated = {line for line, count in page_counts.items() if count >= threshold and line}
+
+    cleaned_pages = []
+    for lines in pages:
+        edges = set(_edge_indices(lines))
+        kept = []
+        for idx, line in enumerate(lines):
+            reason = None
+            if idx in edges and _normalize(line) in repeated:
+                reason = "repeated_lines"
+            elif idx in edges and _PAGE_NUMBER.match(line):
+                reason = "page_numbers"
+            elif _ARXIV_STAMP.match(line):
+                reason = "arxiv_stamps"
+            elif len(line) <= MAX_LICENSE_LINE_LENGTH and _LICENSE.search(line) and (idx in edges or not kept):
+                reason = "license_lines"
+
+            if reason:
+                report[reason] += 1
+                samples[f"{reason}: {line.strip()[:120]}"] += 1
+            else:
+                kept.append(line)
+        cleaned_pages.append("\n".join(kept))
+
+    lines = "\n\n".join(cleaned_pages).splitlines()
+    kept = []
+    in_references = False
+    for line in lines:
+        heading = detect_heading(line)
+        if heading is not None:
+            in_references = heading == "references"
+        if in_references:
+            report["reference_lines"] += 1
+            continue
+        kept.append(line)
+
+    if report["reference_lines"]:
+        samples[f"reference_lines: {report['reference_lines']} lines of the references section"] += 1
+
+    cleaned = "\n".join(kept).strip()
+    report["removed_chars"] = len(text) - len(cleaned)
+    report["samples"] = [sample for sample, _ in samples.most_common(MAX_AUDIT_SAMPLES)]
+    return cleaned, report
+
+
+def new_cleaning_summary() -> Dict:
+    """Empty run summary for add_cleaning_report."""
+    summary = {"papers": 0}
+    summary.update({key: 0 for key in _COUNTS})
+    summary["samples"] = {}
+    return summary
+
+
+def add_cleaning_report(summary: Dict, base_id: str, report: Dict) -> None:
+    """Add the counts of one paper's report to a run summary.
+
+    Samples are kept for the first MAX_SAMPLED_PAPERS papers that had anything
+    removed, at most MAX_SAMPLES_PER_PAPER each, so the summary stays small
+    however many papers a run ingests.
+    """
+    summary["papers"] += 1
+    for key in _COUNTS:
+        summary[key] += report[key]
+    if report["samples"] and len(summary["samples"]) < MAX_SAMPLED_PAPERS:
+        summary["samples"][base_id] = report["samples"][:MAX_SAMPLES_PER_PAPER]
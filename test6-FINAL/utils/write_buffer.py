@@ -0,0 +1,213 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+from chromadb.errors import DuplicateIDError, InvalidArgumentError, InvalidDimensionException
+from utils.embedding_registry import EmbeddingMismatchError
+
+logger = logging.getLogger(__name__)
+
+# Errors a single bad record can cause (metadata types, ids, documents, embedding dimension)
+RECORD_ERRORS = (ValueError, TypeError, DuplicateIDError, InvalidArgumentError, InvalidDimensionException)
+
+
+class WriteBehindError(RuntimeError):
+    """Raised to the producer when a background flush failed, failed_ids lists the records that were not written"""
+
+    def __init__(self, message: str, failed_ids: List[str]):
+        super().__init__(message)
+        self.failed_ids = failed_ids
+
+
+class WriteBehindBuffer:
+    """Collects inserts for one collection and writes them from a background thread.
+
+    add() only queues the records. A flush starts once batch_size records are
+    waiting or the oldest one has waited max_delay seconds, and sends up to
+    batch_size records through one upsert_documents/add_documents call. Within a
+    batch the last record per id wins. add() blocks while max_pending records are
+    queued, so a fast producer cannot outrun the store. A batch that failed on a
+    record error is split and retried until the failing records are isolated,
+    other errors (client, collection, embedding pin) fail the batch once. Errors
+    are raised from the next add(), flush() or close(), the records are kept in failed.
+
+    Meant for callers that write many small batches, e.g. scripts that add one
+    record at a time. IngestionPipeline does not use it: its upsert stage already
+    runs on its own thread and writes each paper in one call, it deletes a
+    paper's previous chunks right before writing the new ones, near-duplicates
+    are only dropped when their target is stored, and each paper is reported as
+    upserted or failed once its write returned. Deferring the write would leave
+    rewritten papers missing from search and report failures after the fact.
+    """
+
+    def __init__(self, manager, collection_name: str, batch_size: Optional[int] = None, max_delay: float = 2.0, max_pending: int = 10000, mode: str = "upsert"):
+        if mode not in ("add", "upsert"):
+            raise ValueError(f"Unknown mode '{mode}', use 'add' or 'upsert'")
+        self.manager = manager
+        self.collection_name = collection_name
+        if batch_size is None:
+            # Enough texts to keep every concurrent embedding request busy
+            executor = manager.embedding_executor
+            batch_size = max(64, executor.batch_size * executor.max_concurrency)
+            if manager.client is not None:
+                batch_size = min(batch_size, manager.client.get_max_batch_size())
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.max_pending = max(self.batch_size, max_pending)
+        self.mode = mode
+
+        self.failed: List[Dict] = []
+        self.counters = {"queued": 0, "written": 0, "flushes": 0, "failed": 0}
+        self._pending: List[Dict] = []
+        self._oldest = None
+        self._in_flight = 0
+        self._flush_requested = False
+        self._errors: List[WriteBehindError] = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{collection_name}", daemon=True)
+        self._thread.start()
+
+    def add(self, documents: Sequence[str], metadatas: Sequence[Dict], ids: Sequence[str], embeddings: Optional[Sequence[Sequence[float]]] = None):
+        if not (len(documents) == len(metadatas) == len(ids)) or (embeddings is not None and len(embeddings) != len(ids)):
+            raise ValueError("documents, metadatas, ids and embeddings must have the same length")
+
+        with self._condition:
+            self._raise_errors()
+            if self._closed:
+                raise RuntimeError(f"Write-behind buffer for '{self.collection_name}' is closed")
+            for position, chunk_id in enumerate(ids):
+                while len(self._pending) >= self.max_pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    raise RuntimeError(f"Write-behind buffer for '{self.collection_name}' was closed while waiting, {len(ids) - position} records not queued")
+                self._pending.append({
+                    "id": chunk_id,
+                    "document": documents[position],
+                    "metadata": metadatas[position],
+                    "embedding": embeddings[position] if embeddings is not None else None,
+                    "queued_at": time.monotonic(),
+                })
+                if self._oldest is None:
+                    self._oldest = self._pending[0]["queued_at"]
+                self.counters["queued"] += 1
+            self._condition.notify_all()
+
+    def _take_batch(self) -> List[Dict]:
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        # Leftovers keep their own age, so none waits longer than max_delay
+        self._oldest = self._pending[0]["queued_at"] if self._pending else None
+        self._in_flight += len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._pending and (len(self._pending) >= self.batch_size or self._flush_requested or self._closed
+                                          or time.monotonic() - self._oldest >= self.max_delay):
+                        break
+                    if self._closed and not self._pending:
+                        return
+                    timeout = None if not self._pending else max(0.0, self.max_delay - (time.monotonic() - self._oldest))
+                    self._condition.wait(timeout)
+                batch = self._take_batch()
+                self._condition.notify_all()
+
+            self._write(batch)
+
+            with self._condition:
+                self._in_flight -= len(batch)
+                if not self._pending:
+                    self._flush_requested = False
+                self._condition.notify_all()
+
+    def _write(self, batch: List[Dict]):
+        # Last write per id wins, Chroma rejects duplicate ids within one call
+        latest = {record["id"]: record for record in batch}
+        self._write_records(list(latest.values()))
+
+    def _write_records(self, records: List[Dict]):
+        embeddings = None
+        if all(record["embedding"] is not None for record in records):
+            embeddings = [record["embedding"] for record in records]
+        write = self.manager.upsert_documents if self.mode == "upsert" else self.manager.add_documents
+
+        try:
+            write(
+                self.collection_name,
+                documents=[record["document"] for record in records],
+                metadatas=[record["metadata"] for record in records],
+                ids=[record["id"] for record in records],
+                embeddings=embeddings
+            )
+            with self._condition:
+                self.counters["written"] += len(records)
+                self.counters["flushes"] += 1
+        except Exception as e:
+            if len(records) > 1 and self._is_record_error(e):
+                # Split so one bad record does not take the rest of the batch with it
+                middle = len(records) // 2
+                logger.warning(f"Write-behind flush of {len(records)} records to '{self.collection_name}' failed ({e}), retrying as two halves")
+                self._write_records(records[:middle])
+                self._write_records(records[middle:])
+                return
+            what = f"'{records[0]['id']}'" if len(records) == 1 else f"{len(records)} records"
+            logger.error(f"Write-behind write of {what} to '{self.collection_name}' failed: {e}")
+            with self._condition:
+                self.failed.extend(records)
+                self.counters["failed"] += len(records)
+                self._errors.append(WriteBehindError(f"Writing {what} to '{self.collection_name}' failed: {e}", [record["id"] for record in records]))
+
+    def _is_record_error(self, error: Exception) -> bool:
+        """Whether error may come from one record, only then splitting the batch can save the rest"""
+        if isinstance(error, EmbeddingMismatchError) or not isinstance(error, RECORD_ERRORS):
+            return False
+        # Invalid collection names raise the same errors as invalid records
+        try:
+            self.manager.get_collection(self.collection_name, create=True)
+        except Exception:
+            return False
+        return True
+
+    def _raise_errors(self):
+        if self._errors:
+            errors, self._errors = self._errors, []
+            if len(errors) == 1:
+                raise errors[0]
+            raise WriteBehindError(f"{len(errors)} flushes to '{self.collection_name}' failed, first: {errors[0]}",
+                                   [chunk_id for error in errors for chunk_id in error.failed_ids])
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until every record queued so far is written, then raise any flush error"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                if not self._thread.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Flushing '{self.collection_name}' did not finish within {timeout}s, {len(self._pending) + self._in_flight} records left")
+                self._condition.wait(remaining)
+            self._raise_errors()
+
+    def close(self, timeout: Optional[float] = None):
+        """Write the remaining records and stop the background thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        with self._condition:
+            self._raise_errors()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {**self.counters, "pending": len(self._pending), "in_flight": self._in_flight, "batch_size": self.batch_size}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()